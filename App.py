@@ -1,1607 +1,306 @@
-import streamlit as st
-import pandas as pd
-import base64
-import xlsxwriter
-
-#version currently running 7/19/24
-
-#define instruments and column names
-instrument_columns = {
-    'Density Meter (Duplicate Analysis)': ['Sample ID', 'Density (g/mL)', 'Temperature (°C)'],
-    'Density Meter (Singlet Analysis)': ['Sample ID', 'Density (g/mL)', 'Temperature (°C)'],
-    'LECO CHN (Bio-Oil Method, Triplicate Analysis)': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)'],
-    'LECO CHN (Bio-Oil Method, Duplicate Analysis)': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)'],
-    'LECO CHN (Aqueous Method)': ['Sample ID', 'Mass (g)', 'C%'],
-    'Karl Fischer': ['Sample ID','~Vol(μL)', 'Mass(g)', 'Titrant(mL)', 'H2O%'],
-    'KF & LECO CHN Combined': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)', 'Water', 'C% Dry Basis', 'H% Dry Basis', 'O% Dry Basis'],
-    'Viscometer': ['Sample ID', 'Viscosity (cP)','Torque (%)','Speed (rpm)', 'Temperature (°C)'],
-    'Acids Titration': ['Sample ID', 'CAN mol/kg', 'TAN mol/kg', 'PhAN mol/kg', 'Carboxylic Acid Number mg KOH/g','Total Acid Number mg KOH/g', 'Phenolic Acid Number mg KOH/g'],
-    'Carbonyls Titration': ['Sample ID', 'Carbonyls mol/kg']
-}
-
-
-def generate_excel_file(instrument, num_request):
-    columns = instrument_columns[instrument]
-    df = pd.DataFrame(columns=columns)
-    
-    filename = f'{instrument}_data_template.xlsx'
-    writer = pd.ExcelWriter(filename, engine='xlsxwriter')
-    
-    #write DataFrame to default sheet
-    df.to_excel(writer, index=False, sheet_name=('Analysis'), engine='xlsxwriter')
-    worksheet = writer.sheets['Analysis']
-     
-    #get workbook from the writer
-    workbook = writer.book
-    
-    #define a format for bold, borders, and green conditional format
-    bold_format = writer.book.add_format({'bold': True})
-    bottomborder_format = workbook.add_format({'bottom':2, 'border_color':'black'})
-    rightborder_format = workbook.add_format({'right':2, 'border_color':'black'})
-    headerborder_format = workbook.add_format({'border':2, 'border_color':'black'})
-    cornerborder_format = workbook.add_format({'right':2, 'bottom':2, 'border_color':'black'})                                   
-    dashedborder_format = workbook.add_format({'border_color': 'black'})
-    dashedborder_format.set_bottom(6)
-    sideborder_format = workbook.add_format({'right':2,'border_color':'black'})
-    sideborder_format.set_bottom(6)
-    green_format = workbook.add_format({'bg_color':   '#C6EFCE',
-                               'font_color': '#006100'})
-    red_format = workbook.add_format({'bg_color':   '#FFC7CE',
-                               'font_color': '#9C0006'})
-    
-#start creating different excel files for each instrument option
-    if instrument == "LECO CHN (Bio-Oil Method, Triplicate Analysis)":
-        CHN_data = []
-        CHN_template = [
-            ['Sample 1','','','','', '=100-SUM(C2:E2)'],
-            ['Sample 1','','','','', '=100-SUM(C3:E3)'],
-            ['Sample 1','','','','', '=100-SUM(C4:E4)'], 
-            ['', 'Average', '=AVERAGE(C2:C4)','=AVERAGE(D2:D4)','=AVERAGE(E2:E4)','=AVERAGE(F2:F4)'],
-            ['', 'StDev', '=STDEV(C2:C4)','=STDEV(D2:D4)','=STDEV(E2:E4)','=STDEV(F2:F4)'],
-            ['', 'RSD', '=C6/C5*100','=D6/D5*100','=E6/E5*100','=F6/F5*100'],
-        ]
-        average_row = 3  #row number for Mean%
-        stdev_row = 4    #row number for StDev%
-        rsd_row = 5      #row number for RSD%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        sample_row3 = 2
-
-        #replicate CHN_calc based on the number of samples
-        for sample_num in range(1, num_request + 1):
-            #create a copy of the sample template for this sample
-            CHN_calc = [row[:] for row in CHN_template]
-
-            #calculate the start row for this sample
-            start_row = (sample_num - 1) * 8 + 1
-
-            #update the stat formulas (average)
-            CHN_calc[average_row][2] = f'=AVERAGE(C{start_row + 1}:C{start_row + 3})'
-            CHN_calc[average_row][3] = f'=AVERAGE(D{start_row + 1}:D{start_row + 3})'
-            CHN_calc[average_row][4] = f'=AVERAGE(E{start_row + 1}:E{start_row + 3})'
-            CHN_calc[average_row][5] = f'=AVERAGE(F{start_row + 1}:F{start_row + 3})'
-            #update the stat formulas (stdev)
-            CHN_calc[stdev_row][2] = f'=STDEV(C{start_row + 1}:C{start_row + 3})'
-            CHN_calc[stdev_row][3] = f'=STDEV(D{start_row + 1}:D{start_row + 3})'
-            CHN_calc[stdev_row][4] = f'=STDEV(E{start_row + 1}:E{start_row + 3})'
-            CHN_calc[stdev_row][5] = f'=STDEV(F{start_row + 1}:F{start_row + 3})'
-            #update the stat formulas (RSD)
-            CHN_calc[rsd_row][2] = f'=(C{start_row + 5})/(C{start_row + 4}) * 100'
-            CHN_calc[rsd_row][3] = f'=(D{start_row + 5})/(D{start_row + 4}) * 100'
-            CHN_calc[rsd_row][4] = f'=(E{start_row + 5})/(E{start_row + 4}) * 100'
-            CHN_calc[rsd_row][5] = f'=(F{start_row + 5})/(F{start_row + 4}) * 100'
-            #make changes to oxygen calculations
-            CHN_calc[sample_row1][-1] = f'=100-SUM(C{start_row + 1}:E{start_row + 1})'
-            CHN_calc[sample_row2][-1] = f'=100-SUM(C{start_row + 2}:E{start_row + 2})'
-            CHN_calc[sample_row3][-1] = f'=100-SUM(C{start_row + 3}:E{start_row + 3})'
-            #add the sample label row
-            CHN_calc[sample_row1][0] = f'Sample {sample_num}'
-            CHN_calc[sample_row2][0] = f'Sample {sample_num}'
-            CHN_calc[sample_row3][0] = f'Sample {sample_num}'
-            #append the sample's data to CHN_data
-            CHN_data.extend(CHN_calc)
-
-            #add an empty row between sample templates, but not after the last sample
-            if sample_num < num_request:
-                CHN_data.extend([[''] * len(CHN_template[0]), columns])
-
-        #apply all borders, conditional formatting, and create the Excel file
-
-                
-            #apply all borders to top row
-            worksheet.conditional_format(f'A{start_row}:F{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:F{start_row}', {'type': 'blanks', 'format': headerborder_format})
-
-            #apply bottom borders 
-            worksheet.conditional_format(f'A{start_row + 6}:E{start_row + 6}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 6}:E{start_row + 6}', {'type': 'blanks', 'format': bottomborder_format})
-
-            #apply dashed bottom borders
-            worksheet.conditional_format(f'A{start_row + 3}:E{start_row + 3}', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format(f'A{start_row + 3}:E{start_row + 3}', {'type': 'blanks', 'format': dashedborder_format})
-
-            #apply right borders
-            worksheet.conditional_format(f'F{start_row + 1}:F{start_row + 2}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'F{start_row + 1}:F{start_row + 2}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right borders
-            worksheet.conditional_format(f'F{start_row + 4}:F{start_row + 5}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'F{start_row + 4}:F{start_row + 5}', {'type': 'blanks', 'format': rightborder_format})
-
-            #apply right and dashed bottom border
-            worksheet.conditional_format(f'F{start_row + 3}', {'type': 'blanks', 'format': sideborder_format})
-            worksheet.conditional_format(f'F{start_row + 3}', {'type': 'no_blanks', 'format': sideborder_format})
-
-            #apply corner border
-            worksheet.conditional_format(f'F{start_row + 6}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'F{start_row + 6}', {'type': 'blanks', 'format': cornerborder_format})
-            
-            #convert CHN_data into a DataFrame for each sample
-            df = pd.DataFrame(CHN_data, columns=columns)
-            
-            #apply conditional format to this sample
-            worksheet = writer.sheets['Analysis']
-                
-            #write the DataFrame to default sheet
-            df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        
-        
-        #create additional standard check sheet and write additional data
-            extra_sheetCHN = {
-                'Data': ['Additional Data 1', 'Additional Data 2', 'Additional Data 3']
-                }
-            additional_df = pd.DataFrame(extra_sheetCHN)
-            additional_df.to_excel(writer, index=False, sheet_name='Cresol Testing', startrow=1, startcol=0)
-        #get the worksheet for the Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-        
-        #set the file to open the column width to the length of "string"
-            Cresolcolumnwidth = len("Cresol Triplicate ")
-            worksheet.set_column(0, 1, Cresolcolumnwidth)
-        
-        #set the file to open the column width to the length of a "string"
-            Cresolcolumnwidth = len("Cresol Measured")
-            worksheet.set_column(1, 1, Cresolcolumnwidth)
-                  
-        
-        #set conditional formatting for Cresol values in range green/red for in/out of range
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   green_format})
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   red_format})
-        
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   green_format})
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   red_format})
-        
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   green_format})
-        
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   red_format})
-
-         #write new column headers in Cresol Testing sheet
-            headers = ['Cresol Limit Testing', 'Cresol Measured', 'Average', 'Low-value', 'High-value']
-            for i, header in enumerate(headers):
-                     worksheet.write(0, i, header, bold_format)
-             
-        #write new row headers in Cresol Testing sheet
-            row_headers = ['Carbon', 'Hydrogen', 'Nitrogen', 'Oxygen']
-            for i, header in enumerate(row_headers):
-                worksheet.write(i+1, 0, header, bold_format)
-                 
-
-       #write Cresol Limits below the columns
-                cresol_limits = [
-                     ['','=C11', 77.7, 77.0, 78.3], 
-                     ['','=D11', 7.5, 7.4, 7.9],
-                     ['','=E11', 0.03, 0.0, 0.1],
-                     ['','=F11', 14.8, 14.0, 15.4]
-                     ]
-                for row_num, row_data in enumerate(cresol_limits):
-                    for col_num, cell_data in enumerate(row_data):
-                         worksheet.write(row_num + 1, col_num + 0, cell_data)      
-        #write a table to put the three cresol values from the CHN data
-            cresol_triplicate = [
-                ['Cresol Triplicate Check', 'Mass (g)', 'C%', 'H%', 'N%', 'O% (diff)'],
-                ['Cresol 1','','','','', '=100-SUM(C8:E8)'],
-                ['Cresol 2','','','','', '=100-SUM(C9:E9)'],
-                ['Cresol 3','','','','', '=100-SUM(C10:E10)'], 
-                ['', 'Average', '=AVERAGE(C8:C10)','=AVERAGE(D8:D10)','=AVERAGE(E8:E10)','=AVERAGE(F8:F10)'],
-                ['', 'StDev', '=STDEV(C8:C10)','=STDEV(D8:D10)','=STDEV(E8:E10)','=STDEV(F8:F10)'],
-                ['', 'RSD', '=C12/C11*100','=D12/D11*100','=E12/E11*100','=F12/F11*100'],
-                ]
-            for row_num, row_data in enumerate(cresol_triplicate):
-                for col_num, cell_data in enumerate(row_data):
-                      worksheet.write(row_num + 6, col_num + 0, cell_data)
-        
-        #write borders for the cresol triplicate data
-        
-        #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format('A7:F7', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format('A7:F7', {'type': 'blanks', 'format': headerborder_format})
-        
-        #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A13:E13', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format('A13:E13', {'type': 'blanks', 'format': bottomborder_format})
-        
-        #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A10:E10', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format('A10:E10', {'type': 'blanks', 'format': dashedborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F8:F9', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F8:F9', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F11:F12', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F11:F12', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right and dashed bottom border given it is not blank
-            worksheet.conditional_format('F10', {'type': 'no_blanks', 'format': sideborder_format})
-        
-        #apply corner bordergiven it is not blank
-            worksheet.conditional_format('F13', {'type': 'no_blanks', 'format': cornerborder_format})
-           
-        #get the worksheet for the Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-            worksheet = writer.sheets['Analysis']
-            
-    elif instrument == "LECO CHN (Bio-Oil Method, Duplicate Analysis)":
-        CHN_data = []
-        CHN_template = [
-            ['Sample 1','','','','', '=100-SUM(C2:E2)'],
-            ['Sample 1','','','','', '=100-SUM(C3:E3)'], 
-            ['', 'Average', '=AVERAGE(C2:C3)','=AVERAGE(D2:D3)','=AVERAGE(E2:E3)','=AVERAGE(F2:F3)'],
-            ['', 'StDev', '=STDEV(C2:C3)','=STDEV(D2:D3)','=STDEV(E2:E3)','=STDEV(F2:F3)'],
-            ['', 'RSD', '=C5/C4*100','=D5/D4*100','=E5/E4*100','=F5/F4*100'],
-        ]
-        average_row = 2  #row number for Mean%
-        stdev_row = 3    #row number for StDev%
-        rsd_row = 4      #row number for RSD%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-
-        #replicate CHN_data based on the number of samples
-        for sample_num in range(1, num_request + 1):
-            #create a copy of the sample template for this sample
-            CHN_calc = [row[:] for row in CHN_template]
-
-            #calculate start row for this sample
-            start_row = (sample_num - 1) * 7 + 1 
-
-            #update the stat formulas (average)
-            CHN_calc[average_row][2] = f'=AVERAGE(C{start_row + 1}:C{start_row + 2})' 
-            CHN_calc[average_row][3] = f'=AVERAGE(D{start_row + 1}:D{start_row + 2})'
-            CHN_calc[average_row][4] = f'=AVERAGE(E{start_row + 1}:E{start_row + 2})'
-            CHN_calc[average_row][5] = f'=AVERAGE(F{start_row + 1}:F{start_row + 2})'
-            #update the stat formulas (stdev)
-            CHN_calc[stdev_row][2] = f'=STDEV(C{start_row + 1}:C{start_row + 2})'
-            CHN_calc[stdev_row][3] = f'=STDEV(D{start_row + 1}:D{start_row + 2})'
-            CHN_calc[stdev_row][4] = f'=STDEV(E{start_row + 1}:E{start_row + 2})'
-            CHN_calc[stdev_row][5] = f'=STDEV(F{start_row + 1}:F{start_row + 2})'
-            #update the stat formulas (RSD)
-            CHN_calc[rsd_row][2] = f'=(C{start_row + 4})/(C{start_row + 3}) * 100' 
-            CHN_calc[rsd_row][3] = f'=(D{start_row + 4})/(D{start_row + 3}) * 100'
-            CHN_calc[rsd_row][4] = f'=(E{start_row + 4})/(E{start_row + 3}) * 100'
-            CHN_calc[rsd_row][5] = f'=(F{start_row + 4})/(F{start_row + 3}) * 100'
-            #make changes to the oxygen calculations
-            CHN_calc[sample_row1][-1] = f'=100-SUM(C{start_row + 1}:E{start_row + 1})' 
-            CHN_calc[sample_row2][-1] = f'=100-SUM(C{start_row + 2}:E{start_row + 2})'
-            #add the sample label row
-            CHN_calc[sample_row1][0] = f'Sample {sample_num}'
-            CHN_calc[sample_row2][0] = f'Sample {sample_num}'
-            #append the sample's data to CHN_data
-            CHN_data.extend(CHN_calc)
-
-            #add an empty row between sample templates, but not after the last sample
-            if sample_num < num_request:
-                CHN_data.extend([[''] * len(CHN_template[0]), columns])
-
-        #apply all borders, conditional formatting, and create the Excel file
-
-                
-            #apply all borders to top row
-            worksheet.conditional_format(f'A{start_row}:F{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:F{start_row}', {'type': 'blanks', 'format': headerborder_format})
-
-            #apply bottom borders
-            worksheet.conditional_format(f'A{start_row + 5}:E{start_row + 5}', {'type': 'no_blanks', 'format': bottomborder_format}) 
-            worksheet.conditional_format(f'A{start_row + 5}:E{start_row + 5}', {'type': 'blanks', 'format': bottomborder_format})
-
-            #apply dashed bottom borders
-            worksheet.conditional_format(f'A{start_row + 2}:E{start_row + 2}', {'type': 'no_blanks', 'format': dashedborder_format}) 
-            worksheet.conditional_format(f'A{start_row + 2}:E{start_row + 2}', {'type': 'blanks', 'format': dashedborder_format})
-
-            #apply right borders
-            worksheet.conditional_format(f'F{start_row}:F{start_row + 1}', {'type': 'no_blanks', 'format': rightborder_format}) 
-            worksheet.conditional_format(f'F{start_row}:F{start_row + 1}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right borders
-            worksheet.conditional_format(f'F{start_row + 3}:F{start_row + 4}', {'type': 'no_blanks', 'format': rightborder_format}) 
-            worksheet.conditional_format(f'F{start_row + 3}:F{start_row + 4}', {'type': 'blanks', 'format': rightborder_format})
-
-            #apply right and dashed bottom border
-            worksheet.conditional_format(f'F{start_row + 2}', {'type': 'blanks', 'format': sideborder_format}) 
-            worksheet.conditional_format(f'F{start_row + 2}', {'type': 'no_blanks', 'format': sideborder_format})
-
-            #apply corner border
-            worksheet.conditional_format(f'F{start_row + 5}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'F{start_row + 5}', {'type': 'blanks', 'format': cornerborder_format})
-            
-            #convert CHN_data into a DataFrame for each sample
-            df = pd.DataFrame(CHN_data, columns=columns)
-            
-            #apply conditional formatting to this sample
-            worksheet = writer.sheets['Analysis']
-                
-            #write the DataFrame to default sheet
-            df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        
-        
-        #create an additional sheet for check standard and write additional data
-            extra_sheetCHN = {
-                'Data': ['Additional Data 1', 'Additional Data 2', 'Additional Data 3']
-                }
-            additional_df = pd.DataFrame(extra_sheetCHN)
-            additional_df.to_excel(writer, index=False, sheet_name='Cresol Testing', startrow=1, startcol=0)
-        #get the worksheet for the Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-        
-        #set the file to open the column width to the length of a "string"
-            Cresolcolumnwidth = len("Cresol Triplicate ")
-            worksheet.set_column(0, 1, Cresolcolumnwidth)
-        
-        #set the file to open the column width to the length of a "string"
-            Cresolcolumnwidth = len("Cresol Measured")
-            worksheet.set_column(1, 1, Cresolcolumnwidth)
-                  
-        
-        #set conditional formatting for Cresol values in range green/red for in/out of range
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   green_format})
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   red_format})
-        
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   green_format})
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   red_format})
-        
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   green_format})
-        
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   red_format})
-
-         #write new column headers in Cresol Testing sheet
-            headers = ['Cresol Limit Testing', 'Cresol Measured', 'Average', 'Low-value', 'High-value']
-            for i, header in enumerate(headers):
-                     worksheet.write(0, i, header, bold_format)
-             
-        #write new row headers in Cresol Testing sheet
-            row_headers = ['Carbon', 'Hydrogen', 'Nitrogen', 'Oxygen']
-            for i, header in enumerate(row_headers):
-                worksheet.write(i+1, 0, header, bold_format)
-                 
-
-       #write Cresol Limits below the columns
-                cresol_limits = [
-                     ['','=C11', 77.7, 77.0, 78.3], 
-                     ['','=D11', 7.5, 7.4, 7.9],
-                     ['','=E11', 0.03, 0.0, 0.1],
-                     ['','=F11', 14.8, 14.0, 15.4]
-                     ]
-                for row_num, row_data in enumerate(cresol_limits):
-                    for col_num, cell_data in enumerate(row_data):
-                         worksheet.write(row_num + 1, col_num + 0, cell_data)      
-        #write a table to put the three cresol values from the CHN data
-            cresol_triplicate = [
-                ['Cresol Triplicate Check', 'Mass (g)', 'C%', 'H%', 'N%', 'O% (diff)'],
-                ['Cresol 1','','','','', '=100-SUM(C8:E8)'],
-                ['Cresol 2','','','','', '=100-SUM(C9:E9)'],
-                ['Cresol 3','','','','', '=100-SUM(C10:E10)'], 
-                ['', 'Average', '=AVERAGE(C8:C10)','=AVERAGE(D8:D10)','=AVERAGE(E8:E10)','=AVERAGE(F8:F10)'],
-                ['', 'StDev', '=STDEV(C8:C10)','=STDEV(D8:D10)','=STDEV(E8:E10)','=STDEV(F8:F10)'],
-                ['', 'RSD', '=C12/C11*100','=D12/D11*100','=E12/E11*100','=F12/F11*100'],
-                ]
-            for row_num, row_data in enumerate(cresol_triplicate):
-                for col_num, cell_data in enumerate(row_data):
-                      worksheet.write(row_num + 6, col_num + 0, cell_data)
-        
-        #write borders for the cresol triplicate data
-        
-        #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format('A7:F7', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format('A7:F7', {'type': 'blanks', 'format': headerborder_format})
-        
-        #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A13:E13', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format('A13:E13', {'type': 'blanks', 'format': bottomborder_format})
-        
-        #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A10:E10', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format('A10:E10', {'type': 'blanks', 'format': dashedborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F8:F9', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F8:F9', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F11:F12', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F11:F12', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right and dashed bottom border given it is not blank
-            worksheet.conditional_format('F10', {'type': 'no_blanks', 'format': sideborder_format})
-        
-        #apply corner border given it is not blank
-            worksheet.conditional_format('F13', {'type': 'no_blanks', 'format': cornerborder_format})
-           
-        #get the worksheet for the Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-            worksheet = writer.sheets['Analysis']
-            
-    elif instrument == "LECO CHN (Aqueous Method)":
-        CHN_dataAQ = []
-        CHN_templateAQ = [
-            ['Sample 1','', ''],
-            ['Sample 1','', ''],
-            ['Sample 1','', ''], 
-            ['','Average', '=AVERAGE(C2:C4)'],
-            ['','StDev', '=STDEV(C2:C4)'],
-            ['','RSD', '=C6/C5*100'],
-        ]
-        average_row = 3  #row number for Mean%
-        stdev_row = 4    #row number for StDev%
-        rsd_row = 5      #row number for RSD%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        sample_row3 = 2
-
-        #replicate CHN_calc based on the number of samples
-        for sample_num in range(1, num_request + 1):
-            #create a copy of the sample template for this sample
-            CHN_calcAQ = [row[:] for row in CHN_templateAQ]
-
-            #calculate the start row for this sample
-            start_row = (sample_num - 1) * 8 + 1
-
-            #update the stat formulas (average)
-            CHN_calcAQ[average_row][2] = f'=AVERAGE(C{start_row + 1}:C{start_row + 3})'
-            
-            #update the stat formulas (stdev)
-            CHN_calcAQ[stdev_row][2] = f'=STDEV(C{start_row + 1}:C{start_row + 3})'
-
-            #update the stat formulas (RSD)
-            CHN_calcAQ[rsd_row][2] = f'=(C{start_row + 5})/(C{start_row + 4}) * 100'
-
-            #add the sample label row
-            CHN_calcAQ[sample_row1][0] = f'Sample {sample_num}'
-            CHN_calcAQ[sample_row2][0] = f'Sample {sample_num}'
-            CHN_calcAQ[sample_row3][0] = f'Sample {sample_num}'
-            #append the sample's data to chn_dataAQ
-            CHN_dataAQ.extend(CHN_calcAQ)
-
-            #add an empty row between sample templates but not after the last sample
-            if sample_num < num_request:
-                CHN_dataAQ.extend([[''] * len(CHN_templateAQ[0]), columns])
-
-        #apply all borders, conditional formatting, and create the Excel file
-
-                
-            #apply all borders to top row
-            worksheet.conditional_format(f'A{start_row}:C{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:C{start_row}', {'type': 'blanks', 'format': headerborder_format})
-
-            #apply bottom borders
-            worksheet.conditional_format(f'A{start_row + 6}:B{start_row + 6}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 6}:B{start_row + 6}', {'type': 'blanks', 'format': bottomborder_format})
-
-            #apply dashed bottom borders
-            worksheet.conditional_format(f'A{start_row + 3}:B{start_row + 3}', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format(f'A{start_row + 3}:B{start_row + 3}', {'type': 'blanks', 'format': dashedborder_format})
-
-            #apply right borders
-            worksheet.conditional_format(f'C{start_row + 1}:C{start_row + 2}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'C{start_row + 1}:C{start_row + 2}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right borders
-            worksheet.conditional_format(f'C{start_row + 4}:C{start_row + 5}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'C{start_row + 4}:C{start_row + 5}', {'type': 'blanks', 'format': rightborder_format})
-
-            #apply right and dashed bottom border
-            worksheet.conditional_format(f'C{start_row + 3}', {'type': 'blanks', 'format': sideborder_format})
-            worksheet.conditional_format(f'C{start_row + 3}', {'type': 'no_blanks', 'format': sideborder_format})
+import io
+import os
+import sys
+import threading
+import time
+import zipfile
 
-            #apply corner border
-            worksheet.conditional_format(f'C{start_row + 6}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'C{start_row + 6}', {'type': 'blanks', 'format': cornerborder_format})
-            
-            #convert CHN_dataAQ into a DataFrame for each sample
-            df = pd.DataFrame(CHN_dataAQ, columns=columns)
-            
-            #apply conditional formatting to this sample
-            worksheet = writer.sheets['Analysis']
-                
-            #write the DataFrame to default sheet
-            df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        
-        
-        #create an additional sheet for check standard and write additional data
-            extra_sheetCHNAQ = {
-                'Data': ['', '', '']
-                }
-            additional_df = pd.DataFrame(extra_sheetCHNAQ)
-            additional_df.to_excel(writer, index=False, sheet_name='Soil Testing', startrow=1, startcol=0)
-        #get the worksheet for the Soil Testing sheet
-            worksheet = writer.sheets['Soil Testing']
-        
-        #set the file to open the column width to the length of a "string"
-            Soilcolumnwidth = len("Soil Triplicate ")
-            worksheet.set_column(0, 1, Soilcolumnwidth)
-        
-        #set the file to open the column width to the length of a "string"
-            Soilcolumnwidth = len("Soil Measured")
-            worksheet.set_column(1, 1, Soilcolumnwidth)
-                  
-        
-        #set conditional formatting for Soil values in range green/red for in/out of range
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  0.744,
-                                       'maximum':  0.690,
-                                       'format':   green_format})
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  0.744,
-                                       'maximum':  0.690,
-                                       'format':   red_format})
+#streamlit runs this script again on every interaction but modules are only imported once per process,
+#so the time the imports take here is the cold start
+SCRIPT_START = time.perf_counter()
 
-         #write new column headers in Soil Testing sheet
-            headers = ['Soil Limit Testing', 'Soil Measured', 'Average', 'Low-value', 'High-value']
-            for i, header in enumerate(headers):
-                     worksheet.write(0, i, header, bold_format)
-             
-        #write new row headers in Soil Testing sheet
-            row_headers = ['Carbon']
-            for i, header in enumerate(row_headers):
-                worksheet.write(i+1, 0, header, bold_format)
-                 
-
-       #write Soil Limits below the columns
-                Soil_limits = [
-                     ['','=C8', 0.717, 0.690, 0.744]]
-                    
-                for row_num, row_data in enumerate(Soil_limits):
-                    for col_num, cell_data in enumerate(row_data):
-                         worksheet.write(row_num + 1, col_num + 0, cell_data)      
-        #write a table to put the three soil values from the CHN data
-            Soil_triplicate = [
-                ['Soil Triplicate Check', 'Mass (g)', 'C%'],
-                ['Soil 1','',''],
-                ['Soil 2','',''],
-                ['Soil 3','',''], 
-                ['', 'Average', '=AVERAGE(C5:C7)'],
-                ['', 'StDev', '=STDEV(C5:C7)'],
-                ['', 'RSD', '=C9/C8*100'],
-                ]
-            for row_num, row_data in enumerate(Soil_triplicate):
-                for col_num, cell_data in enumerate(row_data):
-                      worksheet.write(row_num + 3, col_num + 0, cell_data)
-        
-        #write borders for the soil triplicate data
-        
-        #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format('A4:C4', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format('A4:C4', {'type': 'blanks', 'format': headerborder_format})
-        
-        #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A10:B10', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format('A10:B10', {'type': 'blanks', 'format': bottomborder_format})
-        
-        #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A7:B7', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format('A7:B7', {'type': 'blanks', 'format': dashedborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('C5:C6', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('C5:C6', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('C8:C9', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('C8:C9', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right and dashed bottom border given it is blank OR not blank
-            worksheet.conditional_format('C7', {'type': 'no_blanks', 'format': sideborder_format})
-            worksheet.conditional_format('C7', {'type': 'blanks', 'format': sideborder_format})
-        
-        #apply corner border given it is not blank
-            worksheet.conditional_format('C10', {'type': 'no_blanks', 'format': cornerborder_format})
-           
-        #get worksheet for the Soil Testing sheet
-            worksheet = writer.sheets['Soil Testing']
-            worksheet = writer.sheets['Analysis']
-            
-    elif instrument == "Karl Fischer":
-        kf_data = []
-        #define template for one sample
-        sample_template = [
-            ['Sample 1', '', '', '', ''],
-            ['Sample 1', '', '', '', ''],
-            ['Sample 1', '', '', '', ''],
-            ['', '', '', 'Mean%', '=AVERAGE(E2:E4)'],
-            ['', '', '', 'StDev%', '=STDEV(E2:E4)'],
-            ['', '', '', 'RSD%', '=(E6/E5)*100'],
-        ]
-        average_row = 3  #row number for Mean%
-        stdev_row = 4    #row number for StDev%
-        rsd_row = 5      #row number for RSD%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        sample_row3 = 2
-        #replicate kf_calc based on the number of samples
-        for sample_num in range(1, num_request + 1):
-        #create a copy of the sample template for this sample
-            kf_calc = [row[:] for row in sample_template]
-
-        #calculate start row for this sample
-            start_row = (sample_num - 1) * 8 + 1
-
-        #update formulas for this sample
-            kf_calc[average_row][-1] = f'=AVERAGE(E{start_row + 1}:E{start_row + 3})'
-            kf_calc[stdev_row][-1] = f'=STDEV(E{start_row + 1}:E{start_row + 3})'
-            kf_calc[rsd_row][-1] = f'=(E{start_row + 5})/(E{start_row + 4}) * 100'
-
-        #add Sample label row
-            kf_calc[sample_row1][0] = f'Sample {sample_num}'
-            kf_calc[sample_row2][0] = f'Sample {sample_num}'
-            kf_calc[sample_row3][0] = f'Sample {sample_num}'
-        #append the sample's data to kf_data
-            kf_data.extend(kf_calc)
-
-        #add an empty row between sample templates
-            if sample_num < num_request:
-                kf_data.extend([[''] * len(sample_template[0]), columns])
-
-    #apply all borders, conditional formatting, and create the Excel file
-
-            
-        #apply all borders to top row
-            worksheet.conditional_format(f'A{start_row}:E{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:E{start_row}', {'type': 'blanks', 'format': headerborder_format})
-
-        #apply bottom borders
-            worksheet.conditional_format(f'A{start_row + 6}:D{start_row + 6}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 6}:D{start_row + 6}', {'type': 'blanks', 'format': bottomborder_format})
-
-        #apply dashed bottom borders
-            worksheet.conditional_format(f'A{start_row + 3}:D{start_row + 3}', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format(f'A{start_row + 3}:D{start_row + 3}', {'type': 'blanks', 'format': dashedborder_format})
-
-        #apply right borders
-            worksheet.conditional_format(f'E{start_row + 1}:E{start_row + 2}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'E{start_row + 1}:E{start_row + 2}', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right borders
-            worksheet.conditional_format(f'E{start_row + 4}:E{start_row + 5}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'E{start_row + 4}:E{start_row + 5}', {'type': 'blanks', 'format': rightborder_format})
-
-        #apply right and dashed bottom border
-            worksheet.conditional_format(f'E{start_row + 3}', {'type': 'blanks', 'format': sideborder_format})
-            worksheet.conditional_format(f'E{start_row + 3}', {'type': 'no_blanks', 'format': sideborder_format})
-
-        #apply corner border
-            worksheet.conditional_format(f'E{start_row + 6}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'E{start_row + 6}', {'type': 'blanks', 'format': cornerborder_format})
-        
-        #convert kf_data into DataFrame for each sample
-        df = pd.DataFrame(kf_data, columns=columns)
-        
-        #apply conditional formatting
-        worksheet = writer.sheets['Analysis']
-            
-        #write DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-    
-            
-        extra_sheetKF = {
-              'Water Standard Check': ['Water Standard (1)', 'Water Standard (2)', 'Water Standard (3)']
-              }
-        additional_df = pd.DataFrame(extra_sheetKF)
-        additional_df.to_excel(writer, index=False, sheet_name='Water Standard', startrow=0, startcol=0)
-        worksheet = writer.sheets['Water Standard']
-        headers = ['Water Standard Check', 'Mass(g)', 'Titrant(mL)', 'H2O%']
-        for i, header in enumerate(headers):
-            worksheet.write(0, i, header, bold_format)
-
-        #write new row headers in Water Standard sheet
-        row_headers = ['Water Standard (1)', 'Water Standard (2)', 'Water Standard (3)']
-        for i, header in enumerate(row_headers):
-            worksheet.write(i+1, 0, header, bold_format)
-                
-        #open the column width to the length of a "string"
-        KFcolumnwidth = len("Water Standard Check")
-        worksheet.set_column(0, 0, KFcolumnwidth)
-
-        KF_water_check = [
-               ['', '', 'Mean%', '=AVERAGE(D2:D4)'],
-               ['', '', 'StDev%', '=STDEV(D2:D4)'],
-               ['', '', 'RSD%', '=(D6/D5)*100'],
-            ]
-        for row_num, row_data in enumerate(KF_water_check):
-            for col_num, cell_data in enumerate(row_data):
-                worksheet.write(row_num + 4, col_num + 0, cell_data)
-            
-        #format conditional for RSD check        
-        worksheet.conditional_format('D7', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  0,
-                                           'maximum':  1.5,
-                                           'format':   green_format})
-            
-        worksheet.conditional_format('D7', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  0,
-                                           'maximum':  1.5,
-                                           'format':   red_format})
-            
-            
-            #write the DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        worksheet = writer.sheets['Analysis']
-
-
-    elif instrument == "KF & LECO CHN Combined":
-        CHN_KF_data = []
-        CHN_KF_template = [
-            ['Sample 1','','','','', '=100-SUM(C2:E2)','','','',''],
-            ['Sample 1','','','','', '=100-SUM(C3:E3)','','','',''],
-            ['Sample 1','','','','', '=100-SUM(C4:E4)','','','',''], 
-            ['', 'Average', '=AVERAGE(C2:C4)','=AVERAGE(D2:D4)','=AVERAGE(E2:E4)','=AVERAGE(F2:F4)', '=AVERAGE(G2:G4)', '=C5/(100-G5)*100','=(D5-(G5*0.111))/(100-G5)*100','=(F5-(0.889*G5))/(100-G5)*100'],
-            ['', 'StDev', '=STDEV(C2:C4)','=STDEV(D2:D4)','=STDEV(E2:E4)','=STDEV(F2:F4)','=STDEV(G2:G4)','','',''],
-            ['', 'RSD', '=C6/C5*100','=D6/D5*100','=E6/E5*100','=F6/F5*100','=G6/G5*100','','',''],
-        ]
-        average_row = 3  #row number for Mean%
-        stdev_row = 4    #row number for StDev%
-        rsd_row = 5      #row number for RSD%
-        sample_row1 = 0  #row number for "Sample X" labels
-        sample_row2 = 1
-        sample_row3 = 2
-            
-            #open the column width to the length of a "string"
-        CHNKFcolumnwidth = len("O% Dry Basis")
-        worksheet.set_column(7, 9, CHNKFcolumnwidth)
-            
-            #replicate CHN_KF_calc based on number of samples
-        for sample_num in range(1, num_request + 1):
-                #create a copy of the sample template
-            CHN_KF_calc = [row[:] for row in CHN_KF_template]
-
-                #calculate start row for this sample
-            start_row = (sample_num - 1) * 8 + 1
-            
-            #update the dry basis calculations
-            CHN_KF_calc[average_row][7] = f'=(C{start_row + 4})/(100-G{start_row + 4})*100'
-            CHN_KF_calc[average_row][8] = f'=(D{start_row + 4}-(G{start_row + 4}*0.111))/(100-G{start_row + 4})*100'
-            CHN_KF_calc[average_row][9] = f'=(F{start_row + 4}-(0.889*G{start_row + 4}))/(100-G{start_row + 4})*100'
-            #update the stat formulas (average)
-            CHN_KF_calc[average_row][2] = f'=AVERAGE(C{start_row + 1}:C{start_row + 3})'
-            CHN_KF_calc[average_row][3] = f'=AVERAGE(D{start_row + 1}:D{start_row + 3})'
-            CHN_KF_calc[average_row][4] = f'=AVERAGE(E{start_row + 1}:E{start_row + 3})'
-            CHN_KF_calc[average_row][5] = f'=AVERAGE(F{start_row + 1}:F{start_row + 3})'
-            CHN_KF_calc[average_row][6] = f'=AVERAGE(G{start_row + 1}:G{start_row + 3})'
-            #update the stat formulas (stdev)
-            CHN_KF_calc[stdev_row][2] = f'=STDEV(C{start_row + 1}:C{start_row + 3})'
-            CHN_KF_calc[stdev_row][3] = f'=STDEV(D{start_row + 1}:D{start_row + 3})'
-            CHN_KF_calc[stdev_row][4] = f'=STDEV(E{start_row + 1}:E{start_row + 3})'
-            CHN_KF_calc[stdev_row][5] = f'=STDEV(F{start_row + 1}:F{start_row + 3})'
-            CHN_KF_calc[stdev_row][6] = f'=STDEV(G{start_row + 1}:G{start_row + 3})'
-            #update the stat formulas (RSD)
-            CHN_KF_calc[rsd_row][2] = f'=(C{start_row + 5})/(C{start_row + 4}) * 100'
-            CHN_KF_calc[rsd_row][3] = f'=(D{start_row + 5})/(D{start_row + 4}) * 100'
-            CHN_KF_calc[rsd_row][4] = f'=(E{start_row + 5})/(E{start_row + 4}) * 100'
-            CHN_KF_calc[rsd_row][5] = f'=(F{start_row + 5})/(F{start_row + 4}) * 100'
-            CHN_KF_calc[rsd_row][6] = f'=(G{start_row + 5})/(G{start_row + 4}) * 100'
-            #make changes to the Oxygen calculations
-            CHN_KF_calc[sample_row1][5] = f'=100-SUM(C{start_row + 1}:E{start_row + 1})'
-            CHN_KF_calc[sample_row2][5] = f'=100-SUM(C{start_row + 2}:E{start_row + 2})'
-            CHN_KF_calc[sample_row3][5] = f'=100-SUM(C{start_row + 3}:E{start_row + 3})'
-            #add the Sample label row
-            CHN_KF_calc[sample_row1][0] = f'Sample {sample_num}'
-            CHN_KF_calc[sample_row2][0] = f'Sample {sample_num}'
-            CHN_KF_calc[sample_row3][0] = f'Sample {sample_num}'
-            #append the sample's data to CHN_KF_data
-            CHN_KF_data.extend(CHN_KF_calc)
-            
-            #add an empty row between sample templates
-            if sample_num < num_request:
-                CHN_KF_data.extend([[''] * len(CHN_KF_template[0]), columns])
-                
-            #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row}:J{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:J{start_row}', {'type': 'blanks', 'format': headerborder_format})
-            
-            #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 6}:I{start_row + 6}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 6}:I{start_row + 6}', {'type': 'blanks', 'format': bottomborder_format})
-            
-            #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 3}:I{start_row + 3}', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format(f'A{start_row + 3}:I{start_row + 3}', {'type': 'blanks', 'format': dashedborder_format})
-            
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'J{start_row + 1}:J{start_row + 2}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'J{start_row + 1}:J{start_row + 2}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'J{start_row + 4}:J{start_row + 5}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'J{start_row + 4}:J{start_row + 5}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right and dashed bottom border given it is blank OR not blank
-            worksheet.conditional_format(f'J{start_row + 3}', {'type': 'blanks', 'format': sideborder_format})
-            worksheet.conditional_format(f'J{start_row + 3}', {'type': 'no_blanks', 'format': sideborder_format})
-            
-            #apply corner border given it is blank OR not blank
-            worksheet.conditional_format(f'J{start_row + 6}', {'type': 'blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'J{start_row + 6}', {'type': 'no_blanks', 'format': cornerborder_format})
-            
-            #convert CHN_KF_data into DataFrame for each sample
-            df = pd.DataFrame(CHN_KF_data, columns=columns)
-            
-            #apply conditional formatting to this sample
-            worksheet = writer.sheets['Analysis']
-                
-            #write DataFrame to the default sheet
-            df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-            
-            #create an additional sheet and write additional data
-            extra_sheetCHNKF = {
-                'Data': ['Additional Data 1', 'Additional Data 2', 'Additional Data 3']
-            }
-            additional_df = pd.DataFrame(extra_sheetCHNKF)
-            additional_df.to_excel(writer, index=False, sheet_name='Cresol Testing', startrow=1, startcol=0)
-            #get the worksheet for Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-        
-            #open the column width to the length of a "string"
-            Cresolcolumnwidth = len("Cresol Measured")
-            worksheet.set_column(0, 1, Cresolcolumnwidth)
-            
-            #set conditional formatting for Cresol values in range green/red for in/out of range
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   green_format})
-            worksheet.conditional_format('B2', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  77.0,
-                                       'maximum':  78.3,
-                                       'format':   red_format})
-        
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   green_format})
-            worksheet.conditional_format('B3', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  7.4,
-                                       'maximum':  7.9,
-                                       'format':   red_format})
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   green_format})
-            worksheet.conditional_format('B5', {'type':     'cell',
-                                       'criteria': 'not between',
-                                       'minimum':  14.0,
-                                       'maximum':  15.4,
-                                       'format':   red_format})
-                 
-       
-             #write new column and row headers in Cresol Testing sheet
-            headers = ['Cresol Limit Testing', 'Cresol Measured', 'Average', 'Low-value', 'High-value']
-            for i, header in enumerate(headers):
-                worksheet.write(0, i, header, bold_format)
-                 
-                 #write new row headers in Cresol Testing sheet
-            row_headers = ['Carbon', 'Hydrogen', 'Nitrogen', 'Oxygen']
-            for i, header in enumerate(row_headers):
-                worksheet.write(i+1, 0, header, bold_format)
-                     
-           #write Cresol Limits below the columns
-            cresol_limits = [
-            ['','=C11', 77.7, 77.0, 78.3], 
-            ['','=D11', 7.5, 7.4, 7.9],
-            ['','=E11', 0.03, 0.0, 0.1],
-            ['','=F11', 14.8, 14.0, 15.4]
-             ]
-                     
-            for row_num, row_data in enumerate(cresol_limits):
-                for col_num, cell_data in enumerate(row_data):
-                          worksheet.write(row_num + 1, col_num + 0, cell_data)
-                      
-                        #write a table to put the three cresol values from the CHN data
-            cresol_triplicate = [
-            ['Cresol Triplicate Check', 'Mass (g)', 'C%', 'H%', 'N%', 'O% (diff)'],
-            ['Cresol 1','','','','', '=100-SUM(C8:E8)'],
-            ['Cresol 2','','','','', '=100-SUM(C9:E9)'],
-            ['Cresol 3','','','','', '=100-SUM(C10:E10)'], 
-            ['', 'Average', '=AVERAGE(C8:C10)','=AVERAGE(D8:D10)','=AVERAGE(E8:E10)','=AVERAGE(F8:F10)'],
-            ['', 'StDev', '=STDEV(C8:C10)','=STDEV(D8:D10)','=STDEV(E8:E10)','=STDEV(F8:F10)'],
-            ['', 'RSD', '=C12/C11*100','=D12/D11*100','=E12/E11*100','=F12/F11*100'],
-            ]
-            for row_num, row_data in enumerate(cresol_triplicate):
-                for col_num, cell_data in enumerate(row_data):
-                    worksheet.write(row_num + 6, col_num + 0, cell_data)
-        
-            #write borders for the cresol triplicate data
-        
-            #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format('A7:F7', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format('A7:F7', {'type': 'blanks', 'format': headerborder_format})
-        
-        #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A13:E13', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format('A13:E13', {'type': 'blanks', 'format': bottomborder_format})
-        
-        #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format('A10:E10', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format('A10:E10', {'type': 'blanks', 'format': dashedborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F8:F9', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F8:F9', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right borders given they are blank OR not blank
-            worksheet.conditional_format('F11:F12', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format('F11:F12', {'type': 'blanks', 'format': rightborder_format})
-        
-        #apply right and dashed bottom border given it is not blank
-            worksheet.conditional_format('F10', {'type': 'no_blanks', 'format': sideborder_format})
-        
-        #apply corner border given it is not blank
-            worksheet.conditional_format('F13', {'type': 'no_blanks', 'format': cornerborder_format})
-
-            #get worksheet for the Cresol Testing sheet
-            worksheet = writer.sheets['Cresol Testing']
-            worksheet = writer.sheets['Analysis']
-        
-    elif instrument == "Viscometer":
-        viscometer_data = []
-        viscometer_template = [
-            ['Sample 1', '', '', '', '']
-            ]
-        sample_row1 = 0
-        #open the column width to the length of a "string"
-        Vcolumnwidth = len("Temperature °C")
-        worksheet.set_column(0, 4, Vcolumnwidth)
-        # Replicate viscometer_data based on the number of samples
-        for sample_num in range(1, num_request + 1):
-        #copy the sample template for this sample
-            viscometer_calc = [row[:] for row in viscometer_template]
-            #calculate the start row for this sample
-            #add the sample label row
-            viscometer_calc[sample_row1][0] = f'Sample {sample_num}'
-            #append the sample's data to viscometer_data
-            viscometer_data.extend(viscometer_calc)
-            #convert viscometer_data into DataFrame for each sample
-        df = pd.DataFrame(viscometer_data, columns=columns)
-            
-            #apply conditional formatting to this sample
-        worksheet = writer.sheets['Analysis']
-                
-            #write DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        
-        extra_sheetViscosity = {
-           'Standard Check': ['Standard']
-           }
-        additional_df = pd.DataFrame(extra_sheetViscosity)
-        additional_df.to_excel(writer, index=False, sheet_name='Standard Check', startrow=0, startcol=0)
-        worksheet = writer.sheets['Standard Check']
-        #open the column width to the length of a "string"
-        viscositystandardcolumnwidth = len("Temperature (°C)")
-        worksheet.set_column(0, 4, viscositystandardcolumnwidth) 
-        headers = ['Standard Check', 'Viscosity (cP)', 'Torque (%)', 'Speed (RPM)', 'Temperature (°C)', 'Spindle']
-        for i, header in enumerate(headers):
-            worksheet.write(0, i, header, bold_format)
-
-        #write new row headers in Stadard Testing sheet
-        row_headers = ['Standard']
-        for i, header in enumerate(row_headers):
-            worksheet.write(i+1, 0, header, bold_format)
-            
-        #write DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        worksheet = writer.sheets['Analysis']
-
-    
-    elif instrument == "Density Meter (Duplicate Analysis)":
-        density_data = []
-        density_template = [
-            ['Sample 1','', ''],
-            ['Sample 1','', ''],
-            ['Mean', '=AVERAGE(B2:B3)', ''],
-            ['StDev', '=STDEV(B2:B3)', ''],
-            ['RSD', '=(B5/B4)*100', ''],
-        ]
-        average_row = 2  #row number for Mean%
-        stdev_row = 3    #row number for StDev%
-        rsd_row = 4      #row number for RSD%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        
-        #open the column width to the length of a "string"
-        DensityAnalysiscolumnwidth = len("Temperature (°C)")
-        worksheet.set_column(0, 2, DensityAnalysiscolumnwidth)
-        
-        #replicate density_calc based on the number of samples
-        for sample_num in range(1, num_request + 1):
-        #create a copy of the sample template
-            density_calc = [row[:] for row in density_template]
-
-        #calculate the start row for this sample
-            start_row = (sample_num - 1) * 7 + 1
-            
-            #update the formulas for this sample
-            density_calc[average_row][1] = f'=AVERAGE(B{start_row + 1}:B{start_row + 2})'
-            density_calc[stdev_row][1] = f'=STDEV(B{start_row + 1}:B{start_row + 2})'
-            density_calc[rsd_row][1] = f'=(B{start_row + 4})/(B{start_row + 3}) * 100'
-            #add the sample label row
-            density_calc[sample_row1][0] = f'Sample {sample_num}'
-            density_calc[sample_row2][0] = f'Sample {sample_num}'
-            #append the sample's data to density_data
-            density_data.extend(density_calc)
-            #add an empty row between sample templates
-            if sample_num < num_request:
-                density_data.extend([[''] * len(density_template[0]), columns])
-    
-            #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row}:C{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:C{start_row}', {'type': 'blanks', 'format': headerborder_format})
-            
-            #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 5}:B{start_row + 5}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 5}:B{start_row + 5}', {'type': 'blanks', 'format': bottomborder_format})
-            
-            #apply dashed bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 2}:B{start_row + 2}', {'type': 'no_blanks', 'format': dashedborder_format})
-            worksheet.conditional_format(f'A{start_row + 2}:B{start_row + 2}', {'type': 'blanks', 'format': dashedborder_format})
-            
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'C{start_row + 1}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'C{start_row + 1}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'C{start_row + 3}:C{start_row + 4}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'C{start_row + 3}:C{start_row + 4}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply right and dashed bottom border given it is blank OR not blank
-            worksheet.conditional_format(f'C{start_row + 2}', {'type': 'blanks', 'format': sideborder_format})
-            worksheet.conditional_format(f'C{start_row + 2}', {'type': 'no_blanks', 'format': sideborder_format})
-            
-            #apply corner border given it is blank OR not blank
-            worksheet.conditional_format(f'C{start_row + 5}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'C{start_row + 5}', {'type': 'blanks', 'format': cornerborder_format})
-            
-            
-            #convert density_data into DataFrame for each sample
-        df = pd.DataFrame(density_data, columns=columns)
-            
-            #apply conditional formatting to this sample
-        worksheet = writer.sheets['Analysis']
-                
-            #write DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-            
-        extra_sheetDensity = {
-           'Water Check': ['Water (1)', 'Water (2)']
-           }
-        additional_df = pd.DataFrame(extra_sheetDensity)
-        additional_df.to_excel(writer, index=False, sheet_name='Water Check', startrow=0, startcol=0)
-        worksheet = writer.sheets['Water Check']
-        #open the column width to the length of a "string"
-        densitywatercheckcolumnwidth = len("Temperature (°C)")
-        worksheet.set_column(0, 2, densitywatercheckcolumnwidth) 
-        headers = ['Water Check', 'Density (g/mL)', 'Temperature (°C)']
-        for i, header in enumerate(headers):
-            worksheet.write(0, i, header, bold_format)
-
-        #write new row headers in Water Testing sheet
-        row_headers = ['Water (1)', 'Water (2)']
-        for i, header in enumerate(row_headers):
-            worksheet.write(i+1, 0, header, bold_format)
-            
-        #write DataFrame to the default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        worksheet = writer.sheets['Analysis']
-        
-    elif instrument == "Density Meter (Singlet Analysis)":
-        density_data = []
-        density_template = [
-            ['Sample 1','', ''],
-        ]
-        sample_row1 = 0 #row number for "Sample X" labels
-        
-        #open the column width to the length of a "string"
-        DensityAnalysiscolumnwidth = len("Temperature (°C)")
-        worksheet.set_column(0, 2, DensityAnalysiscolumnwidth)
-        
-        #replicate density_calc based on the number of samples
-        for sample_num in range(1, num_request + 1):
-        #create a copy of the sample template
-            density_calc = [row[:] for row in density_template]
-  
-            density_calc[sample_row1][0] = f'Sample {sample_num}'
-            #append the sample's data to density_data
-            density_data.extend(density_calc)
-            
-            #convert density_data into a DF
-        df = pd.DataFrame(density_data, columns=columns)
-            
-            #apply conditional formatting
-        worksheet = writer.sheets['Analysis']
-                
-            #write the DF to default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-            
-        extra_sheetDensity = {
-           'Water Check': ['Water']
-           }
-        additional_df = pd.DataFrame(extra_sheetDensity)
-        additional_df.to_excel(writer, index=False, sheet_name='Water Check', startrow=0, startcol=0)
-        worksheet = writer.sheets['Water Check']
-        #open the column width to the length of a "string"
-        densitywatercheckcolumnwidth = len("Temperature (°C)")
-        worksheet.set_column(0, 2, densitywatercheckcolumnwidth) 
-        headers = ['Water Check', 'Density (g/mL)', 'Temperature (°C)']
-        for i, header in enumerate(headers):
-            worksheet.write(0, i, header, bold_format)
-
-        #write new row headers in Water Testing sheet
-        row_headers = ['Water']
-        for i, header in enumerate(row_headers):
-            worksheet.write(i+1, 0, header)
-            
-        #write DF to default sheet
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-        worksheet = writer.sheets['Analysis']
-    
-    elif instrument == "Acids Titration":
-        acids_data = []
-        acids_template = [
-            ['Sample 1','','','=C2-B2','=B2*56.1', '=C2*56.1','=D2*56.1'],
-            ['Sample 1','','','=C3-B3','=B3*56.1', '=C3*56.1','=D3*56.1'],
-            ['Average','=AVERAGE(B2:B3)','=AVERAGE(C2:C3)','=AVERAGE(D2:D3)','=AVERAGE(E2:E3)', '=AVERAGE(F2:F3)','=AVERAGE(G2:G3)'], 
-            ['Range', '=ABS(B3-B2)', '=ABS(C3-C2)','=ABS(D3-D2)','=ABS(E3-E2)','=ABS(F3-F2)', '=ABS(G3-G2)'],
-            ]
-        average_row = 2  #row number for Mean%
-        range_row = 3    #row number for StDev%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        
-        #open the column width to the length of a "string"
-        Acidscolumnwidth = len("Carboxylic Acid Number mg KOH/g")
-        worksheet.set_column(4, 6, Acidscolumnwidth) 
-        
-        #replicate acids_calc based on number of samples
-        for sample_num in range(1, num_request + 1):
-        #copy sample template for this sample
-            acids_calc = [row[:] for row in acids_template]
-
-        #calculate start row for this sample
-            start_row = (sample_num - 1) * 6 + 1 
-            
-       #update the average forumlas 
-            acids_calc[average_row][1] = f'=AVERAGE(B{start_row + 1}:B{start_row + 2})'
-            acids_calc[average_row][2] = f'=AVERAGE(C{start_row + 1}:C{start_row + 2})'
-            acids_calc[average_row][3] = f'=AVERAGE(D{start_row + 1}:D{start_row + 2})'
-            acids_calc[average_row][4] = f'=AVERAGE(E{start_row + 1}:E{start_row + 2})'
-            acids_calc[average_row][5] = f'=AVERAGE(F{start_row + 1}:F{start_row + 2})'
-            acids_calc[average_row][6] = f'=AVERAGE(G{start_row + 1}:G{start_row + 2})'
-       #update the range forumlas      
-            acids_calc[range_row][1] = f'=ABS(B{start_row + 2}-B{start_row + 1})'
-            acids_calc[range_row][2] = f'=ABS(C{start_row + 2}-C{start_row + 1})'
-            acids_calc[range_row][3] = f'=ABS(D{start_row + 2}-D{start_row + 1})'
-            acids_calc[range_row][4] = f'=ABS(E{start_row + 2}-E{start_row + 1})'
-            acids_calc[range_row][5] = f'=ABS(F{start_row + 2}-F{start_row + 1})'
-            acids_calc[range_row][6] = f'=ABS(G{start_row + 2}-G{start_row + 1})'
-            
-        #update the CAN calculations
-            acids_calc[sample_row1][3] = f'=(C{start_row + 1}-B{start_row + 1})'
-            acids_calc[sample_row1][4] = f'=(B{start_row + 1} * 56.1)'
-            acids_calc[sample_row1][5] = f'=(C{start_row + 1} * 56.1)'
-            acids_calc[sample_row1][6] = f'=(D{start_row + 1} * 56.1)'
-            acids_calc[sample_row2][3] = f'=(C{start_row + 2}-B{start_row + 2})'
-            acids_calc[sample_row2][4] = f'=(B{start_row + 2} * 56.1)'
-            acids_calc[sample_row2][5] = f'=(C{start_row + 2} * 56.1)'
-            acids_calc[sample_row2][6] = f'=(D{start_row + 2} * 56.1)'
-            acids_calc[sample_row1][1] = 0
-            acids_calc[sample_row1][2] = 0
-
-       #update the sample label row
-            acids_calc[sample_row1][0] = f'Sample {sample_num}'
-            acids_calc[sample_row2][0] = f'Sample {sample_num}'
-       #append the sample's data to acids_data
-            acids_data.extend(acids_calc)
-
-       #add an empty row between sample templates
-            if sample_num < num_request:
-               acids_data.extend([[''] * len(acids_template[0]), columns])
-            
-            #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row}:G{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:G{start_row}', {'type': 'blanks', 'format': headerborder_format})
-            
-            #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 4}:F{start_row + 4}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 4}:F{start_row + 4}', {'type': 'blanks', 'format': bottomborder_format})
-
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'G{start_row + 1}:G{start_row + 3}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'G{start_row + 1}:G{start_row + 3}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply corner border given it is blank OR not blank
-            worksheet.conditional_format(f'G{start_row + 4}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'G{start_row + 4}', {'type': 'blanks', 'format': cornerborder_format})
-         
-
-     
-             
-            acids_summary_data = []
-            #create additional sheet and write additional data
-            extra_sheetacids = {'Sample ID': ["='Analysis'!A2"]
-                                }
-            additional_df = pd.DataFrame(extra_sheetacids)
-            additional_df.to_excel(writer, index=False, sheet_name='Summary Analysis', startrow=0, startcol=0)
-            #get the worksheet for Summary Analysis sheet and start writing below column
-            worksheet_summary = writer.sheets['Summary Analysis']
-        
-            #write new column and row headers in Summary Analysis sheet
-            headers = ['Sample ID', 'CAN mol/kg', 'TAN mol/kg', 'PhAN mol/kg', 'Carboxylic Acid Number mg KOH/g', 'Total Acid Number mg KOH/g', 'Phenolic Acid Number mg KOH/g']
-            for i, header in enumerate(headers):
-                worksheet_summary.write(0, i, header, bold_format)
-        
-            acids_summary_template = [
-                ['',"='Analysis'!B4","='Analysis'!C4", "='Analysis'!D4", "='Analysis'!E4", "='Analysis'!F4","='Analysis'!G4"], 
-            ]
-            for row_num, row_data in enumerate(acids_summary_template):
-                for col_num, cell_data in enumerate(row_data):
-                          worksheet_summary.write(row_num + 1, col_num + 0, cell_data)
-            summary_row = 0                
-            #open the column width to the length of a "string"
-            summaryacidscolumnwidth = len("Carboxylic Acid Number mg K")
-            worksheet_summary.set_column(4, 6, summaryacidscolumnwidth)
-        
-            #open the column width to the length of a "string"
-            summaryacidscolumnwidth = len("PhAN mol/kg654")
-            worksheet_summary.set_column(1, 3, summaryacidscolumnwidth)
-        
-            #replicate acids_summary_calc based on the number of samples
-            for sample_num in range(1, num_request + 1):
-        #copy the sample template for this sample
-                acids_summary_calc = [row[:] for row in acids_summary_template]
-
-        #calculate start row for this sample
-                start_row = (sample_num - 1) * 6 + 1
-
-        #update formulas for this sample
-                acids_summary_calc[summary_row][0] = f"='Analysis'!A{start_row + 1}"
-                acids_summary_calc[summary_row][1] = f"='Analysis'!B{start_row + 3}"
-                acids_summary_calc[summary_row][2] = f"='Analysis'!C{start_row + 3}"
-                acids_summary_calc[summary_row][3] = f"='Analysis'!D{start_row + 3}"
-                acids_summary_calc[summary_row][4] = f"='Analysis'!E{start_row + 3}"
-                acids_summary_calc[summary_row][5] = f"='Analysis'!F{start_row + 3}"
-                acids_summary_calc[summary_row][6] = f"='Analysis'!G{start_row + 3}"
-
-                acids_summary_data.extend(acids_summary_calc)
-        
-        #convert acids_summary_data into DF for each sample
-            df = pd.DataFrame(acids_summary_data, columns=columns)
-            #get worksheet for the Summary Analysis sheet
-            worksheet_summary = writer.sheets['Summary Analysis']
-            #write the DF to the default sheet
-            df.to_excel(writer, index=False, sheet_name='Summary Analysis', engine='xlsxwriter')
-            
-            #create additional sheet and write additional data
-            acids_vanillic = {'Expected': [5.77, 11.54]}
-                                
-            additional_df = pd.DataFrame(acids_vanillic)
-            additional_df.to_excel(writer, index=False, sheet_name='Vanillic Validation', startrow=0, startcol=0)
-            worksheet_vanillic = writer.sheets['Vanillic Validation']
-        
-            #write new column and row headers in Vanillic Validation sheet
-            vanillic_headers = ['Expected', 'Measured', '% Diff']
-            for col_num, header in enumerate(vanillic_headers):
-                worksheet_vanillic.write(0, col_num, header, bold_format)
-        
-            acids_vanillic_calc = [
-                        ['', '', '=(A2-B2)/A2 * 100'],
-                        ['', '', '=(A3-B3)/A3 * 100']]
-                            
-            for row_num, row_data in enumerate(acids_vanillic_calc):
-                for col_num, cell_data in enumerate(row_data):
-                          worksheet_vanillic.write(row_num + 1, col_num + 0, cell_data)
-                          
-            #format conditional for vanillic check        
-            worksheet_vanillic.conditional_format('C2', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  5.4815,
-                                           'maximum':  6.0585,
-                                           'format':   green_format})
-            
-            worksheet_vanillic.conditional_format('C2', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  5.4815,
-                                           'maximum':  6.0585,
-                                           'format':   red_format})
-            
-            worksheet_vanillic.conditional_format('C3', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  10.963,
-                                           'maximum':  12.117,
-                                           'format':   green_format})
-            
-            worksheet_vanillic.conditional_format('C3', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  10.963,
-                                           'maximum':  12.117,
-                                           'format':   red_format})
-                        
-            #create DF for "Vanillic Validation" with the correct headers
-            df_vanillic = pd.DataFrame(acids_vanillic, columns=vanillic_headers)
-            #write the DF to the default sheet
-           
-            df_vanillic.to_excel(writer, index=False, sheet_name='Vanillic Validation', engine='xlsxwriter')
-
-  
-        df = pd.DataFrame(acids_data, columns=columns)
-        worksheet = writer.sheets['Analysis']
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-    
-    elif instrument == "Carbonyls Titration":
-        carbonyl_data = []
-        carbonyl_template = [
-            ['Sample 1',''],
-            ['Sample 1',''],
-            ['Average','=AVERAGE(B2:B3)'], 
-            ['Range', '=ABS(B2-B3)'],
-            ]
-        average_row = 2  #row number for Mean%
-        range_row = 3    #row number for StDev%
-        sample_row1 = 0 #row number for "Sample X" labels
-        sample_row2 = 1
-        
-        #open the column width to the length of a "string"
-        carbonylcolumnwidth = len("Carbonyls mol/kg")
-        worksheet.set_column(0, 1, carbonylcolumnwidth) 
-        
-        #replicate carbonyl_calc based on number of samples
-        for sample_num in range(1, num_request + 1):
-        #create a copy of sample template for this sample
-            carbonyl_calc = [row[:] for row in carbonyl_template]
-
-        #calculate start row for this sample
-            start_row = (sample_num - 1) * 6 + 1 
-            
-       #update the average forumlas 
-            carbonyl_calc[average_row][1] = f'=AVERAGE(B{start_row + 1}:B{start_row + 2})'
-            
-       #update the range forumlas      
-            carbonyl_calc[range_row][1] = f'=ABS(B{start_row + 1}-B{start_row + 2})'
-            
-            carbonyl_calc[sample_row1][1] = 0
-
-       #update the sample label row
-            carbonyl_calc[sample_row1][0] = f'Sample {sample_num}'
-            carbonyl_calc[sample_row2][0] = f'Sample {sample_num}'
-       #append the sample's data to carbonyl_calc
-            carbonyl_data.extend(carbonyl_calc)
-
-       #add an empty row between sample templates
-            if sample_num < num_request:
-               carbonyl_data.extend([[''] * len(carbonyl_template[0]), columns])
-            
-                #apply all borders to top row given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row}:B{start_row}', {'type': 'no_blanks', 'format': headerborder_format})
-            worksheet.conditional_format(f'A{start_row}:B{start_row}', {'type': 'blanks', 'format': headerborder_format})
-            
-            #apply bottom borders given they are blank OR not blank
-            worksheet.conditional_format(f'A{start_row + 4}', {'type': 'no_blanks', 'format': bottomborder_format})
-            worksheet.conditional_format(f'A{start_row + 4}', {'type': 'blanks', 'format': bottomborder_format})
-
-            #apply right borders given they are blank OR not blank
-            worksheet.conditional_format(f'B{start_row + 1}:B{start_row + 3}', {'type': 'no_blanks', 'format': rightborder_format})
-            worksheet.conditional_format(f'B{start_row + 1}:B{start_row + 3}', {'type': 'blanks', 'format': rightborder_format})
-            
-            #apply corner border given it is blank OR not blank
-            worksheet.conditional_format(f'B{start_row + 4}', {'type': 'no_blanks', 'format': cornerborder_format})
-            worksheet.conditional_format(f'B{start_row + 4}', {'type': 'blanks', 'format': cornerborder_format})
-     
-             
-            carbonyl_summary_data = []
-            #create additional sheet and write additional data
-            extra_sheetcarbonyl = {'Sample ID': ["='Analysis'!B4"]
-                                }
-            additional_df = pd.DataFrame(extra_sheetcarbonyl)
-            additional_df.to_excel(writer, index=False, sheet_name='Summary Analysis', startrow=0, startcol=0)
-            #get the worksheet for the Summary Analysis sheet and start writing below column
-            worksheet_summary = writer.sheets['Summary Analysis']
-            
-            #open the column width to the length of a "string"
-            summarycarbonylcolumnwidth = len("Carbonyls mol/kg")
-            worksheet_summary.set_column(0, 1, summarycarbonylcolumnwidth)
-        
-            #write new column and row headers in Summary Analysis sheet
-            headers = ['Sample ID', 'Carbonyls mol/kg']
-            for i, header in enumerate(headers):
-                worksheet_summary.write(0, i, header, bold_format)
-        
-            carbonyl_summary_template = [
-                ['',"='Analysis'!B4"], 
-            ]
-            for row_num, row_data in enumerate(carbonyl_summary_template):
-                for col_num, cell_data in enumerate(row_data):
-                          worksheet_summary.write(row_num + 1, col_num + 0, cell_data)
-            summary_row = 0                
-        
-            #replicate carbonyl_summary_calc based on number of samples
-            for sample_num in range(1, num_request + 1):
-        #create a copy of sample template for this sample
-                carbonyl_summary_calc = [row[:] for row in carbonyl_summary_template]
-
-        #calculate start row for this sample
-                start_row = (sample_num - 1) * 6 + 1
-
-        #update the formulas for this sample
-                carbonyl_summary_calc[summary_row][0] = f"='Analysis'!A{start_row + 1}"
-                carbonyl_summary_calc[summary_row][1] = f"='Analysis'!B{start_row + 3}"
+import streamlit as st
 
+from layouts import compile_layout, instrument_columns, layout_version
+from timing import PhaseTimer, configure_logging, log_event
+from shards import needs_sharding, shard_size
 
-                carbonyl_summary_data.extend(carbonyl_summary_calc)
-        
-        #convert carbonyl_summary_data into a DF for each sample
-            df = pd.DataFrame(carbonyl_summary_data, columns=columns)
-            #get the worksheet for the Summary Analysis sheet
-            worksheet_summary = writer.sheets['Summary Analysis']
-            #write the DF to default sheet
-            df.to_excel(writer, index=False, sheet_name='Summary Analysis', engine='xlsxwriter')
-            
-            #create an additional sheet and write additional data
-            carbonyl_4BBA = {'Expected 4-BBA Carbonyls mol/kg': [4.7, 4.7]}
-                                
-            additional_df = pd.DataFrame(carbonyl_4BBA)
-            additional_df.to_excel(writer, index=False, sheet_name='4-BBA Validation', startrow=0, startcol=0)
-            worksheet_4BBA = writer.sheets['4-BBA Validation']
-            
-            carbonyl4BBAcolumnwidth = len("Measured 4-BBA Carbonyls mol/kg")
-            worksheet_4BBA.set_column(0, 1, carbonyl4BBAcolumnwidth) 
-            
-            #write new column and row headers in 4BBA Analysis sheet
-            carbonyl_headers = ['Expected 4-BBA Carbonyls mol/kg', 'Measured 4-BBA Carbonyls mol/kg', '% Diff', 'Range']
-            for col_num, header in enumerate(carbonyl_headers):
-                worksheet_4BBA.write(0, col_num, header, bold_format)
-        
-            carbonyl_4BBA_calc = [
-                        ['', '', '=ABS(A2-B2)/A2 * 100', '=ABS(B2-B3)'],
-                        ['', '', '=ABS(A3-B3)/A3 * 100', '']]
-                            
-            for row_num, row_data in enumerate(carbonyl_4BBA_calc):
-                for col_num, cell_data in enumerate(row_data):
-                          worksheet_4BBA.write(row_num + 1, col_num + 0, cell_data)
-                          
-            #format conditional for 4BBA check        
-            worksheet_4BBA.conditional_format('C2', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  0,
-                                           'maximum':  12.766,
-                                           'format':   green_format})
-            
-            worksheet_4BBA.conditional_format('C2', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  0,
-                                           'maximum':  12.766,
-                                           'format':   red_format})
-            
-            worksheet_4BBA.conditional_format('C3', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  0,
-                                           'maximum':  12.766,
-                                           'format':   green_format})
-            
-            worksheet_4BBA.conditional_format('C3', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  0,
-                                           'maximum':  12.766,
-                                           'format':   red_format})
-            worksheet_4BBA.conditional_format('D2', {'type':     'cell',
-                                           'criteria': 'between',
-                                           'minimum':  0,
-                                           'maximum':  0.4,
-                                           'format':   green_format})
-            
-            worksheet_4BBA.conditional_format('D2', {'type':     'cell',
-                                           'criteria': 'not between',
-                                           'minimum':  0,
-                                           'maximum':  0.4,
-                                           'format':   red_format})
-                        
-            #create the DF for "4BBA Validation" with the correct headers
-            df_4BBA = pd.DataFrame(carbonyl_4BBA, columns=carbonyl_headers)
-           
-            df_4BBA.to_excel(writer, index=False, sheet_name='4-BBA Validation', engine='xlsxwriter')
+#generating workbooks needs xlsxwriter and numpy, reading uploads and the results store need pandas,
+#they are imported where they are used so the page can be drawn before any of them has been loaded
+IMPORT_SECONDS = time.perf_counter() - SCRIPT_START
 
-  
-        df = pd.DataFrame(carbonyl_data, columns=columns)
-        worksheet = writer.sheets['Analysis']
-        df.to_excel(writer, index=False, sheet_name='Analysis', engine='xlsxwriter')
-                
-    #close the writer and save Excel file
-    writer.close()
-    return filename
+#version currently running 7/19/24
 
+#set TEMPLATE_SHOW_TIMINGS=1 to show the timings of every rerun in an expander at the bottom of the page
+SHOW_TIMINGS = os.environ.get('TEMPLATE_SHOW_TIMINGS') == '1'
+#how often the progress of a running job is redrawn
+JOB_REFRESH_SECONDS = 0.5
+#set TEMPLATE_WARMUP=1 to load the readers, compile every layout and start the batch pool in the background
+#as soon as the process serves its first page, instead of when someone first needs them
+WARMUP = os.environ.get('TEMPLATE_WARMUP') == '1'
+
+
+def warm_up():
+    start = time.perf_counter()
+    import calculations
+    import exports
+    import manifest
+    import reader
+    import results_store
+    from batch import get_pool, warm_worker
+    for instrument in instrument_columns:
+        compile_layout(instrument)
+        layout_version(instrument)
+    get_pool().submit(warm_worker)
+    log_event('warm_up', seconds=round(time.perf_counter() - start, 4))
+
+
+#runs once per process, the first rerun of the process reports the cold start
+@st.cache_resource
+def process_startup():
+    configure_logging()
+    if WARMUP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    return {'cold': True}
+
+
+#manifests are only parsed again when a different file is uploaded
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_manifest(data, filename):
+    from manifest import read_manifest
+    return read_manifest(io.BytesIO(data), filename)
+
+
+#the export is read and the prefilled workbook built once per uploaded file, not on every rerun while it is
+#uploaded, prefilled workbooks stay out of the template cache since every export is different
+@st.cache_data(max_entries=4, show_spinner=False)
+def prefill_from_export(data, filename, instrument):
+    from exports import read_export
+    from generator import generate_excel_file
+    replicates, skipped = read_export(io.BytesIO(data), instrument, filename)
+    return replicates, skipped, generate_excel_file(instrument, 0, replicates=replicates)
+
+
+#a completed template is read and calculated once per uploaded file
+@st.cache_data(max_entries=4, show_spinner=False)
+def read_completed(data, instrument):
+    from reader import read_completed_template
+    from calculations import calculate
+    #results are recalculated from the entered values so workbooks never opened in Excel work too
+    return calculate(instrument, read_completed_template(io.BytesIO(data), instrument))
+
+
+#one results store per process, every session reads and writes through its connection
+@st.cache_resource
+def get_results_store():
+    from results_store import ResultsStore
+    return ResultsStore()
+
+
+#progress bar and cancel button of a running job, only this part of the page is redrawn while it runs
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def job_progress(key):
+    job = st.session_state[key]
+    if job.finished():
+        #the whole page is rerun once so the result shows up
+        st.rerun()
+    if job.status == 'queued':
+        status = 'waiting for a worker'
+    elif job.done < job.total:
+        status = f'{job.done} of {job.total} sample blocks'
+    else:
+        status = 'saving the workbook'
+    st.progress(job.fraction(), text=f'{job.description}: {status}')
+    st.button('Cancel', key=f'{key}_cancel', on_click=job.cancel)
+
+
+#show the job kept under key in the session, returns it once it has finished successfully
+def show_job(key):
+    job = st.session_state.get(key)
+    if job is None:
+        return None
+    if not job.finished():
+        job_progress(key)
+    elif job.status == 'cancelled':
+        st.info(f'{job.description}: cancelled')
+    elif job.status == 'failed':
+        st.error(f'{job.description}: {job.error}')
+    else:
+        return job
+    return None
 
 
 #main app
 def main():
+    #the rerun is timed from the top of the script so the imports of a cold start are counted
+    timer = PhaseTimer({'imports': IMPORT_SECONDS}, start=SCRIPT_START)
+    startup = process_startup()
     st.title('Instrument Template Generator')
 
     #display a dropdown to select the instrument
     instrument = st.selectbox('Select an instrument', list(instrument_columns.keys()))
     
+    #a manifest of real sample ids (and metadata) sets the labels and the number of samples
+    manifest_file = st.file_uploader('Sample manifest (optional)', type=['csv', 'xlsx'],
+                                     help='A Sample ID column plus any metadata columns, one row per sample')
+    labels = metadata = None
+    if manifest_file is not None:
+        try:
+            with timer.phase('manifest'):
+                labels, metadata = load_manifest(manifest_file.getvalue(), manifest_file.name)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            st.error(f"Couldn't read {manifest_file.name}: {e}")
+        else:
+            st.info(f'{len(labels)} samples from {manifest_file.name}'
+                    + (f' with {", ".join(metadata)}' if metadata else ''))
+
     #allow user to input the number of samples, step = increasing intervals of 1
-    num_request = st.number_input('Number of Samples', min_value=1, value=1, step=1)
-    #generate the Excel file when a button is clicked
+    num_request = st.number_input('Number of Samples', min_value=1, value=1, step=1, disabled=labels is not None)
+    if labels is not None:
+        num_request = len(labels)
+    #one Excel table row per replicate instead of formatted sample blocks
+    table = st.checkbox('Excel Table layout', help='One table row per replicate with calculated columns and a total row')
+    #batches too big for one workbook come as a zip of shards with an index of the sample ids
+    if needs_sharding(instrument, num_request, table=table):
+        size = shard_size(instrument, table=table)
+        st.info(f'{int(num_request)} samples will be split into {-(-int(num_request) // size)} workbooks of up to '
+                f'{size} samples with an index of where each sample is')
+    #generate the Excel file in the background when a button is clicked, the job is kept in the session
+    #so changing a widget while it runs doesn't throw the work away
     if st.button('Generate Excel'):
-        filename = generate_excel_file(instrument, num_request)
-        st.success(f'Excel file for {instrument} with {num_request} samples has been generated!')
-
-        #provide a download link to the file
-        with open(filename, 'rb') as f:
-            data = f.read()
-        b64 = base64.b64encode(data).decode()
-        href = f'<a href="data:application/octet-stream;base64,{b64}" download="{filename}">Download Excel File</a>'
-        st.markdown(href, unsafe_allow_html=True)
+        from jobs import submit_template
+        st.session_state['template_job'] = submit_template(instrument, num_request, table, labels, metadata)
+    job = show_job('template_job')
+    if job is not None:
+        st.success(f'Excel file for {job.description} has been generated!')
+
+        #provide a download button for the file built in memory
+        with timer.phase('download'):
+            if isinstance(job.result, bytes):
+                st.download_button('Download Excel File', job.result, file_name=job.filename,
+                                   mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            else:
+                data, timings, total = job.result
+                st.download_button(f'Download Zip File ({len(timings) - 1} workbooks and an index)', data,
+                                   file_name=job.filename, mime='application/zip')
+
+    #fill a template straight from the file the instrument exported, formulas come with their results
+    st.header('Prefill from Instrument Export')
+    export = st.file_uploader(f'Upload a {instrument} export', type=['csv', 'xlsx'])
+    if export is not None:
+        if table:
+            st.warning('Prefilled templates use the sample block layout')
+        try:
+            with timer.phase('prefill'):
+                export_replicates, skipped, data = prefill_from_export(export.getvalue(), export.name, instrument)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            st.error(f"Couldn't prefill from {export.name}: {e}")
+        else:
+            from generator import template_filename
+            st.success(f'Prefilled {len(export_replicates)} replicates of {export_replicates["Sample"].nunique()} samples')
+            if skipped:
+                st.warning(f'{skipped} rows were left out, their samples already had every replicate')
+            st.download_button('Download Prefilled Excel File', data, file_name=template_filename(instrument),
+                               mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    #batch mode, several instruments for the same sample campaign in one zip
+    st.header('Batch')
+    batch_instruments = st.multiselect('Select instruments', list(instrument_columns.keys()))
+    #one workbook with an Analysis sheet per instrument and a shared sample register
+    combined = st.checkbox('One combined workbook', help='Every instrument gets its own sheets for the same samples')
+    jobs = []
+    if not combined:
+        for batch_instrument in batch_instruments:
+            if labels is not None:
+                jobs.append((batch_instrument, len(labels)))
+                continue
+            count = st.number_input(f'Number of Samples for {batch_instrument}', min_value=1, value=int(num_request),
+                                    step=1, key=f'batch_{batch_instrument}')
+            jobs.append((batch_instrument, count))
+    if batch_instruments and st.button('Generate Batch'):
+        from jobs import submit_batch, submit_combined
+        if combined:
+            st.session_state['batch_job'] = submit_combined(batch_instruments, num_request, labels, metadata)
+        else:
+            st.session_state['batch_job'] = submit_batch(jobs, labels, metadata)
+    job = show_job('batch_job')
+    if job is not None:
+        with timer.phase('download'):
+            if isinstance(job.result, bytes):
+                st.success(f'Combined workbook for {job.description} generated in {job.seconds:.2f} s')
+                st.download_button('Download Excel File', job.result, file_name=job.filename,
+                                   mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+            else:
+                data, timings, total = job.result
+                st.success(f'{len(timings)} templates generated in {total:.2f} s')
+                st.table(timings)
+                st.download_button('Download Zip File', data, file_name=job.filename, mime='application/zip')
+
+    #read the replicates back out of a filled in template of the selected instrument
+    st.header('Read Completed Template')
+    uploaded = st.file_uploader(f'Upload a completed {instrument} template', type=['xlsx'])
+    if uploaded is not None:
+        try:
+            with timer.phase('read'):
+                replicates, sample_results = read_completed(uploaded.getvalue(), instrument)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            st.error(f"Couldn't read {uploaded.name}: {e}")
+        else:
+            st.success(f'Read {len(replicates)} replicates of {replicates["Sample"].nunique()} samples')
+            st.dataframe(replicates)
+            st.download_button('Download CSV', replicates.to_csv(index=False), file_name=f'{instrument}_replicates.csv',
+                               mime='text/csv')
+            st.dataframe(sample_results)
+            st.download_button('Download Sample Results CSV', sample_results.to_csv(index=False),
+                               file_name=f'{instrument}_results.csv', mime='text/csv')
+            #keep the replicates and standards checks in the local results store
+            run_date = st.date_input('Run date')
+            if st.button('Save to Results Store'):
+                with timer.phase('ingest'):
+                    run_id = get_results_store().ingest(uploaded, instrument, run_date, uploaded.name)
+                st.success(f'Saved as run {run_id}')
+
+    #every stored result of a sample id across instruments and runs
+    st.header('Results Store')
+    sample_id = st.text_input('Look up a sample ID')
+    if sample_id:
+        with timer.phase('lookup'):
+            stored = get_results_store().sample_results(sample_id.strip())
+            statistics = get_results_store().sample_statistics(sample_id.strip())
+        if not stored:
+            st.info(f'No stored results for {sample_id}')
+        for family, table in stored.items():
+            st.subheader(family)
+            st.dataframe(table)
+            if family in statistics:
+                st.dataframe(statistics[family])
+
+    #shewhart, ewma and cusum charts of every standards check kept in the store
+    #only read when asked for so a rerun doesn't open the store
+    st.header('QC Control Charts')
+    status = None
+    if st.toggle('Show control charts'):
+        with timer.phase('control_status'):
+            status = get_results_store().control_status()
+        if status.empty:
+            st.info('No standards checks have been saved yet')
+    if status is not None and not status.empty:
+        st.dataframe(status)
+        series = st.selectbox('Control chart', list(zip(status['sheet'], status['name'])),
+                              format_func=lambda key: f'{key[0]} / {key[1]}')
+        with timer.phase('control_chart'):
+            points = get_results_store().control_chart(*series).set_index('run_date')
+        #the acceptance window is drawn with the shewhart limits as low and high
+        st.line_chart(points[['value', 'target', 'ucl', 'lcl', 'low', 'high']])
+        st.line_chart(points[['ewma', 'ewma_ucl', 'ewma_lcl']])
+        st.line_chart(points[['cusum_high', 'cusum_low', 'cusum_limit']])
+        signals = points[points['signal'] != '']
+        if not signals.empty:
+            st.warning(f'{len(signals)} runs out of control')
+            st.dataframe(signals[['value', 'signal']])
+
+    #the whole rerun, workbooks are built by the jobs which log their own timings, the counters of the
+    #template cache of this process go along with it once a job has loaded it (batch workers keep caches of their own)
+    rerun = {'seconds': round(timer.total(), 4), 'phases': timer.rounded()}
+    if 'template_cache' in sys.modules:
+        rerun['template_cache'] = sys.modules['template_cache'].template_cache.stats()
+    log_event('rerun', **rerun)
+    if startup['cold']:
+        startup['cold'] = False
+        log_event('cold_start', **rerun)
+    if SHOW_TIMINGS:
+        with st.expander('Timings'):
+            st.json(rerun)
 
 if __name__ == '__main__':
     main()
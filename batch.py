@@ -0,0 +1,115 @@
+import atexit
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+
+from generator import generate_excel_file, job_filenames
+from layouts import compile_layout, instrument_columns
+from template_cache import cached_excel_file
+from timing import configure_logging
+
+#number of worker processes, defaults to one per core
+DEFAULT_WORKERS = int(os.environ.get('TEMPLATE_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+#how often a batch reports progress while it waits for its workers
+PROGRESS_SECONDS = 0.25
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+#runs once in every worker so the first job does not pay for imports and layout compilation,
+#spawned workers start without the logging set up by the parent so they set up their own
+def warm_worker():
+    configure_logging()
+    for instrument in instrument_columns:
+        compile_layout(instrument)
+
+
+#the pool is created on first use and reused by every later batch in this process
+#workers are spawned rather than forked so they never inherit the threads of the web server
+def get_pool(max_workers=DEFAULT_WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                           mp_context=multiprocessing.get_context('spawn'),
+                                                           initializer=warm_worker)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+#generate one template inside a worker, the worker's cache shares the disk tier if one is configured
+#templates labelled from a manifest (or shards of a bigger batch, see shards.py) are always built,
+#with streaming set they are built in constant memory
+def run_job(instrument, num_request, labels=None, metadata=None, table=False, streaming=False):
+    start = time.perf_counter()
+    if labels is None:
+        data = cached_excel_file(instrument, num_request, table=table)
+    else:
+        data = generate_excel_file(instrument, num_request, streaming=streaming, table=table, labels=labels,
+                                   metadata=metadata)
+    return data, time.perf_counter() - start
+
+
+def wait_for_jobs(jobs, futures, progress):
+    samples = {future: num_request for (_, num_request), future in zip(jobs, futures)}
+    total = sum(samples.values())
+    done = 0
+    pending = set(futures)
+    try:
+        while pending:
+            finished, pending = concurrent.futures.wait(pending, timeout=PROGRESS_SECONDS,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            done += sum(samples[future] for future in finished)
+            progress(done, total)
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        raise
+
+
+#generate every (instrument, number of samples) job in parallel and return the zip archive bytes
+#together with one timing entry per job, in the order the jobs were given
+#progress (optional) is called with the sample blocks of the finished jobs and the total while the batch runs,
+#if it raises the jobs that have not started are cancelled (running ones finish and are thrown away)
+#labels and metadata (optional) from a sample manifest label every template and set its number of samples
+def generate_batch(jobs, pool=None, progress=None, labels=None, metadata=None):
+    if labels is not None:
+        jobs = [(instrument, len(labels)) for instrument, _ in jobs]
+    jobs = [(instrument, int(num_request)) for instrument, num_request in jobs]
+    for instrument, _ in jobs:
+        if instrument not in instrument_columns:
+            raise ValueError(f'Unknown instrument: {instrument}')
+    if pool is None:
+        pool = get_pool()
+
+    start = time.perf_counter()
+    futures = [pool.submit(run_job, instrument, num_request, labels, metadata) for instrument, num_request in jobs]
+    if progress:
+        wait_for_jobs(jobs, futures, progress)
+
+    output = io.BytesIO()
+    timings = []
+    #workbooks are already compressed, storing them keeps the archive step cheap
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for (instrument, num_request), filename, future in zip(jobs, job_filenames(jobs), futures):
+            data, seconds = future.result()
+            archive.writestr(filename, data)
+            timings.append({'instrument': instrument, 'samples': num_request, 'file': filename,
+                            'bytes': len(data), 'seconds': round(seconds, 3)})
+    total = time.perf_counter() - start
+    return output.getvalue(), timings, total
@@ -0,0 +1,232 @@
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import zipfile
+
+from generator import generate_excel_file
+from layouts import instrument_columns, layout_version
+from reader import read_completed_template
+
+DEFAULT_SCALES = [1, 10, 100, 1000, 10000]
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+#runs faster than this are dominated by noise and are not checked for scaling or time regressions
+MIN_SECONDS = 0.05
+#time growing faster than n ** MAX_EXPONENT between two scales is reported as superlinear
+MAX_EXPONENT = 1.2
+#reruns timed after the first run of the app in a fresh process
+STARTUP_RERUNS = 5
+
+#run in a fresh interpreter so nothing is imported yet, the first run of the app is the cold start
+#and the later ones are the reruns streamlit does on every widget change
+startup_script = '''
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+app.run()
+cold = time.perf_counter() - start
+reruns = []
+for _ in range(int(sys.argv[2])):
+    rerun_start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - rerun_start)
+print(json.dumps({'cold_start_seconds': cold, 'rerun_seconds': min(reruns), 'pandas_loaded': 'pandas' in sys.modules}))
+'''
+
+
+#count cells, formulas and conditional format rules straight from the worksheet xml of the workbook
+def count_contents(data):
+    counts = {'cells': 0, 'formulas': 0, 'conditional_formats': 0}
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for name in archive.namelist():
+            if name.startswith('xl/worksheets/sheet'):
+                xml = archive.read(name)
+                counts['cells'] += xml.count(b'<c ')
+                #plain formulas and the array formulas of the summary sheets
+                counts['formulas'] += xml.count(b'<f>') + xml.count(b'<f t="array"')
+                counts['conditional_formats'] += xml.count(b'<cfRule ')
+    return counts
+
+
+#best time to read the replicates back out of a workbook
+def time_read(data, instrument, repeat=1):
+    seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read_completed_template(io.BytesIO(data), instrument, keep_empty=True)
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+#best wall time over the repeats, then one more run under tracemalloc for the peak memory
+#so the tracing overhead never shows up in the timings
+def run_case(instrument, num_request, repeat=1, streaming=False, read=False):
+    seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = generate_excel_file(instrument, num_request, streaming=streaming)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    generate_excel_file(instrument, num_request, streaming=streaming)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {'instrument': instrument, 'samples': num_request, 'layout_version': layout_version(instrument),
+              'seconds': round(seconds, 4), 'peak_bytes': peak, 'file_bytes': len(data)}
+    result.update(count_contents(data))
+    if read:
+        result['read_seconds'] = round(time_read(data, instrument, repeat), 4)
+    return result
+
+
+#best cold start and rerun time of the app over the repeats, each repeat starts a new process
+def time_startup(repeat=1):
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'App.py')
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', startup_script, app, str(STARTUP_RERUNS)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {'cold_start_seconds': round(min(run['cold_start_seconds'] for run in runs), 4),
+            'rerun_seconds': round(min(run['rerun_seconds'] for run in runs), 4),
+            'pandas_loaded': any(run['pandas_loaded'] for run in runs)}
+
+
+def run_suite(instruments, scales, repeat=1, streaming=False, progress=None, read=False):
+    results = []
+    for instrument in instruments:
+        for num_request in scales:
+            result = run_case(instrument, num_request, repeat, streaming, read)
+            results.append(result)
+            if progress:
+                progress(result)
+    return results
+
+
+#flag every pair of consecutive scales where the time grows faster than the sample count allows
+def scaling_issues(results):
+    issues = []
+    by_instrument = {}
+    for result in results:
+        by_instrument.setdefault(result['instrument'], []).append(result)
+    for instrument, runs in by_instrument.items():
+        runs.sort(key=lambda r: r['samples'])
+        for small, large in zip(runs, runs[1:]):
+            if small['seconds'] < MIN_SECONDS or large['samples'] == small['samples']:
+                continue
+            exponent = math.log(large['seconds'] / small['seconds']) / math.log(large['samples'] / small['samples'])
+            if exponent > MAX_EXPONENT:
+                issues.append(f'{instrument}: time grows as n^{exponent:.2f} from {small["samples"]} '
+                              f'to {large["samples"]} samples')
+    return issues
+
+
+#compare against the stored baseline, only cases present in both are checked
+def regressions(results, baseline, time_tolerance=0.25, size_tolerance=0.05):
+    issues = []
+    previous = {(r['instrument'], r['samples']): r for r in baseline.get('results', [])}
+    for result in results:
+        old = previous.get((result['instrument'], result['samples']))
+        if old is None:
+            continue
+        name = f'{result["instrument"]} at {result["samples"]} samples'
+        if max(result['seconds'], old['seconds']) >= MIN_SECONDS and \
+                result['seconds'] > old['seconds'] * (1 + time_tolerance):
+            issues.append(f'{name}: {result["seconds"]:.3f} s, baseline {old["seconds"]:.3f} s')
+        if result['file_bytes'] > old['file_bytes'] * (1 + size_tolerance):
+            issues.append(f'{name}: {result["file_bytes"]} bytes, baseline {old["file_bytes"]} bytes')
+        if 'read_seconds' in result and 'read_seconds' in old and \
+                max(result['read_seconds'], old['read_seconds']) >= MIN_SECONDS and \
+                result['read_seconds'] > old['read_seconds'] * (1 + time_tolerance):
+            issues.append(f'{name}: read in {result["read_seconds"]:.3f} s, baseline {old["read_seconds"]:.3f} s')
+    return issues
+
+
+def startup_regressions(startup, baseline, time_tolerance=0.25):
+    issues = []
+    old = baseline.get('startup')
+    if old is None:
+        return issues
+    for key, name in [('cold_start_seconds', 'cold start'), ('rerun_seconds', 'rerun')]:
+        if max(startup[key], old[key]) >= MIN_SECONDS and startup[key] > old[key] * (1 + time_tolerance):
+            issues.append(f'app {name}: {startup[key]:.3f} s, baseline {old[key]:.3f} s')
+    return issues
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_json(path, results, startup=None):
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    if startup is not None:
+        report['startup'] = startup
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+        f.write('\n')
+
+
+def print_result(result):
+    print(f'{result["instrument"][:46]:<46} {result["samples"]:>6} {result["seconds"]:>9.4f} s '
+          f'{result["peak_bytes"] / 2**20:>8.1f} MB {result["file_bytes"]:>10} B '
+          f'{result["cells"]:>8} cells {result["formulas"]:>8} formulas {result["conditional_formats"]:>4} rules'
+          + (f' {result["read_seconds"]:>8.4f} s read' if 'read_seconds' in result else ''), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark template generation for every instrument.')
+    parser.add_argument('--instruments', nargs='+', default=list(instrument_columns), metavar='INSTRUMENT')
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES, metavar='N')
+    parser.add_argument('--repeat', type=int, default=1, help='keep the best time of this many runs')
+    parser.add_argument('--streaming', action='store_true', help='benchmark the constant memory mode')
+    parser.add_argument('--read', action='store_true', help='also time reading each workbook back')
+    parser.add_argument('--startup', action='store_true', help='also time the cold start and reruns of the app')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--size-tolerance', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    for instrument in args.instruments:
+        if instrument not in instrument_columns:
+            parser.error(f'unknown instrument {instrument!r}')
+
+    results = run_suite(args.instruments, sorted(args.scales), args.repeat, args.streaming, print_result, args.read)
+    startup = None
+    if args.startup:
+        startup = time_startup(args.repeat)
+        print(f'app cold start {startup["cold_start_seconds"]:.4f} s, rerun {startup["rerun_seconds"]:.4f} s'
+              + (', pandas loaded' if startup['pandas_loaded'] else ''), flush=True)
+    write_json(args.output, results, startup)
+
+    issues = scaling_issues(results)
+    baseline = load_baseline(args.baseline)
+    if baseline is not None and not args.save_baseline:
+        issues += regressions(results, baseline, args.time_tolerance, args.size_tolerance)
+        if startup is not None:
+            issues += startup_regressions(startup, baseline, args.time_tolerance)
+    if args.save_baseline:
+        write_json(args.baseline, results, startup)
+
+    for issue in issues:
+        print('WARNING', issue)
+    #a non-zero exit lets scheduled runs fail on a regression
+    return 1 if issues else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
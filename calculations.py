@@ -0,0 +1,393 @@
+import functools
+import re
+
+import numpy
+import pandas as pd
+
+from layouts import column_index, compile_layout
+
+#the templates are evaluated straight from their formula text so the results always follow the layouts,
+#every cell reference is a whole column of the batch: a samples x replicates matrix for replicate rows
+#and one value per sample for stat rows
+#as in Excel blank cells count as 0 in arithmetic and are skipped by SUM/AVERAGE/STDEV,
+#errors (division by zero, STDEV of fewer than two values) come out as NaN and carry on through every
+#formula that uses them, so a context gives the cells of a reference together with a mask of the blank ones
+
+token_pattern = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|([A-Z]+)\{(\w+)\}|([A-Z]+)\(|(\S))')
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.lstrip('=')
+    while position < len(text):
+        match = token_pattern.match(text, position)
+        if match is None or match.end() == position:
+            break
+        number, letters, row_key, function, symbol = match.groups()
+        if number is not None:
+            tokens.append(('number', float(number)))
+        elif letters is not None:
+            tokens.append(('ref', (column_index(letters), row_key)))
+        elif function is not None:
+            tokens.append(('function', function))
+        else:
+            tokens.append(('symbol', symbol))
+        position = match.end()
+    return tokens
+
+
+class FormulaParser:
+    #recursive descent over the small part of the Excel grammar the templates use,
+    #each node is compiled into a function of the evaluation context
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, symbol=None):
+        token = self.peek()
+        if symbol is not None and token != ('symbol', symbol):
+            raise ValueError(f'Expected {symbol!r} in formula {self.text!r}')
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.expression()
+        if self.position != len(self.tokens):
+            raise ValueError(f'Unsupported formula {self.text!r}')
+        return node
+
+    def expression(self):
+        node = self.term()
+        while self.peek() in (('symbol', '+'), ('symbol', '-')):
+            operator = self.take()[1]
+            node = binary(operator, node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek() in (('symbol', '*'), ('symbol', '/')):
+            operator = self.take()[1]
+            node = binary(operator, node, self.factor())
+        return node
+
+    def factor(self):
+        kind, value = self.take()
+        if (kind, value) == ('symbol', '-'):
+            operand = self.factor()
+            return lambda context: -operand(context)
+        if (kind, value) == ('symbol', '('):
+            node = self.expression()
+            self.take(')')
+            return node
+        if kind == 'number':
+            return lambda context: value
+        if kind == 'ref':
+            if self.peek() == ('symbol', ':'):
+                raise ValueError(f'Range outside a function in formula {self.text!r}')
+            return lambda context: context.value(*value)
+        if kind == 'function':
+            return self.function(value)
+        raise ValueError(f'Unsupported formula {self.text!r}')
+
+    def function(self, name):
+        if name not in functions:
+            raise ValueError(f'Unsupported function {name} in formula {self.text!r}')
+        arguments = [self.argument()]
+        while self.peek() == ('symbol', ','):
+            self.take()
+            arguments.append(self.argument())
+        self.take(')')
+        return functions[name](arguments)
+
+    #a function argument is a range, a single cell (both give their cells and blank mask) or an expression
+    def argument(self):
+        kind, value = self.peek()
+        if kind == 'ref':
+            self.take()
+            if self.peek() == ('symbol', ':'):
+                self.take()
+                kind, last = self.take()
+                if kind != 'ref':
+                    raise ValueError(f'Unsupported range in formula {self.text!r}')
+                return ('range', lambda context: context.range(value, last))
+            if self.peek() in ((None, None), ('symbol', ','), ('symbol', ')')):
+                return ('range', lambda context: context.range(value, value))
+            self.position -= 1
+        node = self.expression()
+        return ('value', node)
+
+
+def binary(operator, left, right):
+    if operator == '+':
+        return lambda context: left(context) + right(context)
+    if operator == '-':
+        return lambda context: left(context) - right(context)
+    if operator == '*':
+        return lambda context: left(context) * right(context)
+
+    def divide(context):
+        numerator, denominator = numpy.broadcast_arrays(left(context), right(context))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            result = numerator / denominator
+        #anything divided by zero is #DIV/0! in Excel
+        return numpy.where(denominator == 0, numpy.nan, result)
+    return divide
+
+
+#every argument of a function as one array with the cells of its ranges along the last axis,
+#and the mask of its blank cells
+def function_cells(arguments, context):
+    arrays = []
+    for kind, node in arguments:
+        if kind == 'value':
+            values = numpy.asarray(node(context), dtype=float)[..., numpy.newaxis]
+            arrays.append((values, numpy.zeros(values.shape, dtype=bool)))
+        else:
+            arrays.append(node(context))
+    if len(arrays) == 1:
+        return arrays[0]
+    shape = numpy.broadcast_shapes(*[values.shape[:-1] for values, _ in arrays])
+    return tuple(numpy.concatenate([numpy.broadcast_to(array, shape + array.shape[-1:]) for array in part], axis=-1)
+                 for part in zip(*arrays))
+
+
+#blank cells are left out, an error in any other cell makes the result an error
+def excel_sum(arguments):
+    def evaluate(context):
+        cells, blanks = function_cells(arguments, context)
+        return numpy.sum(numpy.where(blanks, 0.0, cells), axis=-1)
+    return evaluate
+
+
+def excel_average(arguments):
+    def evaluate(context):
+        cells, blanks = function_cells(arguments, context)
+        count = numpy.sum(~blanks, axis=-1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(count == 0, numpy.nan, numpy.sum(numpy.where(blanks, 0.0, cells), axis=-1) / count)
+    return evaluate
+
+
+#sample standard deviation, mean first and then the squared deviations as Excel does
+def excel_stdev(arguments):
+    def evaluate(context):
+        cells, blanks = function_cells(arguments, context)
+        count = numpy.sum(~blanks, axis=-1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            mean = numpy.sum(numpy.where(blanks, 0.0, cells), axis=-1) / count
+            squares = numpy.sum(numpy.where(blanks, 0.0, (cells - mean[..., numpy.newaxis]) ** 2), axis=-1)
+            return numpy.where(count < 2, numpy.nan, numpy.sqrt(squares / (count - 1)))
+    return evaluate
+
+
+def excel_abs(arguments):
+    if len(arguments) != 1:
+        raise ValueError('ABS takes one argument')
+    kind, node = arguments[0]
+
+    def evaluate(context):
+        values = node(context)
+        if kind == 'range':
+            #a single cell given to ABS is a value, a blank one counts as 0
+            values, blanks = values
+            values = numpy.where(blanks, 0.0, values)[..., 0] if values.shape[-1] == 1 else values
+        return numpy.abs(values)
+    return evaluate
+
+
+functions = {'SUM': excel_sum, 'AVERAGE': excel_average, 'STDEV': excel_stdev, 'ABS': excel_abs}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_formula(text):
+    return FormulaParser(text).parse()
+
+
+class BatchContext:
+    #values of every cell of every sample block, formula cells are evaluated on first use
+
+    def __init__(self, plan, inputs):
+        self.plan = plan
+        self.inputs = inputs
+        self.num_samples, self.num_replicates = inputs.shape[:2]
+        self.replicate_cells = {}
+        self.stat_cells = {}
+
+    #whole replicate column as a samples x replicates matrix, blank inputs stay NaN
+    def replicate_column(self, col_num):
+        if col_num not in self.replicate_cells:
+            cell = self.plan.replicate_row[col_num]
+            if isinstance(cell, str) and cell.startswith('='):
+                result = compile_formula(cell)(self)
+                self.replicate_cells[col_num] = numpy.broadcast_to(
+                    numpy.asarray(result, dtype=float), (self.num_samples, self.num_replicates))
+            else:
+                self.replicate_cells[col_num] = self.inputs[:, :, col_num]
+        return self.replicate_cells[col_num]
+
+    def stat_column(self, name, col_num):
+        key = (name, col_num)
+        if key not in self.stat_cells:
+            cell = self.plan.stat_templates[name][col_num]
+            if isinstance(cell, str) and cell.startswith('='):
+                result = compile_formula(cell)(self)
+                self.stat_cells[key] = numpy.broadcast_to(numpy.asarray(result, dtype=float), (self.num_samples,))
+            else:
+                #labels and empty cells of a stat row are blank
+                self.stat_cells[key] = numpy.full(self.num_samples, numpy.nan)
+        return self.stat_cells[key]
+
+    #cells a reference points at with blanks and errors as NaN, and the mask of the blank ones
+    #(the NaN of an input or an empty cell, a formula cell is never blank)
+    def cells(self, col_num, row_key):
+        if row_key in ('row', 'first', 'last'):
+            cell = self.plan.replicate_row[col_num]
+            values = self.replicate_column(col_num)
+            if row_key != 'row':
+                values = values[:, 0 if row_key == 'first' else -1]
+        else:
+            cell = self.plan.stat_templates[row_key][col_num]
+            values = self.stat_column(row_key, col_num)
+        if isinstance(cell, str) and cell.startswith('='):
+            return values, numpy.zeros(values.shape, dtype=bool)
+        return values, numpy.isnan(values)
+
+    #a reference used as a value, blank cells count as 0 and errors stay NaN
+    def value(self, col_num, row_key):
+        values, blanks = self.cells(col_num, row_key)
+        return numpy.where(blanks, 0.0, values)
+
+    #cells and blank mask of a range along a new last axis, a block column (first to last) or part of a row
+    def range(self, start, stop):
+        (first_col, first_key), (last_col, last_key) = start, stop
+        if first_col == last_col and (first_key, last_key) == ('first', 'last'):
+            return self.cells(first_col, 'row')
+        if first_key == last_key:
+            parts = [self.cells(col_num, first_key) for col_num in range(first_col, last_col + 1)]
+            return tuple(numpy.stack(part, axis=-1) for part in zip(*parts))
+        raise ValueError('Unsupported range')
+
+
+#samples x replicates x columns array of the values entered in a tidy table of replicates
+#(the layout the reader returns), missing replicates are blank
+def input_matrix(plan, replicates):
+    sample_numbers = numpy.unique(replicates['Sample'].to_numpy())
+    num_replicates = max(plan.replicates, int(replicates['Replicate'].max()) if len(replicates) else 0)
+    sample_index = numpy.searchsorted(sample_numbers, replicates['Sample'].to_numpy())
+    replicate_index = replicates['Replicate'].to_numpy().astype(int) - 1
+    inputs = numpy.full((len(sample_numbers), num_replicates, len(plan.columns)), numpy.nan)
+    for col_num, column in enumerate(plan.columns[1:], 1):
+        inputs[sample_index, replicate_index, col_num] = pd.to_numeric(replicates[column], errors='coerce')
+    return sample_numbers, sample_index, replicate_index, inputs
+
+
+#labels and evaluation context of the sample blocks of a template filled with a table of replicates,
+#blank cells the template prefills (the titration blanks) start out with the prefilled value
+def block_results(plan, replicates):
+    sample_numbers, _, _, inputs = input_matrix(plan, replicates)
+    inputs = inputs[:, :plan.replicates]
+    for (rep_idx, col_num), value in plan.prefill.items():
+        if rep_idx < plan.replicates:
+            column = inputs[:, rep_idx, col_num]
+            column[numpy.isnan(column)] = value
+    labels = replicates.groupby('Sample', sort=True)[plan.columns[0]].first().reindex(sample_numbers)
+    return labels.astype(str).tolist(), BatchContext(plan, inputs)
+
+
+#evaluate every formula of an instrument's template for a tidy table of replicates
+#returns the replicates with their formula columns filled in and one row per sample with the
+#stat rows, named '<column> <stat>' (e.g. 'C% average', 'H2O% rsd')
+def calculate(instrument, replicates):
+    plan = compile_layout(instrument)
+    sample_numbers, sample_index, replicate_index, inputs = input_matrix(plan, replicates)
+    context = BatchContext(plan, inputs)
+
+    results = replicates.copy()
+    for col_num, cell in enumerate(plan.replicate_row):
+        if isinstance(cell, str) and cell.startswith('='):
+            results[plan.columns[col_num]] = context.replicate_column(col_num)[sample_index, replicate_index]
+
+    samples = {'Sample': sample_numbers}
+    first_labels = replicates.groupby('Sample', sort=True)[plan.columns[0]].first()
+    samples[plan.columns[0]] = first_labels.reindex(sample_numbers).to_numpy()
+    for name in plan.stat_names:
+        for col_num, cell in enumerate(plan.stat_templates[name]):
+            if isinstance(cell, str) and cell.startswith('='):
+                samples[f'{plan.columns[col_num]} {name}'] = context.stat_column(name, col_num)
+    return results, pd.DataFrame(samples)
+
+
+#an A1 reference of a standards sheet formula, rewritten as C{11} so the block formula grammar reads it
+a1_reference = re.compile(r'\b([A-Z]{1,3})(\d+)\b')
+
+
+class SheetContext:
+    #cells of a standards sheet, the spec gives its constants and formulas and the workbook the values
+    #typed into its blank cells, formula cells are evaluated on first use with references by sheet row
+
+    def __init__(self, sheet, entered):
+        self.spec_cells = {}
+        for start_row, start_col, rows, _ in sheet['cells']:
+            for row_offset, row in enumerate(rows):
+                for col_offset, cell in enumerate(row):
+                    self.spec_cells[(start_row + row_offset, start_col + col_offset)] = cell
+        self.entered = entered
+        self.results = {}
+        self.blanks = {}
+
+    #value of a cell by 0-based row and column, NaN when blank, text or an error
+    def cell(self, row_num, col_num):
+        key = (row_num, col_num)
+        if key not in self.results:
+            cell = self.spec_cells.get(key, '')
+            formula = isinstance(cell, str) and cell.startswith('=')
+            if formula:
+                value = compile_formula(a1_reference.sub(r'\1{\2}', cell))(self)
+            elif cell == '':
+                value = self.entered.get(key)
+            else:
+                value = cell
+            try:
+                self.results[key] = float(value)
+            except (TypeError, ValueError):
+                self.results[key] = numpy.nan
+            #an error typed into a cell (#DIV/0!, #N/A) is an error, not a blank
+            error = isinstance(value, str) and value.startswith('#')
+            self.blanks[key] = bool(numpy.isnan(self.results[key])) and not (formula or error)
+        return self.results[key]
+
+    def cells(self, col_num, row_key):
+        row_num = int(row_key) - 1
+        value = self.cell(row_num, col_num)
+        return numpy.asarray(value), numpy.asarray(self.blanks[(row_num, col_num)])
+
+    def value(self, col_num, row_key):
+        values, blanks = self.cells(col_num, row_key)
+        return numpy.where(blanks, 0.0, values)
+
+    def range(self, start, stop):
+        (first_col, first_key), (last_col, last_key) = start, stop
+        keys = [(row_num - 1, col_num) for row_num in range(int(first_key), int(last_key) + 1)
+                for col_num in range(first_col, last_col + 1)]
+        return numpy.array([self.cell(*key) for key in keys]), numpy.array([self.blanks[key] for key in keys])
+
+
+#the qc checks of a standards sheet worked out from the values entered on it ({(row, col): value}, 0-based)
+#returns one dict per check with its name, cell, value (NaN when it is an error) and window,
+#or none at all when nothing was typed into the sheet
+def standard_results(sheet, entered):
+    context = SheetContext(sheet, entered)
+    if all(context.spec_cells.get(key, '') != '' for key in entered):
+        return []
+    checks = []
+    for cell, low, high, name in sheet.get('qc_limits', []):
+        letters, row = a1_reference.fullmatch(cell).groups()
+        value = context.cell(int(row) - 1, column_index(letters))
+        checks.append({'name': name, 'cell': cell, 'value': value, 'low': min(low, high), 'high': max(low, high)})
+    return checks
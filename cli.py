@@ -0,0 +1,222 @@
+import argparse
+import io
+import os
+import sys
+import time
+import zipfile
+
+#only the generation modules are imported here, streamlit is never loaded
+from generator import COMBINED_FILENAME, build_combined_workbook, build_workbook, job_filenames
+from layouts import instrument_columns
+from shards import needs_sharding
+from timing import configure_logging
+
+
+#a job is written as "instrument=number of samples", the count defaults to 1
+def parse_job(text):
+    instrument, _, count = text.rpartition('=')
+    if not instrument:
+        instrument, count = text, '1'
+    instrument = instrument.strip()
+    if instrument not in instrument_columns:
+        raise argparse.ArgumentTypeError(f'unknown instrument {instrument!r}, use --list to see the choices')
+    try:
+        num_request = int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'number of samples must be an integer, got {count!r}')
+    if num_request < 1:
+        raise argparse.ArgumentTypeError('number of samples must be at least 1')
+    return instrument, num_request
+
+
+#one job per non-empty line, lines starting with # are skipped
+def read_jobs_file(path):
+    jobs = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                jobs.append(parse_job(line))
+    return jobs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate instrument data templates without starting the web app.')
+    parser.add_argument('jobs', nargs='*', type=parse_job, metavar='INSTRUMENT=SAMPLES',
+                        help='instrument name and number of samples, e.g. "Karl Fischer=24"')
+    parser.add_argument('-f', '--jobs-file', help='file with one INSTRUMENT=SAMPLES job per line')
+    parser.add_argument('-o', '--output', default='.',
+                        help='directory to write the templates to, or - to write to stdout (default: current directory)')
+    parser.add_argument('-j', '--parallel', action='store_true', help='generate the jobs on a process pool')
+    parser.add_argument('--streaming', action='store_true', help='flush rows as they are written to keep memory flat')
+    parser.add_argument('--table', action='store_true',
+                        help='lay the replicates out as an Excel table with calculated columns')
+    parser.add_argument('--combined', action='store_true',
+                        help='write every job into one workbook with a sheet per instrument (same sample count)')
+    parser.add_argument('--manifest', help='CSV or XLSX sample manifest whose ids label every template and set its '
+                                           'number of samples')
+    parser.add_argument('--shard-samples', type=int, metavar='N',
+                        help='split jobs with more samples than this into workbooks of N samples plus an index, in a '
+                             'zip when writing to stdout (default: $TEMPLATE_SHARD_SAMPLES or 50000, never more '
+                             'than one sheet holds)')
+    parser.add_argument('--list', action='store_true', help='list the available instruments and exit')
+    return parser, parser.parse_args(argv)
+
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+    configure_logging()
+    if args.list:
+        for instrument in instrument_columns:
+            print(instrument)
+        return 0
+
+    jobs = list(args.jobs)
+    if args.jobs_file:
+        try:
+            jobs.extend(read_jobs_file(args.jobs_file))
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    if not jobs:
+        parser.error('no jobs given')
+    if args.table and (args.streaming or args.parallel or args.combined or (args.output == '-' and len(jobs) > 1)):
+        parser.error('--table only works for serial runs without --streaming or --combined')
+    if args.streaming and (args.parallel or (args.output == '-' and len(jobs) > 1)):
+        parser.error('--streaming only works for serial runs, the process pool builds its workbooks in memory')
+    if args.combined and len({num_request for _, num_request in jobs}) > 1:
+        parser.error('--combined needs the same number of samples for every instrument')
+    if args.combined and len({instrument for instrument, _ in jobs}) < len(jobs):
+        parser.error('--combined takes each instrument once')
+    if args.shard_samples is not None and args.shard_samples < 1:
+        parser.error('--shard-samples must be at least 1')
+    if args.combined and args.shard_samples:
+        parser.error('--shard-samples has no effect with --combined, a combined workbook is never split')
+
+    args.labels = args.metadata = None
+    if args.manifest:
+        #pandas is only loaded when a manifest is given
+        from manifest import read_manifest
+        try:
+            args.labels, args.metadata = read_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error(f'{args.manifest}: {e}')
+        jobs = [(instrument, len(args.labels)) for instrument, _ in jobs]
+
+    #jobs too big for one workbook are split into shards, a combined workbook is never split
+    sharded = [False if args.combined else needs_sharding(instrument, num_request, args.shard_samples, args.table)
+               for instrument, num_request in jobs]
+    if any(sharded) and args.output == '-' and len(jobs) > 1:
+        parser.error('a job split into shards can only be written to stdout on its own')
+    #shard files are named after the instrument alone
+    sharded_instruments = [instrument for (instrument, _), shard in zip(jobs, sharded) if shard]
+    if len(set(sharded_instruments)) < len(sharded_instruments):
+        parser.error('jobs split into shards need a different instrument each')
+    large_jobs = [job for job, shard in zip(jobs, sharded) if shard]
+    jobs = [job for job, shard in zip(jobs, sharded) if not shard]
+
+    start = time.perf_counter()
+    if jobs:
+        if args.combined:
+            write_combined(jobs, args)
+        elif args.output == '-':
+            write_stdout(jobs, args)
+        elif args.parallel:
+            write_parallel(jobs, args)
+        else:
+            os.makedirs(args.output, exist_ok=True)
+            for (instrument, num_request), filename in zip(jobs, job_filenames(jobs)):
+                path = os.path.join(args.output, filename)
+                job_start = time.perf_counter()
+                build_workbook(instrument, num_request, path, streaming=args.streaming, table=args.table,
+                               labels=args.labels, metadata=args.metadata)
+                report(path, num_request, time.perf_counter() - job_start)
+    files = 1 if args.combined else len(jobs)
+    for instrument, num_request in large_jobs:
+        files += write_sharded(instrument, num_request, args)
+    print(f'{files} file(s) in {time.perf_counter() - start:.3f} s', file=sys.stderr)
+    return 0
+
+
+#the workbook goes to stdout or into the output directory as combined_data_template.xlsx
+def write_combined(jobs, args):
+    instruments = [instrument for instrument, _ in jobs]
+    num_request = jobs[0][1]
+    if args.output == '-':
+        path, name = sys.stdout.buffer, '<stdout>'
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        path = name = os.path.join(args.output, COMBINED_FILENAME)
+    job_start = time.perf_counter()
+    build_combined_workbook(instruments, num_request, path, streaming=args.streaming, labels=args.labels,
+                            metadata=args.metadata)
+    report(name, num_request, time.perf_counter() - job_start)
+
+
+#the shards and their index go into the output directory, or to stdout as one zip, returns the number of files
+def write_sharded(instrument, num_request, args):
+    from batch import shutdown_pool
+    from shards import generate_sharded
+    try:
+        data, timings, _ = generate_sharded(instrument, num_request, args.shard_samples, table=args.table,
+                                            labels=args.labels, metadata=args.metadata)
+    finally:
+        shutdown_pool()
+    if args.output == '-':
+        sys.stdout.buffer.write(data)
+        names = [timing['file'] for timing in timings]
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        names = []
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for timing in timings:
+                path = os.path.join(args.output, timing['file'])
+                with open(path, 'wb') as f:
+                    f.write(archive.read(timing['file']))
+                names.append(path)
+    for name, timing in zip(names, timings):
+        report(name, timing['samples'], timing['seconds'])
+    return len(timings)
+
+
+#timings go to stderr so stdout can carry the workbook itself
+def report(name, num_request, seconds):
+    print(f'{seconds:8.3f} s  {num_request:>7} samples  {name}', file=sys.stderr)
+
+
+#a single job is written as the workbook itself, several jobs as a zip archive
+def write_stdout(jobs, args):
+    if len(jobs) == 1:
+        instrument, num_request = jobs[0]
+        job_start = time.perf_counter()
+        build_workbook(instrument, num_request, sys.stdout.buffer, streaming=args.streaming, table=args.table,
+                       labels=args.labels, metadata=args.metadata)
+        report('<stdout>', num_request, time.perf_counter() - job_start)
+        return
+    from batch import generate_batch, shutdown_pool
+    try:
+        data, timings, _ = generate_batch(jobs, labels=args.labels, metadata=args.metadata)
+    finally:
+        shutdown_pool()
+    sys.stdout.buffer.write(data)
+    for timing in timings:
+        report(timing['file'], timing['samples'], timing['seconds'])
+
+
+def write_parallel(jobs, args):
+    #the pool is only imported when asked for so serial runs start as fast as possible
+    from batch import generate_batch, shutdown_pool
+    try:
+        data, timings, _ = generate_batch(jobs, labels=args.labels, metadata=args.metadata)
+    finally:
+        shutdown_pool()
+    os.makedirs(args.output, exist_ok=True)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for timing in timings:
+            path = os.path.join(args.output, timing['file'])
+            with open(path, 'wb') as f:
+                f.write(archive.read(timing['file']))
+            report(path, timing['samples'], timing['seconds'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
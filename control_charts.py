@@ -0,0 +1,90 @@
+import math
+
+import numpy
+
+#control charts of the standards checks, every check (sheet and name, e.g. Cresol Testing / Carbon) is a series
+#whose centre and spread come from its first BASELINE_POINTS points and are then held so a drift can't move its
+#own limits, a stable process that sits off the middle of its acceptance window (an RSD near 0) is in control
+#until the baseline is complete the charts are drawn around the middle of the window with a sixth of it as the
+#spread, only points outside the window signal and the ewma and cusum start once the baseline is known
+#the window itself stays a pass/fail check (passed in the store)
+#each new point updates the running state of its series in constant time (see results_store.ResultsStore)
+BASELINE_POINTS = 20
+SHEWHART_SIGMAS = 3.0
+EWMA_WEIGHT = 0.2
+EWMA_SIGMAS = 3.0
+#cusum slack and decision interval in standard deviations
+CUSUM_SLACK = 0.5
+CUSUM_LIMIT = 5.0
+#stored series worked out by an older version of these charts are worked out again when the store is opened
+CHART_VERSION = 2
+
+#columns a point keeps next to its value, in the order of the standard_checks table
+POINT_COLUMNS = ['target', 'sigma', 'ewma', 'cusum_high', 'cusum_low', 'signal']
+
+
+def new_state():
+    return {'version': CHART_VERSION, 'count': 0, 'baseline_count': 0, 'baseline_mean': 0.0, 'baseline_m2': 0.0,
+            'ewma': None, 'cusum_high': 0.0, 'cusum_low': 0.0, 'last_date': None, 'last_value': None,
+            'last_signal': ''}
+
+
+def baseline_complete(state):
+    return state['baseline_count'] >= BASELINE_POINTS
+
+
+def target(state, low, high):
+    if baseline_complete(state):
+        return state['baseline_mean']
+    return (low + high) / 2
+
+
+def sigma(state, low, high):
+    if baseline_complete(state) and state['baseline_m2'] > 0:
+        return math.sqrt(state['baseline_m2'] / (state['baseline_count'] - 1))
+    return (high - low) / 6 or 1.0
+
+
+#add a point to the state of its series, returns what the charts keep for it, signal lists the charts
+#it is out of control on (shewhart, ewma, cusum) separated by commas
+def add_point(state, value, low, high, run_date):
+    center = target(state, low, high)
+    spread = sigma(state, low, high)
+    signals = []
+    if abs(value - center) > SHEWHART_SIGMAS * spread:
+        signals.append('shewhart')
+
+    if baseline_complete(state):
+        ewma = center if state['ewma'] is None else state['ewma']
+        ewma = EWMA_WEIGHT * value + (1 - EWMA_WEIGHT) * ewma
+        cusum_high = max(0.0, state['cusum_high'] + value - center - CUSUM_SLACK * spread)
+        cusum_low = max(0.0, state['cusum_low'] + center - CUSUM_SLACK * spread - value)
+        if abs(ewma - center) > EWMA_SIGMAS * spread * math.sqrt(EWMA_WEIGHT / (2 - EWMA_WEIGHT)):
+            signals.append('ewma')
+        if max(cusum_high, cusum_low) > CUSUM_LIMIT * spread:
+            signals.append('cusum')
+    else:
+        #welford's update over the baseline points only
+        ewma, cusum_high, cusum_low = None, 0.0, 0.0
+        state['baseline_count'] += 1
+        delta = value - state['baseline_mean']
+        state['baseline_mean'] += delta / state['baseline_count']
+        state['baseline_m2'] += delta * (value - state['baseline_mean'])
+    state.update(count=state['count'] + 1, ewma=ewma, cusum_high=cusum_high, cusum_low=cusum_low,
+                 last_date=run_date, last_value=value, last_signal=','.join(signals))
+    return {'target': center, 'sigma': spread, 'ewma': ewma, 'cusum_high': cusum_high, 'cusum_low': cusum_low,
+            'signal': state['last_signal']}
+
+
+#the chart lines of a series read back with its points (a table with value and the POINT_COLUMNS)
+def chart_limits(points):
+    points = points.copy()
+    #points of the baseline have no ewma yet
+    points['ewma'] = points['ewma'].astype(float)
+    points['ucl'] = points['target'] + SHEWHART_SIGMAS * points['sigma']
+    points['lcl'] = points['target'] - SHEWHART_SIGMAS * points['sigma']
+    ewma_width = EWMA_SIGMAS * points['sigma'] * numpy.sqrt(EWMA_WEIGHT / (2 - EWMA_WEIGHT))
+    points['ewma_ucl'] = points['target'] + ewma_width
+    points['ewma_lcl'] = points['target'] - ewma_width
+    points['cusum_limit'] = CUSUM_LIMIT * points['sigma']
+    return points
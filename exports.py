@@ -0,0 +1,180 @@
+import csv
+import io
+import re
+
+import numpy
+import pandas as pd
+
+from layouts import compile_layout
+
+#rows of an export handled at a time, large exports are never held as one raw table
+EXPORT_CHUNK_ROWS = 5000
+#instruments often write a few lines of run details above the column headers
+MAX_HEADER_ROW = 20
+
+#headers an export may use for the sample id column, compared after normalize_header
+sample_id_headers = {'sampleid', 'sample', 'samplename', 'name', 'id', 'label'}
+
+
+#lower case letters, digits and % only, so 'Sample ID', 'sample_id' and 'SampleID' all match
+def normalize_header(text):
+    return re.sub(r'[^a-z0-9%]', '', str(text).lower())
+
+
+#names an export column may have for each template input column, with and without the units in parentheses
+def column_aliases(plan):
+    aliases = {}
+    for col_num, column in enumerate(plan.columns[1:], 1):
+        if plan.replicate_row[col_num] != '':
+            continue
+        for name in (column, re.sub(r'\(.*?\)', '', column)):
+            aliases.setdefault(normalize_header(name), col_num)
+    return aliases
+
+
+#template column of every export column, the sample id column maps to 0 and unknown columns are left out
+def match_header(header, plan):
+    aliases = column_aliases(plan)
+    mapping = {}
+    for position, name in enumerate(header):
+        key = normalize_header(name)
+        if key in sample_id_headers and 0 not in mapping.values():
+            mapping[position] = 0
+        elif key in aliases and aliases[key] not in mapping.values():
+            mapping[position] = aliases[key]
+    return mapping
+
+
+#index of the header row among the first rows, the first one that names a sample id column
+def find_header(rows):
+    for row_num, row in enumerate(rows):
+        if any(normalize_header(name) in sample_id_headers for name in row if name is not None):
+            return row_num
+    raise ValueError('The export has no sample ID column')
+
+
+def is_excel(filename):
+    return str(filename).lower().endswith(('.xlsx', '.xlsm'))
+
+
+#chunks of raw rows from a csv export, the header row and everything above it are skipped,
+#returns the 0-based index of the header row, the header and the chunks
+#the file is read as a stream, only the lines up to the header and one chunk of rows are held at a time,
+#a file opened from a path is closed once the chunks have been read
+def csv_chunks(source, chunk_rows):
+    opened = not hasattr(source, 'read')
+    stream = open(source, 'rb') if opened else source
+    text = stream if isinstance(stream.read(0), str) else io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    def close():
+        if text is not stream:
+            #the wrapper would close the caller's file along with it
+            text.detach()
+        if opened:
+            stream.close()
+
+    try:
+        lines = []
+        while True:
+            line = text.readline()
+            lines.append(line)
+            try:
+                header_row = find_header(csv.reader(lines))
+                break
+            except ValueError:
+                if not line or len(lines) == MAX_HEADER_ROW:
+                    raise
+        header = next(csv.reader(lines[header_row:]))
+    except BaseException:
+        close()
+        raise
+
+    def chunks():
+        try:
+            for chunk in pd.read_csv(text, header=None, names=range(len(header)), dtype=str, chunksize=chunk_rows,
+                                     skip_blank_lines=False, index_col=False):
+                yield chunk.to_numpy(dtype=object)
+        except pd.errors.EmptyDataError:
+            #nothing below the header
+            return
+        finally:
+            close()
+    return header_row, header, chunks()
+
+
+#chunks of raw rows from the first sheet of an xlsx export that has a sample id column, read row by row
+#returns the header row, the header and the chunks like csv_chunks
+def excel_chunks(source, chunk_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    for worksheet in workbook.worksheets:
+        top = list(worksheet.iter_rows(max_row=MAX_HEADER_ROW, values_only=True))
+        try:
+            header_row = find_header(top)
+        except ValueError:
+            continue
+        header = ['' if name is None else name for name in top[header_row]]
+        break
+    else:
+        workbook.close()
+        raise ValueError('The export has no sample ID column')
+
+    def chunks():
+        try:
+            rows = []
+            for row in worksheet.iter_rows(min_row=header_row + 2, max_col=len(header), values_only=True):
+                rows.append(row)
+                if len(rows) == chunk_rows:
+                    yield numpy.array(rows, dtype=object)
+                    rows = []
+            if rows:
+                yield numpy.array(rows, dtype=object)
+        finally:
+            workbook.close()
+    return header_row, header, chunks()
+
+
+#read an instrument export (csv or xlsx) into the tidy table of replicates the templates are filled from:
+#Sample, Replicate, Sample ID and the template columns, the way reader.read_completed_template lays it out
+#export columns are matched to the template columns by header name, rows of the same sample id are its
+#replicates in the order they appear and samples are numbered in order of their first row
+#returns the replicates and the number of rows left out because their sample already has every replicate
+def read_export(source, instrument, filename=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    plan = compile_layout(instrument)
+    filename = filename or getattr(source, 'name', source)
+    _, header, chunks = excel_chunks(source, chunk_rows) if is_excel(filename) else csv_chunks(source, chunk_rows)
+    mapping = match_header(header, plan)
+    if len(mapping) < 2:
+        raise ValueError(f"None of the export's columns match the {instrument} columns")
+
+    sample_numbers = {}
+    replicate_counts = {}
+    samples = []
+    replicate_numbers = []
+    ids = []
+    columns = {col_num: [] for col_num in mapping.values() if col_num}
+    skipped = 0
+    id_position = next(position for position, col_num in mapping.items() if col_num == 0)
+    for rows in chunks:
+        labels = pd.Series(rows[:, id_position]).astype('string').str.strip()
+        keep = labels.notna() & (labels != '')
+        numbers = {col_num: pd.to_numeric(pd.Series(rows[:, position]), errors='coerce').to_numpy()
+                   for position, col_num in mapping.items() if col_num}
+        for row_index in numpy.flatnonzero(keep.to_numpy()):
+            label = labels.iat[row_index]
+            replicate = replicate_counts.get(label, 0) + 1
+            if replicate > plan.replicates:
+                skipped += 1
+                continue
+            replicate_counts[label] = replicate
+            samples.append(sample_numbers.setdefault(label, len(sample_numbers) + 1))
+            replicate_numbers.append(replicate)
+            ids.append(label)
+            for col_num, values in numbers.items():
+                columns[col_num].append(values[row_index])
+
+    replicates = pd.DataFrame({'Sample': samples, 'Replicate': replicate_numbers, plan.columns[0]: ids})
+    for col_num, column in enumerate(plan.columns[1:], 1):
+        replicates[column] = numpy.array(columns[col_num], dtype=float) if col_num in columns else numpy.nan
+    return replicates, skipped
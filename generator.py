@@ -0,0 +1,618 @@
+import functools
+import io
+import json
+import math
+import re
+
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
+from xlsxwriter.worksheet import Worksheet
+
+from layouts import (BOTH, check_row_limit, compile_layout, layout_version, sample_labels, short_names,
+                     structured_column, table_column)
+from timing import PhaseTimer, log_event
+
+#formats shared by every layout, referenced by name in the layout specs
+format_specs = {
+    'bold': {'bold': True},
+    'bottom': {'bottom': 2, 'border_color': 'black'},
+    'right': {'right': 2, 'border_color': 'black'},
+    'header': {'border': 2, 'border_color': 'black'},
+    'corner': {'right': 2, 'bottom': 2, 'border_color': 'black'},
+    'dashed': {'bottom': 6, 'border_color': 'black'},
+    'side': {'right': 2, 'bottom': 6, 'border_color': 'black'},
+    'green': {'bg_color': '#C6EFCE', 'font_color': '#006100'},
+    'red': {'bg_color': '#FFC7CE', 'font_color': '#9C0006'},
+}
+
+
+#number of sample blocks whose text is generated together
+CHUNK_SAMPLES = 1024
+
+#names of the tables written in table mode
+ANALYSIS_TABLE = 'AnalysisData'
+SAMPLE_TABLE = 'SampleAverages'
+
+#sheet of a combined workbook every Analysis sheet takes its sample ids from
+REGISTER_SHEET = 'Samples'
+COMBINED_FILENAME = 'combined_data_template.xlsx'
+
+#hidden sheet holding the layout manifest as json in A1, the defined name points at that cell
+LAYOUT_SHEET = 'Template Layout'
+LAYOUT_NAME = 'TemplateLayout'
+LAYOUT_MANIFEST_VERSION = 1
+#bumped whenever the workbooks written for the same layout change (a new sheet, different formulas...),
+#cached workbooks made by an older version are never served (see template_cache.cache_key)
+TEMPLATE_FORMAT_VERSION = 4
+
+#functions the templates use, xlsxwriter never renames any of them so a formula that only calls
+#these can skip the ~30 regex substitutions xlsxwriter runs on every formula
+PLAIN_FUNCTIONS = frozenset(['SUM', 'AVERAGE', 'AVERAGEIFS', 'STDEV', 'ABS', 'SUBTOTAL'])
+function_call = re.compile(r'([\w.]+)\(')
+
+
+class TemplateWorksheet(Worksheet):
+    #worksheet that writes the formulas of the templates without rewriting them first,
+    #table column formulas reach this without their leading '='
+
+    def _prepare_formula(self, formula, expand_future_functions=False):
+        if not formula.startswith('{') and not formula.endswith('}') and \
+                PLAIN_FUNCTIONS.issuperset(function_call.findall(formula)):
+            return formula[1:] if formula.startswith('=') else formula
+        return super()._prepare_formula(formula, expand_future_functions)
+
+
+#add the named formats plus one merged format for every combination of border names the plans use,
+#a combined workbook passes every instrument's plan so they all share one set of formats
+def add_formats(workbook, *plans):
+    formats = {name: workbook.add_format(spec) for name, spec in format_specs.items()}
+    for plan in plans:
+        for styles in plan.row_styles.values():
+            for names in styles:
+                if names and names not in formats:
+                    merged = {}
+                    for name in names:
+                        for key, value in format_specs[name].items():
+                            merged.setdefault(key, value)
+                    formats[names] = workbook.add_format(merged)
+    return formats
+
+
+def set_column_widths(worksheet, column_widths):
+    for first_col, last_col, width in column_widths:
+        worksheet.set_column(first_col, last_col, width)
+
+
+#write a header row, cell by cell when it has borders
+def write_header(worksheet, row_num, plan, formats):
+    styles = plan.row_styles.get(0)
+    if styles:
+        for col_num, name in enumerate(plan.columns):
+            worksheet.write_string(row_num, col_num, name, formats[styles[col_num]] if styles[col_num] else None)
+    else:
+        worksheet.write_row(row_num, 0, plan.columns)
+
+
+#kinds of block cells: fixed values, template text, formulas with a cached result, entered values and
+#sample ids taken from the register of a combined workbook
+FIXED, TEXT, CACHED, INPUT, REGISTER = range(5)
+
+#cached value of a formula Excel would show as an error
+ERROR_VALUE = '#DIV/0!'
+#characters of an Excel sheet name
+EXCEL_MAX_SHEET_NAME = 31
+
+
+#how each cell of a block body row is written: (col_num, write method, fixed value, format, kind)
+#the write method is picked once per cell instead of letting worksheet.write sniff every value
+#filled templates also write the entered values and the cached results of the formulas,
+#with register set the sample id cells are references to the register sheet
+def body_cells(worksheet, plan, formats, filled=False, register=False):
+    body = []
+    for row_num, (fixed, templates) in enumerate(plan.rows):
+        styles = plan.row_styles.get(row_num + 1) or [None] * len(fixed)
+        template_text = {col_num: (text, names) for col_num, text, names in templates}
+        is_replicate = row_num < plan.replicates
+        cells = []
+        for col_num, value in enumerate(fixed):
+            cell_format = formats[styles[col_num]] if styles[col_num] else None
+            if col_num in template_text:
+                if register and template_text[col_num] == ('{}', ('label',)):
+                    cells.append((col_num, worksheet.write_formula, None, cell_format, REGISTER))
+                elif template_text[col_num][0].startswith('='):
+                    cells.append((col_num, worksheet.write_formula, None, cell_format, CACHED if filled else TEXT))
+                else:
+                    cells.append((col_num, worksheet.write_string, None, cell_format, TEXT))
+            elif filled and is_replicate and (value == '' or (row_num, col_num) in plan.prefill):
+                cells.append((col_num, worksheet.write_number, value, cell_format, INPUT))
+            elif value == '':
+                #blank cells are only written when they carry a border
+                if cell_format:
+                    cells.append((col_num, worksheet.write_blank, '', cell_format, FIXED))
+            elif isinstance(value, str):
+                cells.append((col_num, worksheet.write_string, value, cell_format, FIXED))
+            else:
+                cells.append((col_num, worksheet.write_number, value, cell_format, FIXED))
+        body.append(cells)
+    return body
+
+
+def cached_value(value):
+    return ERROR_VALUE if math.isnan(value) else value
+
+
+#per body row {col_num: value by sample} of the formula results and of the entered values (None when blank)
+def block_values(plan, results):
+    cached = []
+    entered = []
+    for row_num, (fixed, templates) in enumerate(plan.rows):
+        row_cached = {}
+        row_entered = {}
+        for col_num, text, _ in templates:
+            if not text.startswith('='):
+                continue
+            if row_num < plan.replicates:
+                values = results.replicate_column(col_num)[:, row_num]
+            else:
+                values = results.stat_column(plan.stat_names[row_num - plan.replicates], col_num)
+            row_cached[col_num] = [cached_value(value) for value in values.tolist()]
+        if row_num < plan.replicates:
+            for col_num in range(len(fixed)):
+                values = results.inputs[:, row_num, col_num].tolist()
+                row_entered[col_num] = [None if math.isnan(value) else value for value in values]
+        cached.append(row_cached)
+        entered.append(row_entered)
+    return cached, entered
+
+
+#write the sample blocks to the Analysis sheet, rows are written strictly in order
+#block borders are cell formats so the sheet needs no conditional format rules however many samples it holds
+#the text of the blocks is generated a chunk of samples at a time as whole columns
+#results (optional, from calculations.block_results) fills the blocks with entered values and formula results
+#progress (optional) is called with the number of blocks written and the total after every chunk
+#first_sample skips the blocks before it, the header is still written first so every format gets the
+#same index as in a full build (see incremental.py)
+#register links the sample ids to the register sheet of a combined workbook, labels are their cached values
+def write_analysis_sheet(worksheet, plan, labels, formats, results=None, progress=None, first_sample=0,
+                         register=False):
+    set_column_widths(worksheet, plan.column_widths)
+    write_header(worksheet, 0, plan, formats)
+    body = body_cells(worksheet, plan, formats, results is not None, register)
+    if results is not None:
+        cached, entered = block_values(plan, results)
+    for start in range(first_sample, len(labels), CHUNK_SAMPLES):
+        stop = min(start + CHUNK_SAMPLES, len(labels))
+        columns = plan.block_columns(labels, start, stop)
+        if register:
+            references = [f"='{REGISTER_SHEET}'!$A${sample_index + 2}" for sample_index in range(start, stop)]
+        for i, sample_index in enumerate(range(start, stop)):
+            first = plan.first_row(sample_index)
+            if sample_index and plan.repeat_header:
+                write_header(worksheet, first - 1, plan, formats)
+            for row_num, cells in enumerate(body):
+                row = first + row_num
+                row_columns = columns[row_num]
+                for col_num, write, value, cell_format, kind in cells:
+                    if kind == FIXED:
+                        write(row, col_num, value, cell_format)
+                    elif kind == TEXT:
+                        write(row, col_num, row_columns[col_num][i], cell_format)
+                    elif kind == CACHED:
+                        write(row, col_num, row_columns[col_num][i], cell_format,
+                              cached[row_num][col_num][sample_index])
+                    elif kind == REGISTER:
+                        write(row, col_num, references[i], cell_format, row_columns[col_num][i])
+                    elif entered[row_num][col_num][sample_index] is not None:
+                        write(row, col_num, entered[row_num][col_num][sample_index], cell_format)
+                    elif value != '':
+                        #nothing entered where the template prefills a value
+                        write(row, col_num, value, cell_format)
+                    elif cell_format:
+                        worksheet.write_blank(row, col_num, '', cell_format)
+        if progress:
+            progress(stop, len(labels))
+
+
+#one row per sample with the label and stat row of its block in the Analysis sheet, each column is a single
+#dynamic array formula picking every stride-th row of the Analysis column so the sheet stays the same size
+#whatever the number of samples, e.g. =INDEX('Analysis'!B:B,SEQUENCE(100,1,5,6)) for rows 5, 11, 17, ...
+#a filled template also caches the spilled values, error results are cached as their text
+def write_summary_sheet(worksheet, plan, labels, formats, results=None, analysis_name='Analysis'):
+    stat = plan.summary['stat']
+    summary_columns = plan.summary_columns()
+    worksheet.write_row(0, 0, [plan.columns[0]] + [plan.columns[col_num] for col_num in summary_columns])
+    num_samples = len(labels)
+    #1-based sheet rows of the first label and stat row, the sequences step a block at a time from them
+    starts = [(0, plan.first_row(0) + 1)] + [(col_num, plan.stat_row(0, stat) + 1) for col_num in summary_columns]
+    formulas = []
+    for col_num, start in starts:
+        col_name = xl_col_to_name(col_num)
+        formulas.append(f"=INDEX('{analysis_name}'!{col_name}:{col_name},"
+                        f"SEQUENCE({num_samples},1,{start},{plan.stride}))")
+    if results is None:
+        #Excel works out the spill range when it calculates the workbook
+        for summary_col, formula in enumerate(formulas):
+            worksheet.write_dynamic_array_formula(1, summary_col, 1, summary_col, formula)
+    else:
+        values = [list(labels)] + [[cached_value(value) for value in results.stat_column(stat, col_num).tolist()]
+                                   for col_num in summary_columns]
+        for summary_col, formula in enumerate(formulas):
+            worksheet.write_dynamic_array_formula(1, summary_col, num_samples, summary_col, formula, None,
+                                                  values[summary_col][0])
+        #rows in order so streamed sheets can write them too
+        for sample_index in range(1, num_samples):
+            for summary_col, column in enumerate(values):
+                value = column[sample_index]
+                if isinstance(value, str):
+                    worksheet.write_string(sample_index + 1, summary_col, value)
+                else:
+                    worksheet.write_number(sample_index + 1, summary_col, value)
+    set_column_widths(worksheet, plan.summary.get('column_widths', []))
+
+
+#table mode, one table row per replicate with the replicate row formulas as calculated columns
+#so each formula is defined once per column, the total row averages every column
+#columns derived from the sample averages (see LayoutPlan.derived_columns) are left to the sample table
+def write_analysis_table(worksheet, plan, labels, formats, progress=None):
+    set_column_widths(worksheet, plan.column_widths)
+    positions = {col_num: position for position, col_num in enumerate(plan.table_columns())}
+    #sample ids and prefilled values, the calculated columns are filled in by add_table
+    prefill = [(rep_idx, positions[col_num], value) for (rep_idx, col_num), value in sorted(plan.prefill.items())
+               if rep_idx < plan.replicates and col_num in positions]
+    row_num = 1
+    for sample_index, label in enumerate(labels, 1):
+        for replicate in range(plan.replicates):
+            worksheet.write_string(row_num, 0, label)
+            for rep_idx, position, value in prefill:
+                if rep_idx == replicate:
+                    worksheet.write(row_num, position, value)
+            row_num += 1
+        if progress and (sample_index % CHUNK_SAMPLES == 0 or sample_index == len(labels)):
+            progress(sample_index, len(labels))
+
+    formulas = plan.table_formulas(ANALYSIS_TABLE)
+    columns = [{'header': plan.columns[0], 'total_string': 'Average'}]
+    for col_num in plan.table_columns()[1:]:
+        column = {'header': plan.columns[col_num], 'total_function': 'average'}
+        if col_num in formulas:
+            column['formula'] = formulas[col_num]
+        columns.append(column)
+    worksheet.add_table(0, 0, row_num, len(columns) - 1,
+                        {'name': ANALYSIS_TABLE, 'columns': columns, 'total_row': True})
+
+
+#table mode, one row per sample averaging its replicates in the analysis table,
+#followed by the columns block mode works out from those averages
+def write_sample_table(worksheet, plan, labels, formats):
+    sample_id = plan.columns[0]
+    columns = [{'header': sample_id}]
+    for col_num in plan.averaged_columns():
+        columns.append({'header': plan.columns[col_num],
+                        'formula': f'=AVERAGEIFS({table_column(ANALYSIS_TABLE, plan.columns[col_num])},'
+                                   f'{table_column(ANALYSIS_TABLE, sample_id)},'
+                                   f'{SAMPLE_TABLE}[@{structured_column(sample_id)}])'})
+    for col_num, formula in plan.sample_table_formulas(SAMPLE_TABLE).items():
+        columns.append({'header': plan.columns[col_num], 'formula': formula})
+    for row_num, label in enumerate(labels, 1):
+        worksheet.write_string(row_num, 0, label)
+    worksheet.add_table(0, 0, len(labels), len(columns) - 1, {'name': SAMPLE_TABLE, 'columns': columns})
+    for col_num, column in enumerate(columns):
+        worksheet.set_column(col_num, col_num, max(len(column['header']), 10))
+
+
+#write a standards sheet from its spec
+def write_standard_sheet(worksheet, sheet, formats):
+    #collect the cells first so they are written row by row
+    cells = {}
+    for start_row, start_col, rows, fmt in sheet['cells']:
+        for row_num, row_data in enumerate(rows):
+            for col_num, cell_data in enumerate(row_data):
+                cells[(start_row + row_num, start_col + col_num)] = (cell_data, formats.get(fmt))
+    for (row_num, col_num), (cell_data, cell_format) in sorted(cells.items()):
+        worksheet.write(row_num, col_num, cell_data, cell_format)
+    set_column_widths(worksheet, sheet.get('column_widths', []))
+
+
+#add the QC and border rules of a standards sheet and return how many were added
+def add_standard_rules(worksheet, sheet, formats):
+    rule_count = 0
+    #green/red for in/out of range
+    for cell, low, high, _ in sheet.get('qc_limits', []):
+        worksheet.conditional_format(cell, {'type': 'cell', 'criteria': 'between',
+                                            'minimum': low, 'maximum': high, 'format': formats['green']})
+        worksheet.conditional_format(cell, {'type': 'cell', 'criteria': 'not between',
+                                            'minimum': low, 'maximum': high, 'format': formats['red']})
+        rule_count += 2
+
+    for border in sheet.get('borders', []):
+        cell_range, fmt = border[:2]
+        types = border[2] if len(border) > 2 else BOTH
+        for cf_type in types:
+            worksheet.conditional_format(cell_range, {'type': cf_type, 'format': formats[fmt]})
+            rule_count += 1
+    return rule_count
+
+
+#name offered to the user when downloading a template
+def template_filename(instrument):
+    return f'{instrument}_data_template.xlsx'
+
+
+#names for a list of (instrument, number of samples) jobs, the sample count is added when an
+#instrument appears more than once and a running number when the same job does
+def job_filenames(jobs):
+    instruments = [instrument for instrument, _ in jobs]
+    seen = {}
+    names = []
+    for instrument, num_request in jobs:
+        if jobs.count((instrument, num_request)) > 1:
+            seen[(instrument, num_request)] = copy = seen.get((instrument, num_request), 0) + 1
+            names.append(f'{instrument}_{num_request}_samples_{copy}_data_template.xlsx')
+        elif instruments.count(instrument) > 1:
+            names.append(f'{instrument}_{num_request}_samples_data_template.xlsx')
+        else:
+            names.append(template_filename(instrument))
+    return names
+
+
+def new_workbook(output, streaming):
+    if streaming:
+        return xlsxwriter.Workbook(output, {'constant_memory': True})
+    #keep everything in memory so no temporary files are left behind
+    return xlsxwriter.Workbook(output, {'in_memory': True})
+
+
+#write every (name, write function, rule function, args) sheet in order, then close the workbook
+def write_sheets(workbook, sheets, formats, timer, stats):
+    sheet_writes = stats.setdefault('sheet_writes', {})
+    rule_counts = stats.setdefault('conditional_formats', {})
+    for sheet_name, write_sheet, add_rules, args in sheets:
+        with timer.phase('write'):
+            worksheet = workbook.add_worksheet(sheet_name, worksheet_class=TemplateWorksheet)
+            write_sheet(worksheet, *args, formats)
+        with timer.phase('conditional_formats'):
+            rule_counts[sheet_name] = add_rules(worksheet, *args, formats) if add_rules else 0
+        sheet_writes[sheet_name] = sheet_writes.get(sheet_name, 0) + 1
+
+    #close the workbook and save Excel file
+    with timer.phase('close'):
+        workbook.close()
+
+
+#write the workbook for an instrument into output, a path or a binary file-like object
+#stats (optional dict) is filled with the number of times each sheet was serialized ('sheet_writes'),
+#the number of conditional format rules on each sheet ('conditional_formats') and the seconds spent
+#in each phase ('phases'), the timings are also logged
+#streaming flushes every row to disk as soon as it is written (xlsxwriter constant_memory) so
+#peak memory stays flat however many samples are requested
+#table lays the replicates out as an Excel table with calculated columns instead of sample blocks,
+#xlsxwriter can't write tables in constant_memory mode so it can't be combined with streaming
+#replicates (optional) is a tidy table of entered values like the one exports.read_export returns,
+#the template then gets one block per sample of it with the values and the formula results filled in
+#progress (optional) is called with the number of sample blocks written so far and the total, it may raise
+#to stop the build (see jobs.py)
+#first_sample leaves out the samples before it, only incremental.py uses the partial workbook this makes
+#stable_formats numbers the formats in the order they were added rather than the order of their first use,
+#streaming flushes the last row of a sheet at close so a partial build would otherwise number them differently
+#labels (optional, e.g. from manifest.read_manifest) replace 'Sample 1', 'Sample 2', ... and set the number of
+#samples, metadata ({column: values}) adds a Samples sheet listing them
+def build_workbook(instrument, num_request, output, stats=None, streaming=False, table=False, replicates=None,
+                   progress=None, first_sample=0, stable_formats=False, labels=None, metadata=None):
+    if streaming and table:
+        raise ValueError('Table mode cannot be combined with streaming')
+    if table and replicates is not None:
+        raise ValueError('Table mode cannot be prefilled')
+    if first_sample and (table or replicates is not None):
+        raise ValueError('Only plain sample block templates can be built in part')
+    if labels is not None and replicates is not None:
+        raise ValueError('Prefilled templates take their sample ids from the replicates')
+    if stats is None:
+        stats = {}
+    timer = PhaseTimer(stats.setdefault('phases', {}))
+
+    #block rows are built lazily while they are written, so this only covers compiling the layout
+    with timer.phase('layout'):
+        plan = compile_layout(instrument)
+        if labels is not None:
+            num_request = len(labels)
+            results = None
+        elif replicates is None:
+            labels = sample_labels(num_request)
+            results = None
+        else:
+            #pandas is only loaded for prefilled templates
+            from calculations import block_results
+            labels, results = block_results(plan, replicates)
+            num_request = len(labels)
+            if not num_request:
+                raise ValueError('No samples to prefill')
+        check_row_limit(plan, num_request, table)
+
+    with timer.phase('formats'):
+        workbook = new_workbook(output, streaming)
+        formats = add_formats(workbook, plan)
+        if stable_formats:
+            for cell_format in formats.values():
+                cell_format._get_xf_index()
+
+    if table:
+        sheets = [('Analysis', functools.partial(write_analysis_table, progress=progress), None, (plan, labels))]
+        if plan.averaged_columns() and plan.replicates > 1:
+            sheets.append(('Sample Averages', write_sample_table, None, (plan, labels)))
+        layout = sheet_layout(plan, 'Analysis', table=True)
+    else:
+        sheets = [('Analysis', functools.partial(write_analysis_sheet, results=results, progress=progress,
+                                                 first_sample=first_sample), None, (plan, labels))]
+        if plan.summary:
+            sheets.append(('Summary Analysis', functools.partial(write_summary_sheet, results=results), None,
+                           (plan, labels)))
+        layout = sheet_layout(plan, 'Analysis', summary_name='Summary Analysis' if plan.summary else None)
+    if metadata:
+        sheets.append((REGISTER_SHEET, functools.partial(write_register_sheet, metadata=metadata), None, (labels,)))
+    for sheet in plan.sheets:
+        sheets.append((sheet['name'], write_standard_sheet, add_standard_rules, (sheet,)))
+    add_layout_sheet(workbook, sheets, layout_manifest(num_request, [layout], REGISTER_SHEET if metadata else None))
+
+    write_sheets(workbook, sheets, formats, timer, stats)
+
+    log_event('build', instrument=instrument, samples=int(num_request), streaming=streaming, table=table,
+              prefilled=replicates is not None, seconds=round(timer.total(), 4), phases=timer.rounded())
+    return stats
+
+
+#build the workbook and return its bytes, each call gets its own buffer
+def generate_excel_file(instrument, num_request, stats=None, streaming=False, table=False, replicates=None,
+                        progress=None, labels=None, metadata=None):
+    output = io.BytesIO()
+    build_workbook(instrument, num_request, output, stats, streaming, table, replicates, progress,
+                   labels=labels, metadata=metadata)
+    return output.getvalue()
+
+
+#names of an instrument's Analysis and Summary sheets in a combined workbook
+def combined_sheet_names(instrument):
+    return f'{short_names[instrument]} Analysis', f'{short_names[instrument]} Summary'
+
+
+#the sample register, one row per sample with its id and any metadata from a manifest ({column: values}),
+#in a combined workbook sample ids typed here show up on every Analysis sheet
+def write_register_sheet(worksheet, labels, formats, metadata=None):
+    metadata = metadata or {}
+    worksheet.set_column(0, len(metadata), 20)
+    worksheet.write_row(0, 0, ['Sample ID', *metadata], formats['bold'])
+    columns = list(metadata.values())
+    #a row at a time, constant memory workbooks flush every row before the one being written
+    for sample_index in range(len(labels)):
+        row_num = sample_index + 1
+        worksheet.write_string(row_num, 0, labels[sample_index])
+        for col_num, values in enumerate(columns, 1):
+            value = values[sample_index]
+            if value is None:
+                continue
+            if isinstance(value, str):
+                worksheet.write_string(row_num, col_num, value)
+            else:
+                worksheet.write_number(row_num, col_num, value)
+
+
+#where everything of an instrument's sheets is, so readers find any sample without scanning for it
+#rows are 1-based, sample i (from 0) starts on first_row + i * stride with its replicates one row each and
+#the stat rows at the listed offsets from its first replicate, the sample id is in the first column
+def sheet_layout(plan, sheet_name, table=False, summary_name=None):
+    layout = {'sheet': sheet_name, 'instrument': plan.instrument, 'layout_version': layout_version(plan.instrument),
+              'columns': plan.columns, 'first_row': 2, 'replicates': plan.replicates}
+    if table:
+        layout.update(layout='table', table=ANALYSIS_TABLE, stride=plan.replicates,
+                      columns=[plan.columns[col_num] for col_num in plan.table_columns()])
+        return layout
+    layout.update(layout='blocks', stride=plan.stride,
+                  stats={name: plan.stat_row(0, name) - plan.first_row(0) for name in plan.stat_names})
+    if summary_name:
+        layout['summary'] = {'sheet': summary_name, 'first_row': 2, 'stat': plan.summary['stat'],
+                             'columns': [plan.columns[0]] + [plan.columns[col_num]
+                                                             for col_num in plan.summary_columns()]}
+    return layout
+
+
+def layout_manifest(num_request, layouts, register=None):
+    manifest = {'manifest': LAYOUT_MANIFEST_VERSION, 'samples': int(num_request), 'sheets': layouts}
+    if register:
+        manifest['register'] = register
+    return manifest
+
+
+def write_layout_sheet(worksheet, manifest, formats):
+    worksheet.write_string(0, 0, json.dumps(manifest, ensure_ascii=False, separators=(',', ':')))
+    worksheet.hide()
+
+
+#the manifest sheet goes last and is hidden, the sample count is its only part that changes with the batch
+def add_layout_sheet(workbook, sheets, manifest):
+    sheets.append((LAYOUT_SHEET, write_layout_sheet, None, (manifest,)))
+    workbook.define_name(LAYOUT_NAME, f"='{LAYOUT_SHEET}'!$A$1")
+
+
+#name of a standards sheet of a combined workbook when another instrument already has a different sheet of
+#that name, the instrument's short name is added or, when that makes it too long for Excel, a number,
+#taken holds the names of the workbook's sheets in lower case (Excel doesn't tell them apart by case)
+def standard_sheet_name(name, instrument, taken):
+    candidate = f'{name} ({short_names[instrument]})'
+    number = 2
+    while len(candidate) > EXCEL_MAX_SHEET_NAME or candidate.lower() in taken:
+        suffix = f' ({number})'
+        candidate = name[:EXCEL_MAX_SHEET_NAME - len(suffix)].rstrip() + suffix
+        number += 1
+    return candidate
+
+
+#progress of one Analysis sheet of a combined workbook counted over the blocks of every sheet
+def sheet_progress(progress, sheet_index, num_sheets):
+    def report(done, total):
+        progress(sheet_index * total + done, num_sheets * total)
+    return report
+
+
+#one workbook for a batch of samples analyzed on several instruments, written in a single pass:
+#a register sheet with the sample ids, an Analysis (and Summary) sheet per instrument and the standards
+#sheets, all sharing one set of formats, standards sheets two instruments have in common are written once
+#labels and metadata (optional) come from a sample manifest as in build_workbook
+def build_combined_workbook(instruments, num_request, output, stats=None, streaming=False, progress=None,
+                            labels=None, metadata=None):
+    if not instruments:
+        raise ValueError('No instruments to combine')
+    if len(set(instruments)) != len(instruments):
+        raise ValueError('Each instrument can only appear once in a combined workbook')
+    if stats is None:
+        stats = {}
+    timer = PhaseTimer(stats.setdefault('phases', {}))
+
+    with timer.phase('layout'):
+        plans = [compile_layout(instrument) for instrument in instruments]
+        if labels is None:
+            labels = sample_labels(num_request)
+        num_request = len(labels)
+        for plan in plans:
+            check_row_limit(plan, num_request)
+
+    with timer.phase('formats'):
+        workbook = new_workbook(output, streaming)
+        formats = add_formats(workbook, *plans)
+
+    sheets = [(REGISTER_SHEET, functools.partial(write_register_sheet, metadata=metadata), None, (labels,))]
+    layouts = []
+    for sheet_index, plan in enumerate(plans):
+        analysis_name, summary_name = combined_sheet_names(plan.instrument)
+        report = sheet_progress(progress, sheet_index, len(plans)) if progress else None
+        sheets.append((analysis_name, functools.partial(write_analysis_sheet, progress=report, register=True), None,
+                       (plan, labels)))
+        if plan.summary:
+            sheets.append((summary_name, functools.partial(write_summary_sheet, analysis_name=analysis_name), None,
+                           (plan, labels)))
+        layouts.append(sheet_layout(plan, analysis_name, summary_name=summary_name if plan.summary else None))
+    #the manifest entry of each instrument names the sheets its standards went on
+    standards = {}
+    for plan, layout in zip(plans, layouts):
+        layout['standards'] = {}
+        for sheet in plan.sheets:
+            name = next((name for name, written in standards.items() if written == sheet), None)
+            if name is None:
+                name = sheet['name']
+                if name in standards:
+                    name = standard_sheet_name(name, plan.instrument, {existing.lower() for existing, *_ in sheets})
+                standards[name] = sheet
+                sheets.append((name, write_standard_sheet, add_standard_rules, (sheet,)))
+            layout['standards'][sheet['name']] = name
+    add_layout_sheet(workbook, sheets, layout_manifest(num_request, layouts, REGISTER_SHEET))
+
+    write_sheets(workbook, sheets, formats, timer, stats)
+
+    log_event('build', instrument=list(instruments), samples=int(num_request), streaming=streaming, combined=True,
+              seconds=round(timer.total(), 4), phases=timer.rounded())
+    return stats
+
+
+def generate_combined_file(instruments, num_request, stats=None, streaming=False, progress=None, labels=None,
+                           metadata=None):
+    output = io.BytesIO()
+    build_combined_workbook(instruments, num_request, output, stats, streaming, progress, labels, metadata)
+    return output.getvalue()
@@ -0,0 +1,352 @@
+import array
+import collections
+import datetime
+import io
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+
+from generator import build_workbook
+from layouts import compile_layout, layout_version
+from timing import PhaseTimer
+
+#compressed bytes of the templates kept, the least recently built instruments are dropped past it
+#every process that builds templates (the app and each batch worker) keeps its own store
+DEFAULT_MAX_BYTES = int(os.environ.get('TEMPLATE_INCREMENTAL_MAX_BYTES', 16 * 1024 * 1024))
+#samples compressed together, a count that ends inside a chunk only compresses that chunk again
+CHUNK_SAMPLES = 256
+#zlib's default level, the one xlsxwriter's zip files use
+COMPRESS_LEVEL = 6
+
+dimension_pattern = re.compile(rb'(<dimension ref="[A-Z]+\d+:[A-Z]+)\d+("/>)')
+#the document properties hold the time the workbook was made, they are written again on every assemble
+CORE_PROPERTIES = 'docProps/core.xml'
+core_date_pattern = re.compile(rb'(<dcterms:(?:created|modified)\b[^>]*>)[^<]*')
+#sample counts written in sheets that keep their size, the summary formulas and the layout manifest
+count_patterns = [re.compile(rb'(SEQUENCE\()\d+'), re.compile(rb'("samples":)\d+')]
+
+
+#1-based sheet row where the rows of a sample start, a repeated header belongs to the block below it
+def analysis_start_row(plan, sample_index):
+    return plan.first_row(sample_index) + 1 - (1 if sample_index and plan.repeat_header else 0)
+
+
+#sheets whose rows grow with the sample count, as (path in the package, start row function)
+#xlsxwriter names the sheet xml after the order the sheets were added, the Analysis sheet always comes first
+def sample_sheets(plan):
+    return [('xl/worksheets/sheet1.xml', analysis_start_row)]
+
+
+#the other sheets that mention the sample count, the Summary Analysis sheet and the layout manifest
+def is_counted(filename, data):
+    return filename.startswith('xl/worksheets/') and any(pattern.search(data) for pattern in count_patterns)
+
+
+#the created and modified times set to now, in the format xlsxwriter writes them
+def stamp_core_properties(xml):
+    now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ').encode()
+    return core_date_pattern.sub(lambda match: match.group(1) + now, xml)
+
+
+def count_samples(xml, num_request):
+    for pattern in count_patterns:
+        xml = pattern.sub(lambda match: match.group(1) + b'%d' % num_request, xml)
+    return xml
+
+
+#cut the xml of a streamed worksheet into the part before the rows of the first sample, the rows of every
+#sample from first_sample on and the part after them, xlsxwriter writes rows in order with r first
+def split_sheet(xml, plan, start_row, first_sample, num_samples):
+    positions = []
+    position = 0
+    for sample_index in range(first_sample, num_samples):
+        position = xml.index(b'<row r="%d"' % start_row(plan, sample_index), position)
+        positions.append(position)
+    end = xml.rindex(b'</sheetData>')
+    positions.append(end)
+    samples = [xml[start:stop] for start, stop in zip(positions, positions[1:])]
+    return xml[:positions[0]], samples, xml[end:]
+
+
+#deflate data that can be joined to other segments, it ends on a byte boundary without a final block
+def deflate_segment(data):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+#the last segment of a part, it closes the deflate stream
+def deflate_final(data):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+
+
+def inflate(data):
+    return zlib.decompressobj(-15).decompress(data)
+
+
+def gf2_matrix_times(matrix, vector):
+    total = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+
+def gf2_matrix_square(matrix):
+    return [gf2_matrix_times(matrix, matrix[row]) for row in range(32)]
+
+
+#crc32 of two pieces of data joined from the crc32 of each and the length of the second, as zlib's
+#crc32_combine which python doesn't expose, only used once per assembled sheet
+def crc32_combine(crc1, crc2, length2):
+    if length2 == 0:
+        return crc1
+    odd = [0xedb88320] + [1 << row for row in range(31)]
+    even = gf2_matrix_square(odd)
+    odd = gf2_matrix_square(even)
+    while True:
+        even = gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+#a part kept compressed as (crc, size, segments)
+def pack(data):
+    return zlib.crc32(data), len(data), [deflate_final(data)]
+
+
+#number of the last row written in the xml of some samples
+def last_row(xml):
+    start = xml.rindex(b'<row r="') + len(b'<row r="')
+    return xml[start:xml.index(b'"', start)]
+
+
+#add the rows of samples to the compressed chunks of a sheet, every chunk keeps the length of each of its
+#samples, the crc32 and length of the sheet rows up to its end and the number of its last row
+def add_chunks(chunks, samples):
+    crc, end = (chunks[-1]['crc'], chunks[-1]['end']) if chunks else (0, 0)
+    for start in range(0, len(samples), CHUNK_SAMPLES):
+        block = samples[start:start + CHUNK_SAMPLES]
+        data = b''.join(block)
+        crc = zlib.crc32(data, crc)
+        end += len(data)
+        chunks.append({'data': deflate_segment(data), 'lengths': array.array('L', map(len, block)),
+                       'crc': crc, 'end': end, 'last_row': last_row(block[-1])})
+    return chunks
+
+
+#the rows of every sample of a chunk
+def chunk_samples(chunk):
+    data = inflate(chunk['data'])
+    samples = []
+    position = 0
+    for length in chunk['lengths']:
+        samples.append(data[position:position + length])
+        position += length
+    return samples
+
+
+#the sheet cut to num_request samples as (crc, size, segments), only a chunk the count ends inside is
+#compressed again, the rest of the rows are reused as they are
+def assemble_sheet(sheet, num_request):
+    num_chunks, rest = divmod(num_request, CHUNK_SAMPLES)
+    chunks = sheet['chunks'][:num_chunks]
+    partial = b''.join(chunk_samples(sheet['chunks'][num_chunks])[:rest]) if rest else b''
+    row = last_row(partial) if rest else chunks[-1]['last_row']
+    head = dimension_pattern.sub(lambda match: match.group(1) + row + match.group(2), sheet['head'], count=1)
+    crc = zlib.crc32(head)
+    size = len(head)
+    if chunks:
+        crc = crc32_combine(crc, chunks[-1]['crc'], chunks[-1]['end'])
+        size += chunks[-1]['end']
+    crc = zlib.crc32(sheet['tail'], zlib.crc32(partial, crc))
+    size += len(partial) + len(sheet['tail'])
+    segments = [deflate_segment(head), *(chunk['data'] for chunk in chunks)]
+    if partial:
+        segments.append(deflate_segment(partial))
+    segments.append(deflate_final(sheet['tail']))
+    return crc, size, segments
+
+
+#time and date of a zip entry in the ms-dos format
+def dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+#a zip package from (filename, date_time, crc, size, segments) entries whose data is already deflated,
+#zipfile can only write data it compresses itself
+def write_package(entries):
+    output = io.BytesIO()
+    directory = []
+    for filename, date_time, crc, size, segments in entries:
+        name = filename.encode('utf-8')
+        compressed_size = sum(map(len, segments))
+        dos_time, dos_date = dos_date_time(date_time)
+        offset = output.tell()
+        output.write(struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, 0, zipfile.ZIP_DEFLATED, dos_time, dos_date, crc,
+                                 compressed_size, size, len(name), 0))
+        output.write(name)
+        for segment in segments:
+            output.write(segment)
+        directory.append(struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20, 0, zipfile.ZIP_DEFLATED, dos_time,
+                                     dos_date, crc, compressed_size, size, len(name), 0, 0, 0, 0, 0, offset) + name)
+    start = output.tell()
+    for record in directory:
+        output.write(record)
+    output.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(directory), len(directory),
+                             output.tell() - start, start, 0))
+    return output.getvalue()
+
+
+#compressed bytes a template takes in the store
+def state_bytes(state):
+    total = sum(len(segment) for _, _, data, packed in state['parts'] if packed for segment in packed[2])
+    total += sum(len(data) for _, _, data, packed in state['parts'] if data is not None)
+    for sheet in state['sheets'].values():
+        total += len(sheet['head']) + len(sheet['tail'])
+        total += sum(len(chunk['data']) + chunk['lengths'].itemsize * len(chunk['lengths'])
+                     for chunk in sheet['chunks'])
+    return total
+
+
+class BlockStore:
+    #the last plain template built for each instrument, with the rows of its sample sheets compressed a chunk of
+    #samples at a time, a new sample count only writes the blocks it adds and reuses the compressed rows it
+    #shares with the stored one, the store is bounded by the compressed bytes it holds
+    #templates are streamed so strings are written inline and the rows of a sample never depend on the others
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.states = collections.OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+            self.total_bytes = 0
+
+    #workbook bytes for the instrument and sample count, stats (optional dict) records how it was built
+    #('incremental': full, append, truncate or same) along with the usual build stats
+    def build(self, instrument, num_request, stats=None, progress=None):
+        if stats is None:
+            stats = {}
+        num_request = int(num_request)
+        plan = compile_layout(instrument)
+        version = layout_version(instrument)
+        with self.lock:
+            state = self.states.get(instrument)
+            if state is not None:
+                self.states.move_to_end(instrument)
+        if state is None or state['version'] != version:
+            stats['incremental'] = 'full'
+            #a full build is served as written, it is only cut into the store
+            state, data = self.build_full(instrument, plan, version, num_request, stats, progress)
+        else:
+            state = self.resize(state, instrument, plan, num_request, stats, progress)
+            timer = PhaseTimer(stats.setdefault('phases', {}))
+            with timer.phase('assemble'):
+                data = self.assemble(state, num_request)
+        self.keep(instrument, state)
+        return data
+
+    def keep(self, instrument, state):
+        with self.lock:
+            old = self.states.pop(instrument, None)
+            if old is not None:
+                self.total_bytes -= old['bytes']
+            if state['bytes'] > self.max_bytes:
+                return
+            self.states[instrument] = state
+            self.total_bytes += state['bytes']
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.states.popitem(last=False)
+                self.total_bytes -= evicted['bytes']
+
+    def build_full(self, instrument, plan, version, num_request, stats, progress):
+        output = io.BytesIO()
+        build_workbook(instrument, num_request, output, stats, streaming=True, progress=progress,
+                       stable_formats=True)
+        sheets = {}
+        parts = []
+        with zipfile.ZipFile(output) as archive:
+            for path, start_row in sample_sheets(plan):
+                head, samples, tail = split_sheet(archive.read(path), plan, start_row, 0, num_request)
+                sheets[path] = {'head': head, 'tail': tail, 'chunks': add_chunks([], samples)}
+            for info in archive.infolist():
+                #the sample sheets are only kept cut into their samples, the sheets that mention the sample count
+                #and the document properties are kept as they are since they change, the other parts are kept
+                #compressed
+                if info.filename in sheets:
+                    parts.append((info.filename, info.date_time, None, None))
+                    continue
+                data = archive.read(info)
+                if info.filename == CORE_PROPERTIES or is_counted(info.filename, data):
+                    parts.append((info.filename, info.date_time, data, None))
+                else:
+                    parts.append((info.filename, info.date_time, None, pack(data)))
+        state = {'version': version, 'parts': parts, 'sheets': sheets, 'samples': num_request}
+        state['bytes'] = state_bytes(state)
+        return state, output.getvalue()
+
+    #keep the blocks both counts share, write only the blocks past the stored ones
+    def resize(self, state, instrument, plan, num_request, stats, progress):
+        stored = state['samples']
+        if num_request <= stored:
+            stats['incremental'] = 'same' if num_request == stored else 'truncate'
+            if progress:
+                progress(num_request, num_request)
+            return state
+        stats['incremental'] = 'append'
+        output = io.BytesIO()
+        build_workbook(instrument, num_request, output, stats, streaming=True, progress=progress,
+                       first_sample=stored, stable_formats=True)
+        with zipfile.ZipFile(output) as archive:
+            sheets = {}
+            for path, start_row in sample_sheets(plan):
+                sheet = state['sheets'][path]
+                _, added, _ = split_sheet(archive.read(path), plan, start_row, stored, num_request)
+                chunks = list(sheet['chunks'])
+                #a chunk that isn't full takes the first of the added samples
+                if len(chunks[-1]['lengths']) < CHUNK_SAMPLES:
+                    added = chunk_samples(chunks.pop()) + added
+                sheets[path] = dict(sheet, chunks=add_chunks(chunks, added))
+        state = dict(state, sheets=sheets, samples=num_request)
+        state['bytes'] = state_bytes(state)
+        return state
+
+    #the package with the sample sheets cut to num_request samples and the document properties stamped with the
+    #time it is assembled, every other part is the stored one, xlsxwriter dates every zip entry 1980-01-31 so the
+    #stored entry dates are the ones a new build would have
+    def assemble(self, state, num_request):
+        entries = []
+        for filename, date_time, data, packed in state['parts']:
+            if filename in state['sheets']:
+                packed = assemble_sheet(state['sheets'][filename], num_request)
+            elif filename == CORE_PROPERTIES:
+                packed = pack(stamp_core_properties(data))
+            elif data is not None:
+                packed = pack(count_samples(data, num_request))
+            entries.append((filename, date_time, *packed))
+        return write_package(entries)
+
+
+#store shared by every session in this process
+block_store = BlockStore()
@@ -0,0 +1,134 @@
+import concurrent.futures
+import os
+import threading
+import time
+import uuid
+
+from batch import generate_batch
+from generator import COMBINED_FILENAME, generate_combined_file, generate_excel_file, template_filename
+from shards import archive_filename, generate_sharded, needs_sharding
+from template_cache import cached_excel_file
+from timing import log_event
+
+#generation jobs run at once, later ones wait in the queue
+DEFAULT_JOB_WORKERS = int(os.environ.get('TEMPLATE_JOB_WORKERS', 0)) or 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+class Job:
+    #a template or batch built in the background, the streamlit session keeps the job object so
+    #its progress and result survive reruns, the worker thread only ever writes to it
+
+    def __init__(self, description, total, filename=None):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.filename = filename
+        self.total = total
+        self.done = 0
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.stats = {}
+        self.seconds = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    #progress callback handed to the generator, raising here is what stops a cancelled build
+    def report(self, done, total):
+        if self.cancel_event.is_set():
+            raise GenerationCancelled()
+        self.done = done
+        self.total = total
+
+    def fraction(self):
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+        #a job still in the queue never starts
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def run(self, function, *args, **kwargs):
+        if self.cancel_event.is_set():
+            self.status = 'cancelled'
+            return
+        self.status = 'running'
+        start = time.perf_counter()
+        try:
+            self.result = function(*args, progress=self.report, **kwargs)
+            self.done = self.total
+            self.status = 'done'
+        except GenerationCancelled:
+            self.status = 'cancelled'
+        except Exception as e:
+            self.error = e
+            self.status = 'failed'
+        self.seconds = time.perf_counter() - start
+        log_event('job', description=self.description, status=self.status, blocks=self.done,
+                  seconds=round(self.seconds, 4), cache=self.stats.get('cache'))
+
+
+#the pool is shared by every session in this process, threads keep the job objects in memory
+#so the page reads progress straight from them
+def get_executor(max_workers=DEFAULT_JOB_WORKERS):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix='template-job')
+        return _executor
+
+
+def submit(job, function, *args, **kwargs):
+    job.future = get_executor().submit(job.run, function, *args, **kwargs)
+    return job
+
+
+#one template in the background, through the shared cache unless it is labelled from a manifest,
+#a batch too big for one workbook is split into shards instead
+def submit_template(instrument, num_request, table=False, labels=None, metadata=None):
+    if labels is not None:
+        num_request = len(labels)
+    if needs_sharding(instrument, num_request, table=table):
+        return submit_sharded(instrument, num_request, table, labels, metadata)
+    job = Job(f'{instrument} with {int(num_request)} samples', int(num_request), template_filename(instrument))
+    if labels is not None:
+        return submit(job, generate_excel_file, instrument, num_request, job.stats, table=table, labels=labels,
+                      metadata=metadata)
+    return submit(job, cached_excel_file, instrument, num_request, job.stats, table)
+
+
+#the shards of one template and their index in a zip, built on the process pool
+def submit_sharded(instrument, num_request, table=False, labels=None, metadata=None):
+    if labels is not None:
+        num_request = len(labels)
+    job = Job(f'{instrument} with {int(num_request)} samples', int(num_request), archive_filename(instrument))
+    return submit(job, generate_sharded, instrument, num_request, table=table, labels=labels, metadata=metadata)
+
+
+#a batch of (instrument, number of samples) jobs in the background, built on the process pool
+def submit_batch(jobs, labels=None, metadata=None):
+    if labels is not None:
+        jobs = [(instrument, len(labels)) for instrument, _ in jobs]
+    job = Job(f'{len(jobs)} templates', sum(int(num_request) for _, num_request in jobs), 'data_templates.zip')
+    return submit(job, generate_batch, jobs, labels=labels, metadata=metadata)
+
+
+#one workbook with a sheet per instrument for the same samples
+def submit_combined(instruments, num_request, labels=None, metadata=None):
+    if labels is not None:
+        num_request = len(labels)
+    job = Job(f'{len(instruments)} instruments with {int(num_request)} samples', int(num_request) * len(instruments),
+              COMBINED_FILENAME)
+    return submit(job, generate_combined_file, instruments, num_request, job.stats, labels=labels,
+                  metadata=metadata)
@@ -0,0 +1,610 @@
+import functools
+import hashlib
+import re
+import string
+
+#define instruments and column names
+instrument_columns = {
+    'Density Meter (Duplicate Analysis)': ['Sample ID', 'Density (g/mL)', 'Temperature (°C)'],
+    'Density Meter (Singlet Analysis)': ['Sample ID', 'Density (g/mL)', 'Temperature (°C)'],
+    'LECO CHN (Bio-Oil Method, Triplicate Analysis)': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)'],
+    'LECO CHN (Bio-Oil Method, Duplicate Analysis)': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)'],
+    'LECO CHN (Aqueous Method)': ['Sample ID', 'Mass (g)', 'C%'],
+    'Karl Fischer': ['Sample ID','~Vol(μL)', 'Mass(g)', 'Titrant(mL)', 'H2O%'],
+    'KF & LECO CHN Combined': ['Sample ID', 'Mass (g)', 'C%', 'H%', 'N%','O% (diff)', 'Water', 'C% Dry Basis', 'H% Dry Basis', 'O% Dry Basis'],
+    'Viscometer': ['Sample ID', 'Viscosity (cP)','Torque (%)','Speed (rpm)', 'Temperature (°C)'],
+    'Acids Titration': ['Sample ID', 'CAN mol/kg', 'TAN mol/kg', 'PhAN mol/kg', 'Carboxylic Acid Number mg KOH/g','Total Acid Number mg KOH/g', 'Phenolic Acid Number mg KOH/g'],
+    'Carbonyls Titration': ['Sample ID', 'Carbonyls mol/kg']
+}
+
+#short names for the sheets an instrument gets in a combined workbook, Excel sheet names stop at 31 characters
+short_names = {
+    'Density Meter (Duplicate Analysis)': 'Density Dup',
+    'Density Meter (Singlet Analysis)': 'Density Single',
+    'LECO CHN (Bio-Oil Method, Triplicate Analysis)': 'CHN Bio-Oil Trip',
+    'LECO CHN (Bio-Oil Method, Duplicate Analysis)': 'CHN Bio-Oil Dup',
+    'LECO CHN (Aqueous Method)': 'CHN Aqueous',
+    'Karl Fischer': 'KF',
+    'KF & LECO CHN Combined': 'KF & CHN',
+    'Viscometer': 'Viscometer',
+    'Acids Titration': 'Acids',
+    'Carbonyls Titration': 'Carbonyls',
+}
+
+#families of instruments that measure the same things, each keeps its results in one table of the results store
+instrument_families = {
+    'Density Meter (Duplicate Analysis)': 'density',
+    'Density Meter (Singlet Analysis)': 'density',
+    'LECO CHN (Bio-Oil Method, Triplicate Analysis)': 'chn',
+    'LECO CHN (Bio-Oil Method, Duplicate Analysis)': 'chn',
+    'LECO CHN (Aqueous Method)': 'chn',
+    'Karl Fischer': 'kf',
+    'KF & LECO CHN Combined': 'chn',
+    'Viscometer': 'viscosity',
+    'Acids Titration': 'titration',
+    'Carbonyls Titration': 'titration',
+}
+
+#a border rule applies a border format to cells whether they are blank or not,
+#rules listed with FILLED only apply to cells that are not blank
+BOTH = ('no_blanks', 'blanks')
+FILLED = ('no_blanks',)
+#rows of an Excel worksheet
+EXCEL_MAX_ROWS = 1048576
+
+
+#standards sheets written next to the Analysis sheet
+#cells are (start row, start col, rows of values, format name), borders are (range, format name[, types])
+#and qc_limits are (cell, low, high, check name) which turn the cell green inside the window and red outside it
+cresol_sheet = {
+    'name': 'Cresol Testing',
+    'cells': [
+        (0, 0, [['Cresol Limit Testing', 'Cresol Measured', 'Average', 'Low-value', 'High-value']], 'bold'),
+        (1, 0, [['Carbon'], ['Hydrogen'], ['Nitrogen'], ['Oxygen']], 'bold'),
+        (1, 1, [
+            ['=C11', 77.7, 77.0, 78.3],
+            ['=D11', 7.5, 7.4, 7.9],
+            ['=E11', 0.03, 0.0, 0.1],
+            ['=F11', 14.8, 14.0, 15.4],
+        ], None),
+        (6, 0, [
+            ['Cresol Triplicate Check', 'Mass (g)', 'C%', 'H%', 'N%', 'O% (diff)'],
+            ['Cresol 1','','','','', '=100-SUM(C8:E8)'],
+            ['Cresol 2','','','','', '=100-SUM(C9:E9)'],
+            ['Cresol 3','','','','', '=100-SUM(C10:E10)'],
+            ['', 'Average', '=AVERAGE(C8:C10)','=AVERAGE(D8:D10)','=AVERAGE(E8:E10)','=AVERAGE(F8:F10)'],
+            ['', 'StDev', '=STDEV(C8:C10)','=STDEV(D8:D10)','=STDEV(E8:E10)','=STDEV(F8:F10)'],
+            ['', 'RSD', '=C12/C11*100','=D12/D11*100','=E12/E11*100','=F12/F11*100'],
+        ], None),
+    ],
+    'column_widths': [(0, 1, len("Cresol Triplicate ")), (1, 1, len("Cresol Measured"))],
+    'qc_limits': [('B2', 77.0, 78.3, 'Carbon'), ('B3', 7.4, 7.9, 'Hydrogen'), ('B5', 14.0, 15.4, 'Oxygen')],
+    'borders': [
+        ('A7:F7', 'header'),
+        ('A13:E13', 'bottom'),
+        ('A10:E10', 'dashed'),
+        ('F8:F9', 'right'),
+        ('F11:F12', 'right'),
+        ('F10', 'side', FILLED),
+        ('F13', 'corner', FILLED),
+    ],
+}
+
+soil_sheet = {
+    'name': 'Soil Testing',
+    'cells': [
+        (0, 0, [['Soil Limit Testing', 'Soil Measured', 'Average', 'Low-value', 'High-value']], 'bold'),
+        (1, 0, [['Carbon']], 'bold'),
+        (1, 1, [['=C8', 0.717, 0.690, 0.744]], None),
+        (3, 0, [
+            ['Soil Triplicate Check', 'Mass (g)', 'C%'],
+            ['Soil 1','',''],
+            ['Soil 2','',''],
+            ['Soil 3','',''],
+            ['', 'Average', '=AVERAGE(C5:C7)'],
+            ['', 'StDev', '=STDEV(C5:C7)'],
+            ['', 'RSD', '=C9/C8*100'],
+        ], None),
+    ],
+    'column_widths': [(0, 1, len("Soil Triplicate ")), (1, 1, len("Soil Measured"))],
+    'qc_limits': [('B2', 0.744, 0.690, 'Carbon')],
+    'borders': [
+        ('A4:C4', 'header'),
+        ('A10:B10', 'bottom'),
+        ('A7:B7', 'dashed'),
+        ('C5:C6', 'right'),
+        ('C8:C9', 'right'),
+        ('C7', 'side'),
+        ('C10', 'corner', FILLED),
+    ],
+}
+
+water_standard_sheet = {
+    'name': 'Water Standard',
+    'cells': [
+        (0, 0, [['Water Standard Check', 'Mass(g)', 'Titrant(mL)', 'H2O%']], 'bold'),
+        (1, 0, [['Water Standard (1)'], ['Water Standard (2)'], ['Water Standard (3)']], 'bold'),
+        (4, 2, [
+            ['Mean%', '=AVERAGE(D2:D4)'],
+            ['StDev%', '=STDEV(D2:D4)'],
+            ['RSD%', '=(D6/D5)*100'],
+        ], None),
+    ],
+    'column_widths': [(0, 0, len("Water Standard Check"))],
+    'qc_limits': [('D7', 0, 1.5, 'RSD%')],
+}
+
+viscosity_standard_sheet = {
+    'name': 'Standard Check',
+    'cells': [
+        (0, 0, [['Standard Check', 'Viscosity (cP)', 'Torque (%)', 'Speed (RPM)', 'Temperature (°C)', 'Spindle']], 'bold'),
+        (1, 0, [['Standard']], 'bold'),
+    ],
+    'column_widths': [(0, 4, len("Temperature (°C)"))],
+}
+
+density_water_sheet = {
+    'name': 'Water Check',
+    'cells': [
+        (0, 0, [['Water Check', 'Density (g/mL)', 'Temperature (°C)']], 'bold'),
+        (1, 0, [['Water (1)'], ['Water (2)']], 'bold'),
+    ],
+    'column_widths': [(0, 2, len("Temperature (°C)"))],
+}
+
+density_singlet_water_sheet = {
+    'name': 'Water Check',
+    'cells': [
+        (0, 0, [['Water Check', 'Density (g/mL)', 'Temperature (°C)']], 'bold'),
+        (1, 0, [['Water']], None),
+    ],
+    'column_widths': [(0, 2, len("Temperature (°C)"))],
+}
+
+vanillic_sheet = {
+    'name': 'Vanillic Validation',
+    'cells': [
+        (0, 0, [['Expected', 'Measured', '% Diff']], None),
+        (1, 0, [
+            [5.77, '', '=(A2-B2)/A2 * 100'],
+            [11.54, '', '=(A3-B3)/A3 * 100'],
+        ], None),
+    ],
+    'qc_limits': [('C2', 5.4815, 6.0585, '% Diff (5.77)'), ('C3', 10.963, 12.117, '% Diff (11.54)')],
+}
+
+bba_sheet = {
+    'name': '4-BBA Validation',
+    'cells': [
+        (0, 0, [['Expected 4-BBA Carbonyls mol/kg', 'Measured 4-BBA Carbonyls mol/kg', '% Diff', 'Range']], None),
+        (1, 0, [
+            [4.7, '', '=ABS(A2-B2)/A2 * 100', '=ABS(B2-B3)'],
+            [4.7, '', '=ABS(A3-B3)/A3 * 100', ''],
+        ], None),
+    ],
+    'column_widths': [(0, 1, len("Measured 4-BBA Carbonyls mol/kg"))],
+    'qc_limits': [('C2', 0, 12.766, '% Diff (1)'), ('C3', 0, 12.766, '% Diff (2)'), ('D2', 0, 0.4, 'Range')],
+}
+
+
+#one layout per instrument, a sample block is the replicate rows followed by the stat rows
+#formulas use {row} for the current row, {first}/{last} for the first and last replicate rows,
+#{label} for the sample label and the stat row names ({average}, {stdev}, ...) for those rows
+#block borders are (first row, first col, last row, last col, format name) counted from the block header row
+#a summary adds a Summary Analysis sheet with one row per sample holding the columns of its stat row that are
+#formulas, column_widths there count the summary columns
+layouts = {
+    'Density Meter (Duplicate Analysis)': {
+        'replicates': 2,
+        'replicate_row': ['{label}', '', ''],
+        'stat_rows': [
+            ('average', ['Mean', '=AVERAGE(B{first}:B{last})', '']),
+            ('stdev', ['StDev', '=STDEV(B{first}:B{last})', '']),
+            ('rsd', ['RSD', '=(B{stdev})/(B{average}) * 100', '']),
+        ],
+        'borders': [
+            (0, 0, 0, 2, 'header'),
+            (5, 0, 5, 1, 'bottom'),
+            (2, 0, 2, 1, 'dashed'),
+            (1, 2, 1, 2, 'right'),
+            (3, 2, 4, 2, 'right'),
+            (2, 2, 2, 2, 'side'),
+            (5, 2, 5, 2, 'corner'),
+        ],
+        'column_widths': [(0, 2, len("Temperature (°C)"))],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(0, 1, len("Density (g/mL)"))],
+        },
+        'sheets': [density_water_sheet],
+    },
+    'Density Meter (Singlet Analysis)': {
+        'replicates': 1,
+        'replicate_row': ['{label}', '', ''],
+        'repeat_header': False,
+        'column_widths': [(0, 2, len("Temperature (°C)"))],
+        'sheets': [density_singlet_water_sheet],
+    },
+    'LECO CHN (Bio-Oil Method, Triplicate Analysis)': {
+        'replicates': 3,
+        'replicate_row': ['{label}','','','','', '=100-SUM(C{row}:E{row})'],
+        'stat_rows': [
+            ('average', ['', 'Average', '=AVERAGE(C{first}:C{last})','=AVERAGE(D{first}:D{last})','=AVERAGE(E{first}:E{last})','=AVERAGE(F{first}:F{last})']),
+            ('stdev', ['', 'StDev', '=STDEV(C{first}:C{last})','=STDEV(D{first}:D{last})','=STDEV(E{first}:E{last})','=STDEV(F{first}:F{last})']),
+            ('rsd', ['', 'RSD', '=(C{stdev})/(C{average}) * 100','=(D{stdev})/(D{average}) * 100','=(E{stdev})/(E{average}) * 100','=(F{stdev})/(F{average}) * 100']),
+        ],
+        'borders': [
+            (0, 0, 0, 5, 'header'),
+            (6, 0, 6, 4, 'bottom'),
+            (3, 0, 3, 4, 'dashed'),
+            (1, 5, 2, 5, 'right'),
+            (4, 5, 5, 5, 'right'),
+            (3, 5, 3, 5, 'side'),
+            (6, 5, 6, 5, 'corner'),
+        ],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(1, 4, len("O% (diff)"))],
+        },
+        'sheets': [cresol_sheet],
+    },
+    'LECO CHN (Bio-Oil Method, Duplicate Analysis)': {
+        'replicates': 2,
+        'replicate_row': ['{label}','','','','', '=100-SUM(C{row}:E{row})'],
+        'stat_rows': [
+            ('average', ['', 'Average', '=AVERAGE(C{first}:C{last})','=AVERAGE(D{first}:D{last})','=AVERAGE(E{first}:E{last})','=AVERAGE(F{first}:F{last})']),
+            ('stdev', ['', 'StDev', '=STDEV(C{first}:C{last})','=STDEV(D{first}:D{last})','=STDEV(E{first}:E{last})','=STDEV(F{first}:F{last})']),
+            ('rsd', ['', 'RSD', '=(C{stdev})/(C{average}) * 100','=(D{stdev})/(D{average}) * 100','=(E{stdev})/(E{average}) * 100','=(F{stdev})/(F{average}) * 100']),
+        ],
+        'borders': [
+            (0, 0, 0, 5, 'header'),
+            (5, 0, 5, 4, 'bottom'),
+            (2, 0, 2, 4, 'dashed'),
+            (0, 5, 1, 5, 'right'),
+            (3, 5, 4, 5, 'right'),
+            (2, 5, 2, 5, 'side'),
+            (5, 5, 5, 5, 'corner'),
+        ],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(1, 4, len("O% (diff)"))],
+        },
+        'sheets': [cresol_sheet],
+    },
+    'LECO CHN (Aqueous Method)': {
+        'replicates': 3,
+        'replicate_row': ['{label}', '', ''],
+        'stat_rows': [
+            ('average', ['', 'Average', '=AVERAGE(C{first}:C{last})']),
+            ('stdev', ['', 'StDev', '=STDEV(C{first}:C{last})']),
+            ('rsd', ['', 'RSD', '=(C{stdev})/(C{average}) * 100']),
+        ],
+        'borders': [
+            (0, 0, 0, 2, 'header'),
+            (6, 0, 6, 1, 'bottom'),
+            (3, 0, 3, 1, 'dashed'),
+            (1, 2, 2, 2, 'right'),
+            (4, 2, 5, 2, 'right'),
+            (3, 2, 3, 2, 'side'),
+            (6, 2, 6, 2, 'corner'),
+        ],
+        'summary': {
+            'stat': 'average',
+        },
+        'sheets': [soil_sheet],
+    },
+    'Karl Fischer': {
+        'replicates': 3,
+        'replicate_row': ['{label}', '', '', '', ''],
+        'stat_rows': [
+            ('average', ['', '', '', 'Mean%', '=AVERAGE(E{first}:E{last})']),
+            ('stdev', ['', '', '', 'StDev%', '=STDEV(E{first}:E{last})']),
+            ('rsd', ['', '', '', 'RSD%', '=(E{stdev})/(E{average}) * 100']),
+        ],
+        'borders': [
+            (0, 0, 0, 4, 'header'),
+            (6, 0, 6, 3, 'bottom'),
+            (3, 0, 3, 3, 'dashed'),
+            (1, 4, 2, 4, 'right'),
+            (4, 4, 5, 4, 'right'),
+            (3, 4, 3, 4, 'side'),
+            (6, 4, 6, 4, 'corner'),
+        ],
+        'summary': {
+            'stat': 'average',
+        },
+        'sheets': [water_standard_sheet],
+    },
+    'KF & LECO CHN Combined': {
+        'replicates': 3,
+        'replicate_row': ['{label}','','','','', '=100-SUM(C{row}:E{row})','','','',''],
+        'stat_rows': [
+            ('average', ['', 'Average', '=AVERAGE(C{first}:C{last})','=AVERAGE(D{first}:D{last})','=AVERAGE(E{first}:E{last})','=AVERAGE(F{first}:F{last})', '=AVERAGE(G{first}:G{last})',
+                         '=(C{average})/(100-G{average})*100','=(D{average}-(G{average}*0.111))/(100-G{average})*100','=(F{average}-(0.889*G{average}))/(100-G{average})*100']),
+            ('stdev', ['', 'StDev', '=STDEV(C{first}:C{last})','=STDEV(D{first}:D{last})','=STDEV(E{first}:E{last})','=STDEV(F{first}:F{last})','=STDEV(G{first}:G{last})','','','']),
+            ('rsd', ['', 'RSD', '=(C{stdev})/(C{average}) * 100','=(D{stdev})/(D{average}) * 100','=(E{stdev})/(E{average}) * 100','=(F{stdev})/(F{average}) * 100','=(G{stdev})/(G{average}) * 100','','','']),
+        ],
+        'borders': [
+            (0, 0, 0, 9, 'header'),
+            (6, 0, 6, 8, 'bottom'),
+            (3, 0, 3, 8, 'dashed'),
+            (1, 9, 2, 9, 'right'),
+            (4, 9, 5, 9, 'right'),
+            (3, 9, 3, 9, 'side'),
+            (6, 9, 6, 9, 'corner'),
+        ],
+        'column_widths': [(7, 9, len("O% Dry Basis"))],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(6, 8, len("O% Dry Basis"))],
+        },
+        'sheets': [dict(cresol_sheet, column_widths=[(0, 1, len("Cresol Measured"))])],
+    },
+    'Viscometer': {
+        'replicates': 1,
+        'replicate_row': ['{label}', '', '', '', ''],
+        'repeat_header': False,
+        'column_widths': [(0, 4, len("Temperature °C"))],
+        'sheets': [viscosity_standard_sheet],
+    },
+    'Acids Titration': {
+        'replicates': 2,
+        'replicate_row': ['{label}','','','=(C{row}-B{row})','=(B{row} * 56.1)', '=(C{row} * 56.1)','=(D{row} * 56.1)'],
+        #blank titration values start at zero on the first replicate
+        'prefill': {(0, 1): 0, (0, 2): 0},
+        'stat_rows': [
+            ('average', ['Average','=AVERAGE(B{first}:B{last})','=AVERAGE(C{first}:C{last})','=AVERAGE(D{first}:D{last})','=AVERAGE(E{first}:E{last})', '=AVERAGE(F{first}:F{last})','=AVERAGE(G{first}:G{last})']),
+            ('range', ['Range', '=ABS(B{last}-B{first})', '=ABS(C{last}-C{first})','=ABS(D{last}-D{first})','=ABS(E{last}-E{first})','=ABS(F{last}-F{first})', '=ABS(G{last}-G{first})']),
+        ],
+        'borders': [
+            (0, 0, 0, 6, 'header'),
+            (4, 0, 4, 5, 'bottom'),
+            (1, 6, 3, 6, 'right'),
+            (4, 6, 4, 6, 'corner'),
+        ],
+        'column_widths': [(4, 6, len("Carboxylic Acid Number mg KOH/g"))],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(4, 6, len("Carboxylic Acid Number mg K")), (1, 3, len("PhAN mol/kg654"))],
+        },
+        'sheets': [vanillic_sheet],
+    },
+    'Carbonyls Titration': {
+        'replicates': 2,
+        'replicate_row': ['{label}', ''],
+        'prefill': {(0, 1): 0},
+        'stat_rows': [
+            ('average', ['Average','=AVERAGE(B{first}:B{last})']),
+            ('range', ['Range', '=ABS(B{first}-B{last})']),
+        ],
+        'borders': [
+            (0, 0, 0, 1, 'header'),
+            (4, 0, 4, 0, 'bottom'),
+            (1, 1, 3, 1, 'right'),
+            (4, 1, 4, 1, 'corner'),
+        ],
+        'column_widths': [(0, 1, len("Carbonyls mol/kg"))],
+        'summary': {
+            'stat': 'average',
+            'column_widths': [(0, 1, len("Carbonyls mol/kg"))],
+        },
+        'sheets': [bba_sheet],
+    },
+}
+
+
+#a cell or range reference to the current row inside a template, e.g. C{row} or C{row}:E{row}
+same_row_reference = re.compile(r'\b([A-Z]{1,3})\{row\}(?::([A-Z]{1,3})\{row\})?')
+#a reference to the 'average' stat row of the current block, e.g. G{average}
+average_reference = re.compile(r'\b([A-Z]{1,3})\{average\}')
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+#a table column in brackets as used in structured references, with the characters Excel reserves escaped
+def structured_column(name):
+    return '[' + re.sub(r"(['\[\]#])", r"'\1", name) + ']'
+
+
+#a whole column of a table, e.g. Data[Mass] or Data[[CAN mol/kg]], Excel only takes a column whose name has
+#spaces or other special characters in it inside a second pair of brackets
+def table_column(table_name, name):
+    column = structured_column(name)
+    if re.search(r'\W', name):
+        column = f'[{column}]'
+    return table_name + column
+
+
+#turn '=AVERAGE(B{first}:B{last})' into ('=AVERAGE(B{}:B{})', ('first', 'last'))
+def positional_template(text):
+    pieces = []
+    names = []
+    for literal, name, _, _ in string.Formatter().parse(text):
+        pieces.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is not None:
+            pieces.append('{}')
+            names.append(name)
+    return ''.join(pieces), tuple(names)
+
+
+class LayoutPlan:
+    #a layout spec compiled into row templates so any number of sample blocks can be emitted from it
+
+    def __init__(self, instrument, spec):
+        self.instrument = instrument
+        self.columns = instrument_columns[instrument]
+        self.replicates = spec['replicates']
+        self.repeat_header = spec.get('repeat_header', True)
+        stat_rows = spec.get('stat_rows', [])
+        self.stat_names = [name for name, row in stat_rows]
+        self.column_widths = spec.get('column_widths', [])
+        self.summary = spec.get('summary')
+        self.sheets = spec.get('sheets', [])
+
+        self.replicate_row = spec['replicate_row']
+        self.stat_templates = dict(stat_rows)
+        self.prefill = spec.get('prefill', {})
+
+        #body of one block, replicate rows first then the stat rows
+        body = [self.replicate_row] * self.replicates + [row for name, row in stat_rows]
+        prefill = self.prefill
+        self.block_height = len(body)
+        #blocks with a repeated header also carry a blank separator row
+        self.stride = self.block_height + (2 if self.repeat_header else 0)
+
+        #split each row into fixed cells and templates once, a template is kept as a positional
+        #format string plus the names of the fields it takes so whole columns can be formatted at once
+        self.rows = []
+        for row_num, row in enumerate(body):
+            fixed = []
+            templates = []
+            for col_num, cell in enumerate(row):
+                if (row_num, col_num) in prefill:
+                    cell = prefill[(row_num, col_num)]
+                if isinstance(cell, str) and '{' in cell:
+                    templates.append((col_num,) + positional_template(cell))
+                    cell = ''
+                fixed.append(cell)
+            self.rows.append((fixed, templates))
+
+        #border format names of every styled cell, by row counted from the block header row,
+        #overlapping rules keep every name with the first rule listed taking priority
+        row_styles = {}
+        for first_row, first_col, last_row, last_col, fmt in spec.get('borders', []):
+            for row_offset in range(first_row, last_row + 1):
+                cells = row_styles.setdefault(row_offset, {})
+                for col_num in range(first_col, last_col + 1):
+                    cells[col_num] = cells.get(col_num, ()) + (fmt,)
+        self.row_styles = {row_offset: [cells.get(col_num) for col_num in range(len(self.columns))]
+                           for row_offset, cells in row_styles.items()}
+
+    #0-based sheet row of the first replicate of a sample block (sample_index counts from 0)
+    def first_row(self, sample_index):
+        return 1 + sample_index * self.stride
+
+    #0-based sheet row of a named stat row of a sample block
+    def stat_row(self, sample_index, name):
+        return self.first_row(sample_index) + self.replicates + self.stat_names.index(name)
+
+    #text of every template cell for the sample blocks start to stop - 1, one list per cell of the block
+    #returned as a list per body row of {col_num: values}, the row numbers of all blocks come from a
+    #single arange and each template is formatted over whole columns instead of sample by sample
+    def block_columns(self, labels, start, stop):
+        #numpy is only loaded once blocks are built so the app starts without it
+        import numpy
+        first = 1 + numpy.arange(start, stop) * self.stride
+        fields = {'label': labels[start:stop], 'first': (first + 1).tolist(),
+                  'last': (first + self.replicates).tolist()}
+        for i, name in enumerate(self.stat_names):
+            fields[name] = (first + self.replicates + i + 1).tolist()
+        columns = []
+        for row_num, (fixed, templates) in enumerate(self.rows):
+            fields['row'] = (first + row_num + 1).tolist()
+            columns.append({col_num: list(map(text.format, *[fields[name] for name in names]))
+                            for col_num, text, names in templates})
+        return columns
+
+    #calculated columns of table mode, the replicate row formulas with their references to the same row
+    #turned into structured references, e.g. '=(C{row}-B{row})' becomes '=(Data[@[TAN mol/kg]]-Data[@[CAN mol/kg]])'
+    def table_formulas(self, table_name):
+        def structured(match):
+            first = structured_column(self.columns[column_index(match.group(1))])
+            if match.group(2):
+                return f'{table_name}[@{first}:{structured_column(self.columns[column_index(match.group(2))])}]'
+            return f'{table_name}[@{first}]'
+
+        formulas = {}
+        for col_num, cell in enumerate(self.replicate_row):
+            if isinstance(cell, str) and cell.startswith('='):
+                formulas[col_num] = same_row_reference.sub(structured, cell)
+        return formulas
+
+    #columns of the Analysis sheet listed on the Summary Analysis sheet, the ones its stat row calculates
+    def summary_columns(self):
+        stat_row = self.stat_templates[self.summary['stat']]
+        return [col_num for col_num in range(1, len(self.columns))
+                if isinstance(stat_row[col_num], str) and stat_row[col_num].startswith('=')]
+
+    #columns whose 'average' stat row is a plain AVERAGE over the replicates
+    def averaged_columns(self):
+        average_row = self.stat_templates.get('average', [])
+        return [col_num for col_num, cell in enumerate(average_row)
+                if isinstance(cell, str) and cell.startswith('=AVERAGE(')]
+
+    #columns only worked out on the 'average' stat row from the averages of other columns (the dry basis of
+    #KF & LECO CHN Combined), their replicate cells are left blank
+    def derived_columns(self):
+        average_row = self.stat_templates.get('average', [])
+        return [col_num for col_num, cell in enumerate(average_row)
+                if col_num > 0 and self.replicate_row[col_num] == '' and isinstance(cell, str)
+                and cell.startswith('=') and not cell.startswith('=AVERAGE(')]
+
+    #columns of the table mode Analysis table, the derived columns go on the sample table instead
+    def table_columns(self):
+        derived = self.derived_columns()
+        return [col_num for col_num in range(len(self.columns)) if col_num not in derived]
+
+    #calculated derived columns of the table mode sample table, the 'average' stat row formulas with their
+    #references to the averages turned into structured references to the same row, e.g.
+    #'=(C{average})/(100-G{average})*100' becomes '=(SampleAverages[@[C%]])/(100-SampleAverages[@[Water]])*100'
+    def sample_table_formulas(self, table_name):
+        def structured(match):
+            return f'{table_name}[@{structured_column(self.columns[column_index(match.group(1))])}]'
+        return {col_num: average_reference.sub(structured, self.stat_templates['average'][col_num])
+                for col_num in self.derived_columns()}
+
+
+class SampleLabels:
+    #'Sample N' labels made on demand so large batches don't hold every label in memory
+
+    def __init__(self, num_request):
+        self.num_request = num_request
+
+    def __len__(self):
+        return self.num_request
+
+    def __iter__(self):
+        return (f'Sample {sample_num}' for sample_num in range(1, self.num_request + 1))
+
+    def __getitem__(self, sample_index):
+        if isinstance(sample_index, slice):
+            return [f'Sample {i + 1}' for i in range(*sample_index.indices(self.num_request))]
+        if not 0 <= sample_index < self.num_request:
+            raise IndexError(sample_index)
+        return f'Sample {sample_index + 1}'
+
+
+#labels written in the Sample ID column of each block
+def sample_labels(num_request):
+    return SampleLabels(num_request)
+
+
+#most samples one sheet holds, table mode adds a header and a total row to the replicate rows
+def max_samples(plan, table=False):
+    if table:
+        return (EXCEL_MAX_ROWS - 2) // plan.replicates
+    return (EXCEL_MAX_ROWS - 1 - plan.block_height) // plan.stride + 1
+
+
+def check_row_limit(plan, num_request, table=False):
+    if num_request > max_samples(plan, table):
+        raise ValueError(f'{num_request} samples of {plan.instrument} need more rows than an Excel sheet has, '
+                         f'split them into workbooks of at most {max_samples(plan, table)} samples')
+
+
+#compile a layout the first time it is used and reuse the plan afterwards
+@functools.lru_cache(maxsize=None)
+def compile_layout(instrument):
+    return LayoutPlan(instrument, layouts[instrument])
+
+
+#fingerprint of an instrument's columns and layout, generated files are reused only while it stays the same
+@functools.lru_cache(maxsize=None)
+def layout_version(instrument):
+    definition = repr((instrument_columns[instrument], layouts[instrument]))
+    return hashlib.sha256(definition.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,81 @@
+import datetime
+import numbers
+
+from exports import EXPORT_CHUNK_ROWS, csv_chunks, excel_chunks, is_excel, normalize_header, sample_id_headers
+
+#duplicate ids listed in the error before it is cut short
+MAX_REPORTED_DUPLICATES = 10
+
+
+#sample id of a manifest cell, ids typed as whole numbers in Excel come back as floats
+def id_text(value):
+    if value is None or value != value:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+#metadata is written as numbers where the manifest holds numbers and as text otherwise
+def metadata_value(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, bool) or not isinstance(value, numbers.Number):
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        text = str(value).strip()
+        return text or None
+    return value
+
+
+#read a sample manifest (csv or xlsx) a chunk of rows at a time, the column named like a sample id gives the
+#labels and every other named column is metadata, blank rows are skipped
+#returns the labels in manifest order and {column: values} for the metadata, duplicate ids are found through
+#a dict of the ids seen so far and reported with their rows as a ValueError, as are duplicate column headers
+def read_manifest(source, filename=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    filename = filename or getattr(source, 'name', source)
+    header_row, header, chunks = (excel_chunks(source, chunk_rows) if is_excel(filename)
+                                  else csv_chunks(source, chunk_rows))
+    id_position = next(position for position, name in enumerate(header)
+                       if normalize_header(name) in sample_id_headers)
+    metadata_positions = [(position, str(name).strip()) for position, name in enumerate(header)
+                          if position != id_position and str(name).strip()]
+    #every column becomes a column of the register sheet, two of the same name would be read into one
+    columns = {}
+    for position, name in [(id_position, str(header[id_position]).strip())] + metadata_positions:
+        columns.setdefault(name, []).append(str(position + 1))
+    repeated = [f'{name} (columns {" and ".join(positions)})' for name, positions in columns.items()
+                if len(positions) > 1]
+
+    labels = []
+    metadata = {name: [] for _, name in metadata_positions}
+    seen = {}
+    duplicates = []
+    #rows are numbered as in the file so duplicates can be found in it
+    row_num = header_row + 1
+    for rows in chunks:
+        for row in rows.tolist():
+            row_num += 1
+            label = id_text(row[id_position])
+            if not label:
+                continue
+            if label in seen:
+                duplicates.append(f'{label} (rows {seen[label]} and {row_num})')
+                continue
+            seen[label] = row_num
+            labels.append(label)
+            for position, name in metadata_positions:
+                metadata[name].append(metadata_value(row[position]) if position < len(row) else None)
+
+    #reported once the file has been read to the end, which closes it
+    if repeated:
+        raise ValueError(f'Duplicate column headers: {", ".join(repeated)}')
+    if duplicates:
+        listed = ', '.join(duplicates[:MAX_REPORTED_DUPLICATES])
+        more = len(duplicates) - MAX_REPORTED_DUPLICATES
+        raise ValueError(f'Duplicate sample IDs: {listed}' + (f' and {more} more' if more > 0 else ''))
+    if not labels:
+        raise ValueError('The manifest has no sample IDs')
+    #metadata columns the manifest leaves empty are dropped
+    metadata = {name: values for name, values in metadata.items() if any(value is not None for value in values)}
+    return labels, metadata
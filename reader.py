@@ -0,0 +1,305 @@
+import html
+import json
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from xlsxwriter.utility import xl_col_to_name
+
+from generator import LAYOUT_SHEET
+from layouts import compile_layout, short_names
+
+#bytes of sheet xml parsed at a time, rows are only parsed once they are complete
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+#the sheet xml is scanned with these instead of building an element per cell, rows of a
+#sample block that hold no replicate values are skipped without looking at their cells
+row_start_pattern = re.compile(rb'<row\b([^>]*)>')
+row_number_pattern = re.compile(rb'\br="(\d+)"')
+#writers nearly always put the cell reference first, rows where every cell does are matched with cell_pattern,
+#other rows with any_cell_pattern where the r and t attributes may come anywhere in the tag and r may be left out
+cell_pattern = re.compile(rb'<c r="([A-Z]+)\d+"(?:[^>]*?\bt="(\w+)")?[^>]*?(?:/>|>(.*?)</c>)', re.S)
+any_cell_pattern = re.compile(rb'<c\b(?:(?=[^>]*?\br="([A-Z]+)\d+"))?(?:(?=[^>]*?\bt="(\w+)"))?[^>]*?'
+                              rb'(?:/>|>(.*?)</c>)', re.S)
+value_pattern = re.compile(rb'<v>(.*?)</v>', re.S)
+inline_text_pattern = re.compile(rb'<t\b[^>]*>(.*?)</t>', re.S)
+
+
+#path inside the package of a relationship target, targets are relative to the part's folder unless absolute
+def resolve_target(folder, target):
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(folder, target))
+
+
+#sheet name to the path of its xml inside the package
+def sheet_paths(archive):
+    rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{REL_NS}Relationship')}
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    paths = {}
+    for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+        target = targets[sheet.get(f'{DOC_REL_NS}id')]
+        paths[sheet.get('name')] = resolve_target('xl', target)
+    return paths
+
+
+def read_shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f'{MAIN_NS}si':
+                strings.append(''.join(text.text or '' for text in element.iter(f'{MAIN_NS}t')))
+                element.clear()
+    return strings
+
+
+#first and last data row (1-based) of the table on a sheet, None when the sheet has no table
+def table_rows(archive, sheet_path):
+    rels_path = posixpath.join(posixpath.dirname(sheet_path), '_rels', posixpath.basename(sheet_path) + '.rels')
+    if rels_path not in archive.namelist():
+        return None
+    rels = ET.fromstring(archive.read(rels_path))
+    for rel in rels.iter(f'{REL_NS}Relationship'):
+        if rel.get('Type', '').endswith('/table'):
+            table = ET.fromstring(archive.read(resolve_target(posixpath.dirname(sheet_path), rel.get('Target'))))
+            last_row = int(re.search(r'(\d+)$', table.get('ref')).group(1))
+            return 2, last_row - int(table.get('totalsRowCount', 0))
+    return None
+
+
+#rows of a sheet as (row number, row xml) read a chunk at a time from the package,
+#rows are split on their closing tag which is much cheaper than matching each one with a pattern
+#self-closing rows hold no cells and are skipped, rows without an r attribute follow the row before
+def iter_rows(archive, sheet_path):
+    row_num = 0
+    with archive.open(sheet_path) as f:
+        pending = b''
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            data = pending + chunk
+            pieces = data.split(b'</row>')
+            #the last piece is an incomplete row unless the sheet has been read to the end
+            pending = pieces.pop() if chunk else b''
+            for piece in pieces:
+                start = piece.rfind(b'<row')
+                #the tail of the sheet after its last row may hold a <rowBreaks> element
+                match = row_start_pattern.match(piece, start) if start >= 0 else None
+                if match is None:
+                    continue
+                number = row_number_pattern.search(match.group(1))
+                if number is not None:
+                    row_num = int(number.group(1))
+                else:
+                    #the self-closing rows before it in the piece take row numbers too
+                    for empty in row_start_pattern.finditer(piece, 0, start):
+                        number = row_number_pattern.search(empty.group(1))
+                        row_num = int(number.group(1)) if number is not None else row_num + 1
+                    row_num += 1
+                yield row_num, piece[match.end():]
+            if not chunk:
+                break
+
+
+#values of the first columns of a row, col_numbers maps their letters to their index
+#formulas give their cached result (None if the workbook was never calculated)
+def row_values(row_xml, col_numbers, shared_strings):
+    values = [None] * len(col_numbers)
+    pattern = cell_pattern if row_xml.count(b'<c') == row_xml.count(b'<c r="') else any_cell_pattern
+    col_num = -1
+    for letters, cell_type, content in pattern.findall(row_xml):
+        #cells without a reference are in the column after the cell before
+        col_num = col_numbers.get(letters) if letters else col_num + 1
+        #cells are stored in column order so the first one past the wanted columns ends the row
+        if col_num is None or col_num >= len(values):
+            break
+        if not content:
+            continue
+        if cell_type == b'inlineStr':
+            values[col_num] = html.unescape(b''.join(inline_text_pattern.findall(content)).decode('utf-8'))
+            continue
+        if content.startswith(b'<v>'):
+            value = content[3:-4]
+        else:
+            value = value_pattern.search(content)
+            if value is None:
+                continue
+            value = value.group(1)
+        if not cell_type or cell_type == b'n':
+            values[col_num] = float(value)
+        elif cell_type == b's':
+            values[col_num] = shared_strings[int(value)]
+        elif cell_type == b'b':
+            values[col_num] = value == b'1'
+        else:
+            values[col_num] = html.unescape(value.decode('utf-8'))
+    return values
+
+
+#the layout manifest of a generated workbook (see generator.sheet_layout), None for workbooks made before
+#templates carried one
+def layout_manifest(archive, paths, shared_strings):
+    if LAYOUT_SHEET not in paths:
+        return None
+    for row_num, row_xml in iter_rows(archive, paths[LAYOUT_SHEET]):
+        text = row_values(row_xml, {b'A': 0}, shared_strings)[0]
+        return json.loads(text) if text else None
+    return None
+
+
+def read_layout_manifest(source):
+    with zipfile.ZipFile(source) as archive:
+        return layout_manifest(archive, sheet_paths(archive), read_shared_strings(archive))
+
+
+#the manifest entry of the instrument's sheet, by name when one is given
+def find_sheet_layout(manifest, instrument, sheet_name=None):
+    for layout in manifest['sheets']:
+        if layout['sheet'] == sheet_name or (sheet_name is None and layout['instrument'] == instrument):
+            if layout['instrument'] != instrument:
+                raise ValueError(f"The {layout['sheet']} sheet is a {layout['instrument']} template")
+            return layout
+    made_for = ', '.join(layout['instrument'] for layout in manifest['sheets'])
+    raise ValueError(f'The workbook has no {sheet_name or instrument} sheet, it was made for {made_for}')
+
+
+#the values of the standards sheets of an instrument's template as {sheet spec name: {(row, col): value}}, 0-based,
+#sheets the workbook doesn't have are left out, a combined workbook may have put them on sheets of another name
+#which its layout manifest lists (see generator.build_combined_workbook), combined workbooks made before the
+#manifest listed them added the instrument's short name
+def read_standard_sheets(source, instrument):
+    plan = compile_layout(instrument)
+    col_numbers = {xl_col_to_name(col_num).encode(): col_num for col_num in range(26)}
+    sheets = {}
+    if not plan.sheets:
+        return sheets
+    with zipfile.ZipFile(source) as archive:
+        paths = sheet_paths(archive)
+        shared_strings = read_shared_strings(archive)
+        manifest = layout_manifest(archive, paths, shared_strings) or {'sheets': []}
+        names = next((layout.get('standards', {}) for layout in manifest['sheets']
+                      if layout['instrument'] == instrument), {})
+        for sheet in plan.sheets:
+            if sheet['name'] in names:
+                name = names[sheet['name']]
+            else:
+                name = f"{sheet['name']} ({short_names[instrument]})"
+                name = name if name in paths else sheet['name']
+            if name not in paths:
+                continue
+            cells = {}
+            for row_num, row_xml in iter_rows(archive, paths[name]):
+                for col_num, value in enumerate(row_values(row_xml, col_numbers, shared_strings)):
+                    if value is not None:
+                        cells[(row_num - 1, col_num)] = value
+            sheets[sheet['name']] = cells
+    return sheets
+
+
+#read the replicates of a completed template into a tidy table with one row per replicate,
+#source is a path or a binary file-like object such as an uploaded file
+#replicates with nothing entered are dropped unless keep_empty is set, sheet_name picks the instrument's
+#sheet of a combined workbook (see generator.combined_sheet_names), by default it is found from the workbook's
+#layout manifest or is the Analysis sheet, the manifest also gives the block rows so they are never guessed
+def read_completed_template(source, instrument, keep_empty=False, sheet_name=None):
+    plan = compile_layout(instrument)
+    col_numbers = {xl_col_to_name(col_num).encode(): col_num for col_num in range(len(plan.columns))}
+    #values are collected a column at a time, a list per replicate would leave hundreds of thousands
+    #of containers for the garbage collector to walk over and over on large workbooks
+    samples = []
+    replicate_numbers = []
+    columns = [[] for _ in plan.columns]
+    with zipfile.ZipFile(source) as archive:
+        paths = sheet_paths(archive)
+        shared_strings = read_shared_strings(archive)
+        manifest = layout_manifest(archive, paths, shared_strings)
+        first_row, stride, last_row = 2, plan.stride, None
+        #table mode leaves the columns worked out from the sample averages to the sample table
+        table_columns = [plan.columns[col_num] for col_num in plan.table_columns()]
+        if manifest:
+            layout = find_sheet_layout(manifest, instrument, sheet_name)
+            if layout['columns'] not in (plan.columns, table_columns):
+                raise ValueError(f"The {layout['sheet']} sheet was made with different {instrument} columns")
+            sheet_name = layout['sheet']
+            first_row, stride = layout['first_row'], layout['stride']
+            if layout['replicates'] != plan.replicates:
+                raise ValueError(f"The {sheet_name} sheet has {layout['replicates']} replicates per sample, "
+                                 f"the {instrument} layout has {plan.replicates}")
+            #rows past the last block are never looked at
+            last_row = first_row + manifest['samples'] * stride - 1
+        sheet_name = sheet_name or 'Analysis'
+        if sheet_name not in paths:
+            raise ValueError(f'The workbook has no {sheet_name} sheet')
+        table = table_rows(archive, paths[sheet_name])
+        #the plan columns the sheet holds in order, table mode workbooks made before it left the derived
+        #columns out have them all
+        sheet_columns = columns
+        sample_numbers = {}
+        replicate_counts = {}
+
+        for row_num, row_xml in iter_rows(archive, paths[sheet_name]):
+            if row_num == 1:
+                header = row_values(row_xml, col_numbers, shared_strings)
+                if table and header[:len(table_columns)] == table_columns and header != plan.columns:
+                    sheet_columns = [columns[col_num] for col_num in plan.table_columns()]
+                elif header != plan.columns:
+                    raise ValueError(f"The {sheet_name} sheet doesn't have the {instrument} columns")
+                continue
+            if table:
+                #table mode, every data row is a replicate numbered in order within its sample
+                if not table[0] <= row_num <= table[1]:
+                    continue
+                values = row_values(row_xml, col_numbers, shared_strings)
+                sample = values[0]
+                sample_numbers.setdefault(sample, len(sample_numbers) + 1)
+                replicate_counts[sample] = replicate_counts.get(sample, 0) + 1
+                samples.append(sample_numbers[sample])
+                replicate_numbers.append(replicate_counts[sample])
+            else:
+                #block layout, the position of the row inside its block says whether it holds a replicate
+                if last_row is not None and row_num > last_row:
+                    break
+                sample_index, row_in_block = divmod(row_num - first_row, stride)
+                if row_num < first_row or row_in_block >= plan.replicates:
+                    continue
+                values = row_values(row_xml, col_numbers, shared_strings)
+                samples.append(sample_index + 1)
+                replicate_numbers.append(row_in_block + 1)
+            for column, value in zip(sheet_columns, values):
+                column.append(value)
+        for column in columns:
+            column.extend([None] * (len(samples) - len(column)))
+
+        #the sample ids of a combined workbook are formulas on its register sheet, a workbook saved by something
+        #that doesn't calculate (openpyxl) has no results cached for them so they are read off the register
+        register = manifest.get('register') if manifest else None
+        if register in paths and None in columns[0]:
+            ids = {row_num - 1: row_values(row_xml, {b'A': 0}, shared_strings)[0]
+                   for row_num, row_xml in iter_rows(archive, paths[register]) if row_num > 1}
+            columns[0] = [ids.get(sample) if label is None else label for sample, label in zip(samples, columns[0])]
+
+    replicates = pd.DataFrame({'Sample': samples, 'Replicate': replicate_numbers,
+                               **dict(zip(plan.columns, columns))})
+    if not keep_empty:
+        #a replicate counts as entered once any column typed in by hand differs from what the template started with
+        entered = pd.Series(False, index=replicates.index)
+        for col_num, cell in enumerate(plan.replicate_row):
+            if col_num == 0 or cell != '':
+                continue
+            column = replicates[plan.columns[col_num]]
+            filled = column.notna()
+            for (rep_idx, prefill_col), value in plan.prefill.items():
+                if prefill_col == col_num:
+                    filled &= ~((replicates['Replicate'] == rep_idx + 1) & (column == value))
+            entered |= filled
+        replicates = replicates[entered].reset_index(drop=True)
+    return replicates
@@ -0,0 +1,379 @@
+import datetime
+import hashlib
+import itertools
+import math
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from calculations import calculate, standard_results
+from control_charts import CHART_VERSION, POINT_COLUMNS, add_point, chart_limits, new_state
+from layouts import compile_layout, instrument_columns, instrument_families
+from reader import read_completed_template, read_standard_sheets
+from timing import log_event
+
+#file the results are kept in, ':memory:' keeps them for the life of the process only
+DEFAULT_RESULTS_DB = os.environ.get('TEMPLATE_RESULTS_DB', 'template_results.sqlite')
+
+
+#column of a results table a template column is kept in, e.g. 'O% (diff)' -> o_diff
+def sql_column(name):
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+#{family: columns} every measured or calculated column an instrument of the family has, in the order they
+#first appear, instruments of a family share the columns that mean the same thing ('Mass (g)', 'C%', ...)
+def family_columns():
+    families = {}
+    for instrument, family in instrument_families.items():
+        columns = families.setdefault(family, [])
+        for name in instrument_columns[instrument][1:]:
+            if sql_column(name) not in columns:
+                columns.append(sql_column(name))
+    return families
+
+
+#names of the sample results calculate works out for an instrument, e.g. 'C% average' or 'H2O% rsd'
+def sample_result_names(instrument):
+    plan = compile_layout(instrument)
+    return [f'{plan.columns[col_num]} {name}' for name in plan.stat_names
+            for col_num, cell in enumerate(plan.stat_templates[name]) if isinstance(cell, str) and cell.startswith('=')]
+
+
+#{family: columns} every sample result an instrument of the family has, like family_columns
+def family_sample_columns():
+    families = {}
+    for instrument, family in instrument_families.items():
+        columns = families.setdefault(family, [])
+        for name in sample_result_names(instrument):
+            if sql_column(name) not in columns:
+                columns.append(sql_column(name))
+    #the viscometer blocks have no stat rows
+    return {family: columns for family, columns in families.items() if columns}
+
+
+#running state of every control chart series, one row per standards check
+SERIES_COLUMNS = list(new_state())
+
+
+def series_column_type(column):
+    if column in ('last_date', 'last_signal'):
+        return 'TEXT'
+    return 'INTEGER' if column == 'version' or column.endswith('count') else 'REAL'
+
+
+def results_table(family):
+    return f'{family}_results'
+
+
+#the averages, stdevs, rsds and dry basis results of every sample, one row per sample
+def samples_table(family):
+    return f'{family}_samples'
+
+
+#run dates are kept as ISO dates so they sort and compare as text
+def iso_date(value=None):
+    if value is None:
+        return datetime.date.today().isoformat()
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return datetime.date.fromisoformat(str(value)).isoformat()
+
+
+#sha256 of the bytes of a workbook given as a path or a binary file-like object, which is left where it was
+def content_hash(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    position = source.tell()
+    source.seek(0)
+    digest = hashlib.sha256(source.read()).hexdigest()
+    source.seek(position)
+    return digest
+
+
+#everything kept for one workbook, read outside the store so the reading never holds its transaction open
+#the replicates come with their calculated columns, the samples with their results and the standards checks
+#with their value and window
+def read_run(source, instrument, run_date=None, filename=None, sheet_name=None):
+    plan = compile_layout(instrument)
+    replicates = read_completed_template(source, instrument, sheet_name=sheet_name)
+    replicates, samples = calculate(instrument, replicates)
+    checks = []
+    entered = read_standard_sheets(source, instrument)
+    for sheet in plan.sheets:
+        if sheet['name'] not in entered:
+            continue
+        for check in standard_results(sheet, entered[sheet['name']]):
+            checks.append(dict(check, sheet=sheet['name']))
+    return {'instrument': instrument, 'run_date': iso_date(run_date),
+            'source': filename or getattr(source, 'name', None) or (source if isinstance(source, str) else None),
+            'content_hash': content_hash(source), 'replicates': replicates, 'samples': samples, 'checks': checks}
+
+
+class ResultsStore:
+    #results of ingested workbooks in a sqlite file: a row per workbook in runs, its replicates and sample
+    #results in the tables of its instrument family and its standards checks in standard_checks, indexed on sample id, instrument
+    #and run date, the runs handed to add_runs go in as one transaction, a workbook is kept once per instrument
+
+    def __init__(self, path=DEFAULT_RESULTS_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        #one connection shared by every session in this process, the lock keeps them taking turns
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.create_schema()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    #tables are created on first use, columns a layout gained since are added to the existing tables
+    def create_schema(self):
+        with self.lock, self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY, instrument TEXT NOT NULL, family TEXT NOT NULL,
+                    run_date TEXT NOT NULL, source TEXT, ingested_at TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS runs_instrument ON runs (instrument, run_date);
+                CREATE INDEX IF NOT EXISTS runs_date ON runs (run_date);
+                CREATE TABLE IF NOT EXISTS standard_checks (
+                    run_id INTEGER NOT NULL REFERENCES runs, instrument TEXT NOT NULL, run_date TEXT NOT NULL,
+                    sheet TEXT NOT NULL, name TEXT NOT NULL, cell TEXT NOT NULL, value REAL, low REAL, high REAL,
+                    passed INTEGER);
+                CREATE INDEX IF NOT EXISTS standard_checks_sheet ON standard_checks (sheet, run_date);
+                CREATE INDEX IF NOT EXISTS standard_checks_run ON standard_checks (run_id);
+                CREATE TABLE IF NOT EXISTS control_series (
+                    sheet TEXT NOT NULL, name TEXT NOT NULL, low REAL, high REAL, PRIMARY KEY (sheet, name));
+            ''')
+            self.add_columns('runs', {'content_hash': 'TEXT'})
+            #runs kept before the hash was stored have none and are never matched
+            self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS runs_content ON runs (content_hash, instrument)')
+            self.add_columns('standard_checks', {column: 'TEXT' if column == 'signal' else 'REAL'
+                                                 for column in POINT_COLUMNS})
+            self.add_columns('control_series', {column: series_column_type(column) for column in SERIES_COLUMNS})
+            for family, columns in family_columns().items():
+                table = results_table(family)
+                self.connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} (run_id INTEGER NOT NULL REFERENCES runs, sample_id TEXT, '
+                    f'sample INTEGER NOT NULL, replicate INTEGER NOT NULL)')
+                self.add_columns(table, {column: 'REAL' for column in columns})
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_sample_id ON {table} (sample_id)')
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_run ON {table} (run_id)')
+            for family, columns in family_sample_columns().items():
+                table = samples_table(family)
+                self.connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} (run_id INTEGER NOT NULL REFERENCES runs, sample_id TEXT, '
+                    f'sample INTEGER NOT NULL)')
+                self.add_columns(table, {column: 'REAL' for column in columns})
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_sample_id ON {table} (sample_id)')
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_run ON {table} (run_id)')
+            self.backfill_series()
+
+    def add_columns(self, table, columns):
+        existing = {row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')}
+        for column, column_type in columns.items():
+            if column not in existing:
+                self.connection.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" {column_type}')
+
+    #keep runs made by read_run, returns their run ids
+    #the control charts of their standards checks are brought up to date in the same transaction
+    #a workbook already kept for the same instrument is not kept again, its run id is returned instead so
+    #saving the same upload twice adds no second point to the control charts
+    def add_runs(self, runs):
+        ingested_at = datetime.datetime.now().isoformat(timespec='seconds')
+        run_ids = []
+        rows = 0
+        duplicates = 0
+        states = {}
+        replay = set()
+        with self.lock, self.connection:
+            cursor = self.connection.cursor()
+            for run in runs:
+                kept = None
+                if run.get('content_hash') is not None:
+                    kept = cursor.execute('SELECT run_id FROM runs WHERE content_hash = ? AND instrument = ?',
+                                          (run['content_hash'], run['instrument'])).fetchone()
+                if kept is not None:
+                    run_ids.append(kept[0])
+                    duplicates += 1
+                    continue
+                run_ids.append(self.insert_run(cursor, run, ingested_at, states, replay))
+                rows += len(run['replicates'])
+            for key in replay:
+                states[key] = self.replay_series(cursor, key)
+            self.save_states(cursor, states)
+        log_event('ingest', runs=len(run_ids) - duplicates, duplicates=duplicates, replicates=rows,
+                  replayed_series=len(replay))
+        return run_ids
+
+    def save_states(self, cursor, states):
+        cursor.executemany(f'UPDATE control_series SET {", ".join(f"{column} = ?" for column in SERIES_COLUMNS)} '
+                           f'WHERE sheet = ? AND name = ?',
+                           [[state[column] for column in SERIES_COLUMNS] + list(key) for key, state in states.items()])
+
+    #checks kept before the store had control charts get their series worked out once, as do series kept by an
+    #older version of the charts
+    def backfill_series(self):
+        cursor = self.connection.cursor()
+        outdated = cursor.execute('SELECT sheet, name FROM control_series WHERE version IS NULL OR version < ?',
+                                  (CHART_VERSION,)).fetchall()
+        missing = cursor.execute('SELECT sheet, name, MIN(low), MAX(high) FROM standard_checks WHERE NOT EXISTS '
+                                 '(SELECT 1 FROM control_series WHERE control_series.sheet = standard_checks.sheet '
+                                 'AND control_series.name = standard_checks.name) GROUP BY sheet, name').fetchall()
+        states = {key: self.replay_series(cursor, key) for key in outdated}
+        for sheet, name, low, high in missing:
+            cursor.execute('INSERT INTO control_series (sheet, name, low, high) VALUES (?, ?, ?, ?)',
+                           (sheet, name, low, high))
+            states[(sheet, name)] = self.replay_series(cursor, (sheet, name))
+        self.save_states(cursor, states)
+
+    #running state of a series, kept in states for the rest of the transaction
+    def series_state(self, cursor, states, key, low, high):
+        if key not in states:
+            row = cursor.execute(f'SELECT {", ".join(SERIES_COLUMNS)} FROM control_series WHERE sheet = ? AND name = ?',
+                                 key).fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO control_series (sheet, name, low, high) VALUES (?, ?, ?, ?)',
+                               key + (low, high))
+                states[key] = new_state()
+            else:
+                states[key] = dict(zip(SERIES_COLUMNS, row))
+        return states[key]
+
+    #a run dated before the last point of a series changes every point after it, the series is worked out again
+    #from its first point, this is the only time the history is read
+    def replay_series(self, cursor, key):
+        state = new_state()
+        points = cursor.execute('SELECT rowid, value, low, high, run_date FROM standard_checks '
+                                'WHERE sheet = ? AND name = ? AND value IS NOT NULL ORDER BY run_date, run_id',
+                                key).fetchall()
+        updates = []
+        for rowid, value, low, high, run_date in points:
+            point = add_point(state, value, low, high, run_date)
+            updates.append([point[column] for column in POINT_COLUMNS] + [rowid])
+        cursor.executemany(f'UPDATE standard_checks SET {", ".join(f"{column} = ?" for column in POINT_COLUMNS)} '
+                           f'WHERE rowid = ?', updates)
+        return state
+
+    #rows of a table of replicates or samples, keys are the integer columns numbering them
+    def insert_rows(self, cursor, table, run_id, frame, id_column, keys, columns):
+        names = ['run_id', 'sample_id'] + [key.lower() for key in keys] + [sql_column(name) for name in columns]
+        sample_ids = frame[id_column]
+        #text typed into a number column is kept as NULL, sqlite stores NaN as NULL too
+        values = [pd.to_numeric(frame[name], errors='coerce').tolist() for name in columns]
+        rows = zip(itertools.repeat(run_id), sample_ids.astype(object).where(sample_ids.notna(), None).tolist(),
+                   *[frame[key].tolist() for key in keys], *values)
+        quoted = ', '.join(f'"{name}"' for name in names)
+        cursor.executemany(f'INSERT INTO {table} ({quoted}) VALUES ({", ".join("?" * len(names))})', rows)
+
+    def insert_run(self, cursor, run, ingested_at, states, replay):
+        instrument = run['instrument']
+        family = instrument_families[instrument]
+        cursor.execute('INSERT INTO runs (instrument, family, run_date, source, content_hash, ingested_at) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (instrument, family, run['run_date'], run['source'], run.get('content_hash'), ingested_at))
+        run_id = cursor.lastrowid
+
+        columns = instrument_columns[instrument]
+        self.insert_rows(cursor, results_table(family), run_id, run['replicates'], columns[0], ['Sample', 'Replicate'],
+                         columns[1:])
+        #runs made before read_run kept the sample results have none
+        if run.get('samples') is not None and family in family_sample_columns():
+            self.insert_rows(cursor, samples_table(family), run_id, run['samples'], columns[0], ['Sample'],
+                             sample_result_names(instrument))
+
+        checks = []
+        for check in run['checks']:
+            key = (check['sheet'], check['name'])
+            state = self.series_state(cursor, states, key, check['low'], check['high'])
+            #a check that is an error in Excel is kept with a NULL value and passed, it is no point of the charts
+            value = None if math.isnan(check['value']) else check['value']
+            passed = None if value is None else int(check['low'] <= value <= check['high'])
+            if value is None:
+                point = dict.fromkeys(POINT_COLUMNS)
+            elif key in replay or (state['last_date'] is not None and run['run_date'] < state['last_date']):
+                replay.add(key)
+                point = dict.fromkeys(POINT_COLUMNS)
+            else:
+                point = add_point(state, value, check['low'], check['high'], run['run_date'])
+            checks.append((run_id, instrument, run['run_date'], check['sheet'], check['name'], check['cell'],
+                           value, check['low'], check['high'], passed, *[point[column] for column in POINT_COLUMNS]))
+        placeholders = ', '.join('?' * (10 + len(POINT_COLUMNS)))
+        cursor.executemany(f'INSERT INTO standard_checks (run_id, instrument, run_date, sheet, name, cell, value, low, '
+                           f'high, passed, {", ".join(POINT_COLUMNS)}) VALUES ({placeholders})', checks)
+        return run_id
+
+    #read a completed template and keep its results, returns the run id, the run already kept for the same
+    #workbook and instrument if there is one
+    def ingest(self, source, instrument, run_date=None, filename=None, sheet_name=None):
+        return self.add_runs([read_run(source, instrument, run_date, filename, sheet_name)])[0]
+
+    #several (source, instrument, run date) workbooks kept in one transaction, returns their run ids
+    def ingest_many(self, workbooks):
+        return self.add_runs([read_run(source, instrument, run_date) for source, instrument, run_date in workbooks])
+
+    #rows of a query as a table, built straight from the fetched tuples which is quicker than read_sql_query
+    def query(self, sql, params=()):
+        with self.lock:
+            cursor = self.connection.execute(sql, list(params))
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records(rows, columns=[column[0] for column in cursor.description])
+
+    #every replicate of a sample id as {family: table}, with the instrument and run date of each
+    def sample_results(self, sample_id):
+        results = {}
+        for family in family_columns():
+            table = self.query(f'SELECT runs.instrument, runs.run_date, {results_table(family)}.* '
+                               f'FROM {results_table(family)} JOIN runs USING (run_id) WHERE sample_id = ? '
+                               f'ORDER BY runs.run_date, run_id, sample, replicate', (sample_id,))
+            if len(table):
+                results[family] = table.drop(columns='run_id').dropna(axis=1, how='all')
+        return results
+
+    #the averages, stdevs, rsds and dry basis results of a sample id as {family: table}, like sample_results
+    def sample_statistics(self, sample_id):
+        results = {}
+        for family in family_sample_columns():
+            table = self.query(f'SELECT runs.instrument, runs.run_date, {samples_table(family)}.* '
+                               f'FROM {samples_table(family)} JOIN runs USING (run_id) WHERE sample_id = ? '
+                               f'ORDER BY runs.run_date, run_id, sample', (sample_id,))
+            if len(table):
+                results[family] = table.drop(columns='run_id').dropna(axis=1, how='all')
+        return results
+
+    #standards checks in date order, every filter is optional and dates are inclusive
+    def standard_checks(self, sheet=None, name=None, start=None, end=None, instrument=None):
+        conditions = []
+        params = []
+        for column, operator, value in (('sheet', '=', sheet), ('name', '=', name), ('instrument', '=', instrument),
+                                        ('run_date', '>=', start and iso_date(start)),
+                                        ('run_date', '<=', end and iso_date(end))):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+        return self.query(f'SELECT * FROM standard_checks {where}ORDER BY run_date, run_id', params)
+
+    #points of one standards check with the lines of its Shewhart, EWMA and CUSUM charts, checks that were
+    #errors are left out
+    def control_chart(self, sheet, name, start=None, end=None):
+        points = self.standard_checks(sheet, name, start, end)
+        return chart_limits(points[points['value'].notna()])
+
+    #the latest state of every control chart, read without touching the history
+    def control_status(self):
+        return self.query(f'SELECT sheet, name, low, high, {", ".join(SERIES_COLUMNS)} FROM control_series '
+                          f'ORDER BY sheet, name')
+
+    def runs(self, instrument=None):
+        if instrument is None:
+            return self.query('SELECT * FROM runs ORDER BY run_date, run_id')
+        return self.query('SELECT * FROM runs WHERE instrument = ? ORDER BY run_date, run_id', (instrument,))
@@ -0,0 +1,118 @@
+import io
+import os
+import time
+import zipfile
+
+from layouts import EXCEL_MAX_ROWS, check_row_limit, compile_layout, max_samples, sample_labels
+from timing import log_event
+
+#samples per workbook when a batch is split, a shard never holds more than one sheet can
+DEFAULT_SHARD_SAMPLES = int(os.environ.get('TEMPLATE_SHARD_SAMPLES', 0)) or 50000
+
+
+#samples in each shard of the instrument's templates
+def shard_size(instrument, shard_samples=None, table=False):
+    return min(shard_samples or DEFAULT_SHARD_SAMPLES, max_samples(compile_layout(instrument), table))
+
+
+def needs_sharding(instrument, num_request, shard_samples=None, table=False):
+    return int(num_request) > shard_size(instrument, shard_samples, table)
+
+
+#(start, stop) sample indexes of every shard
+def shard_ranges(num_request, size):
+    return [(start, min(start + size, num_request)) for start in range(0, num_request, size)]
+
+
+def shard_filenames(instrument, num_shards):
+    width = len(str(num_shards))
+    return [f'{instrument}_part{shard_num:0{width}d}_data_template.xlsx' for shard_num in range(1, num_shards + 1)]
+
+
+def index_filename(instrument):
+    return f'{instrument}_index.xlsx'
+
+
+def archive_filename(instrument):
+    return f'{instrument}_data_templates.zip'
+
+
+#the workbook listing every sample id with the shard file and the Analysis row it starts on,
+#the list moves on to another sheet when it fills one
+def write_index(output, plan, labels, ranges, filenames, table=False):
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    bold = workbook.add_format({'bold': True})
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    worksheet = None
+    row_num = 0
+    for (start, stop), filename in zip(ranges, filenames):
+        for sample_index in range(start, stop):
+            if worksheet is None or row_num == rows_per_sheet:
+                worksheet = workbook.add_worksheet('Index' if worksheet is None else
+                                                   f'Index {len(workbook.worksheets()) + 1}')
+                worksheet.write_row(0, 0, [plan.columns[0], 'File', 'Sheet', 'Row'], bold)
+                worksheet.set_column(0, 0, 20)
+                worksheet.set_column(1, 1, len(filename))
+                row_num = 0
+            row_num += 1
+            shard_index = sample_index - start
+            #1-based row of the first replicate of the sample in its shard
+            row = shard_index * plan.replicates + 2 if table else plan.first_row(shard_index) + 1
+            worksheet.write_string(row_num, 0, labels[sample_index])
+            worksheet.write_string(row_num, 1, filename)
+            worksheet.write_string(row_num, 2, 'Analysis')
+            worksheet.write_number(row_num, 3, row)
+    workbook.close()
+
+
+#split a batch too big for one workbook into shards of shard_samples (see shard_size) built at once on the
+#batch pool, the zip holds every shard and an index workbook mapping the sample ids to them
+#returns the zip bytes, one timing entry per file and the total time like batch.generate_batch
+#labels and metadata (optional) come from a sample manifest, progress works as in generate_batch
+def generate_sharded(instrument, num_request, shard_samples=None, pool=None, progress=None, table=False,
+                     labels=None, metadata=None):
+    if labels is None:
+        labels = sample_labels(int(num_request))
+    num_request = len(labels)
+    plan = compile_layout(instrument)
+    size = shard_size(instrument, shard_samples, table)
+    ranges = shard_ranges(num_request, size)
+    filenames = shard_filenames(instrument, len(ranges))
+    for start, stop in ranges:
+        check_row_limit(plan, stop - start, table)
+    #the pool is only imported when a batch is split so checking the size stays cheap
+    from batch import get_pool, run_job, wait_for_jobs
+    if pool is None:
+        pool = get_pool()
+
+    start_time = time.perf_counter()
+    futures = []
+    for start, stop in ranges:
+        shard_metadata = {name: values[start:stop] for name, values in metadata.items()} if metadata else None
+        #shards are built in constant memory so the workers together hold no more than one streamed build
+        #each, table mode can't stream
+        futures.append(pool.submit(run_job, instrument, stop - start, labels[start:stop], shard_metadata, table,
+                                   not table))
+    #the index is written here while the workers build the shards
+    index_start = time.perf_counter()
+    index = io.BytesIO()
+    write_index(index, plan, labels, ranges, filenames, table)
+    index_seconds = time.perf_counter() - index_start
+    if progress:
+        wait_for_jobs([(instrument, stop - start) for start, stop in ranges], futures, progress)
+
+    output = io.BytesIO()
+    timings = []
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(index_filename(instrument), index.getvalue())
+        timings.append({'instrument': instrument, 'samples': num_request, 'file': index_filename(instrument),
+                        'bytes': index.getbuffer().nbytes, 'seconds': round(index_seconds, 3)})
+        for (start, stop), filename, future in zip(ranges, filenames, futures):
+            data, seconds = future.result()
+            archive.writestr(filename, data)
+            timings.append({'instrument': instrument, 'samples': stop - start, 'file': filename,
+                            'bytes': len(data), 'seconds': round(seconds, 3)})
+    total = time.perf_counter() - start_time
+    log_event('sharded', instrument=instrument, samples=num_request, shards=len(ranges), seconds=round(total, 4))
+    return output.getvalue(), timings, total
@@ -0,0 +1,129 @@
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+from generator import LAYOUT_MANIFEST_VERSION, TEMPLATE_FORMAT_VERSION, generate_excel_file
+from incremental import block_store
+from layouts import layout_version
+
+#size of the in-process tier, the on-disk tier is only used when a directory is configured
+DEFAULT_MAX_BYTES = int(os.environ.get('TEMPLATE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+DEFAULT_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+
+
+#key of a generated workbook, it changes whenever the instrument's columns or layout change or the generator
+#writes its workbooks differently
+def cache_key(instrument, num_request, table=False):
+    key = (f'{instrument}|{int(num_request)}|{layout_version(instrument)}'
+           f'|{TEMPLATE_FORMAT_VERSION}.{LAYOUT_MANIFEST_VERSION}')
+    if table:
+        key += '|table'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class TemplateCache:
+    #generated workbooks kept in an LRU bounded by total bytes, backed by an optional
+    #directory that several worker processes can share
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=DEFAULT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries), bytes=self.total_bytes, max_bytes=self.max_bytes)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    #return the workbook bytes for an instrument and sample count, building them on a miss
+    #stats (optional dict) records where the workbook came from ('cache') and, on a miss, the build stats
+    #progress (optional) follows the blocks written on a miss, see generator.build_workbook
+    def get(self, instrument, num_request, stats=None, table=False, progress=None):
+        if stats is None:
+            stats = {}
+        key = cache_key(instrument, num_request, table)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                stats['cache'] = 'memory'
+                return data
+
+        data = self.read_disk(key)
+        if data is not None:
+            stats['cache'] = 'disk'
+            with self.lock:
+                self.counters['disk_hits'] += 1
+        else:
+            stats['cache'] = 'miss'
+            if table:
+                data = generate_excel_file(instrument, num_request, stats, table=table, progress=progress)
+            else:
+                #sample block templates reuse the blocks of the last one built for the instrument
+                data = block_store.build(instrument, num_request, stats, progress)
+            with self.lock:
+                self.counters['misses'] += 1
+            self.write_disk(key, data)
+        self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        #entries larger than the whole cache are only kept on disk
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self.entries[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.counters['evictions'] += 1
+
+    #files are named by their key so every process sharing the directory finds the same entry
+    def disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.xlsx')
+
+    def read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_disk(self, key, data):
+        if not self.cache_dir:
+            return
+        path = self.disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #write to a temporary file first so other processes never read a partial workbook
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+#cache shared by every session in this process
+template_cache = TemplateCache()
+
+
+def cached_excel_file(instrument, num_request, stats=None, table=False, progress=None):
+    return template_cache.get(instrument, num_request, stats, table, progress)
@@ -0,0 +1,71 @@
+import concurrent.futures
+import io
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+from batch import generate_batch, get_pool, shutdown_pool
+from generator import template_filename
+
+JOBS = [('Karl Fischer', 2), ('Viscometer', 3), ('Karl Fischer', 4)]
+FILENAMES = [template_filename('Viscometer'), 'Karl Fischer_2_samples_data_template.xlsx',
+             'Karl Fischer_4_samples_data_template.xlsx']
+
+
+def check_archive(data, timings, jobs):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted(timing['file'] for timing in timings)
+        assert len(set(archive.namelist())) == len(timings)
+        for timing in timings:
+            member = archive.read(timing['file'])
+            assert timing['bytes'] == len(member)
+            assert timing['seconds'] >= 0
+            assert load_workbook(io.BytesIO(member), read_only=True).sheetnames[0] == 'Analysis'
+    assert [(timing['instrument'], timing['samples']) for timing in timings] == jobs
+
+
+#one member per job, named after the instrument and, for an instrument given twice, the sample count,
+#and one timing entry per job in the order the jobs were given
+def test_batch_zip_members_and_timings():
+    progress = []
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        data, timings, total = generate_batch(JOBS, pool=pool, progress=lambda *report: progress.append(report))
+    check_archive(data, timings, JOBS)
+    assert sorted(timing['file'] for timing in timings) == sorted(FILENAMES)
+    assert timings[1]['file'] == template_filename('Viscometer')
+    assert total >= max(timing['seconds'] for timing in timings) - 0.001
+    assert progress[-1] == (9, 9)
+
+
+#the same job given twice gets two members told apart by a running number
+def test_batch_identical_jobs():
+    jobs = [('Karl Fischer', 2), ('Karl Fischer', 2), ('Karl Fischer', 3)]
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        data, timings, _ = generate_batch(jobs, pool=pool)
+    check_archive(data, timings, jobs)
+    assert [timing['file'] for timing in timings] == ['Karl Fischer_2_samples_1_data_template.xlsx',
+                                                     'Karl Fischer_2_samples_2_data_template.xlsx',
+                                                     'Karl Fischer_3_samples_data_template.xlsx']
+
+
+def test_batch_labels_from_manifest():
+    labels = ['M-1', 'M-2']
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        data, timings, _ = generate_batch([('Karl Fischer', 10), ('Viscometer', 1)], pool=pool, labels=labels)
+    check_archive(data, timings, [('Karl Fischer', 2), ('Viscometer', 2)])
+
+
+def test_batch_unknown_instrument():
+    with pytest.raises(ValueError, match='Unknown instrument'):
+        generate_batch([('Karl Fischer', 1), ('Mass Spec', 1)], pool=concurrent.futures.ThreadPoolExecutor(1))
+
+
+#the spawned process pool the app and the cli use
+def test_batch_on_process_pool():
+    try:
+        data, timings, _ = generate_batch(JOBS[:2], pool=get_pool(1))
+    finally:
+        shutdown_pool()
+    check_archive(data, timings, JOBS[:2])
@@ -0,0 +1,73 @@
+import math
+
+import pandas as pd
+
+from calculations import calculate, standard_results
+from layouts import compile_layout
+
+
+def replicate_table(instrument, rows):
+    plan = compile_layout(instrument)
+    table = pd.DataFrame([dict(zip(plan.columns[1:], values)) for values in rows], columns=plan.columns[1:])
+    table.insert(0, plan.columns[0], 'S1')
+    table.insert(0, 'Replicate', range(1, len(rows) + 1))
+    table.insert(0, 'Sample', 1)
+    return table
+
+
+def standards_sheet(instrument, name):
+    return next(sheet for sheet in compile_layout(instrument).sheets if sheet['name'] == name)
+
+
+#=(E{stdev})/(E{average}) * 100 of one replicate is #DIV/0! in Excel since its STDEV is, not 0
+def test_single_replicate_rsd_is_an_error():
+    plan = compile_layout('Karl Fischer')
+    assert plan.stat_templates['stdev'][4] == '=STDEV(E{first}:E{last})'
+    assert plan.stat_templates['rsd'][4] == '=(E{stdev})/(E{average}) * 100'
+    _, samples = calculate('Karl Fischer', replicate_table('Karl Fischer', [[None, 0.5, 1.2, 4.0]]))
+    assert samples['H2O% average'].tolist() == [4.0]
+    assert math.isnan(samples['H2O% stdev'][0])
+    assert math.isnan(samples['H2O% rsd'][0])
+
+
+#with no Water entered AVERAGE(G{first}:G{last}) is #DIV/0! and so is every dry basis formula that uses it
+def test_blank_water_dry_basis_is_an_error():
+    instrument = 'KF & LECO CHN Combined'
+    plan = compile_layout(instrument)
+    dry_basis = [plan.columns.index(name) for name in ('C% Dry Basis', 'H% Dry Basis', 'O% Dry Basis')]
+    assert all('G{average}' in plan.stat_templates['average'][col_num] for col_num in dry_basis)
+    rows = [[0.002, 50.0, 6.0, 1.0], [0.002, 51.0, 6.0, 1.0], [0.002, 52.0, 6.0, 1.0]]
+    _, samples = calculate(instrument, replicate_table(instrument, rows))
+    assert samples['C% average'].tolist() == [51.0]
+    assert math.isnan(samples['Water average'][0])
+    for name in ('C% Dry Basis', 'H% Dry Basis', 'O% Dry Basis'):
+        assert math.isnan(samples[f'{name} average'][0])
+
+
+#blanks still count as 0 in arithmetic and are skipped by SUM, AVERAGE and STDEV
+def test_blank_cells_are_not_errors():
+    instrument = 'LECO CHN (Bio-Oil Method, Duplicate Analysis)'
+    replicates, samples = calculate(instrument, replicate_table(instrument, [[0.002, 70.0, 7.0, None],
+                                                                             [0.002, 72.0, 7.0, None]]))
+    assert replicates['O% (diff)'].tolist() == [23.0, 21.0]
+    assert samples['C% stdev'][0] == math.sqrt(2)
+    assert math.isnan(samples['N% average'][0])
+
+    instrument = 'Acids Titration'
+    replicates, samples = calculate(instrument, replicate_table(instrument, [[1.0, 3.0], [1.5, None]]))
+    assert replicates['PhAN mol/kg'].tolist() == [2.0, -1.5]
+    assert samples['TAN mol/kg range'].tolist() == [3.0]
+
+
+def test_standards_sheet_errors():
+    #one Water Standard entered, its STDEV and so the checked RSD are errors
+    sheet = standards_sheet('Karl Fischer', 'Water Standard')
+    (check,) = standard_results(sheet, {(1, 3): 1.01})
+    assert check['name'] == 'RSD%' and math.isnan(check['value'])
+    (check,) = standard_results(sheet, {(1, 3): 1.0, (2, 3): 1.0, (3, 3): 1.0})
+    assert check['value'] == 0.0
+    #an error read back from the workbook stays an error, a blank Measured value counts as 0
+    sheet = standards_sheet('Acids Titration', 'Vanillic Validation')
+    first, second = standard_results(sheet, {(1, 1): '#N/A'})
+    assert math.isnan(first['value'])
+    assert second['value'] == 100.0
@@ -0,0 +1,69 @@
+import io
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import cli
+from generator import COMBINED_FILENAME, template_filename
+
+
+@pytest.mark.parametrize('argv', [
+    [],
+    ['Mass Spec=3'],
+    ['Karl Fischer=0'],
+    ['--combined', '--shard-samples', '10', 'Karl Fischer=20', 'Viscometer=20'],
+    ['--shard-samples', '0', 'Karl Fischer=20'],
+    ['--shard-samples', '-5', 'Karl Fischer=20'],
+    ['--shard-samples', '10', 'Karl Fischer=20', 'Karl Fischer=30'],
+    ['--combined', 'Karl Fischer=2', 'Viscometer=3'],
+    ['-j', '--streaming', 'Karl Fischer=2', 'Viscometer=3'],
+    ['-o', '-', '--streaming', 'Karl Fischer=2', 'Viscometer=3'],
+    ['--table', '--streaming', 'Karl Fischer=2'],
+])
+def test_rejected_options(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(argv)
+    assert exit_info.value.code == 2
+    assert 'error:' in capsys.readouterr().err
+
+
+def sheet_names(data):
+    return load_workbook(io.BytesIO(data), read_only=True).sheetnames
+
+
+@pytest.mark.parametrize('options', [[], ['--streaming'], ['--table'], ['-j']])
+def test_directory_output(tmp_path, capsys, options):
+    assert cli.main(['-o', str(tmp_path), *options, 'Karl Fischer=2', 'Viscometer=3']) == 0
+    for instrument in ('Karl Fischer', 'Viscometer'):
+        assert 'Analysis' in sheet_names((tmp_path / template_filename(instrument)).read_bytes())
+    assert '2 file(s)' in capsys.readouterr().err
+
+
+#the same job given twice is written to two files, not once over the other
+@pytest.mark.parametrize('options', [[], ['-j']])
+def test_directory_output_identical_jobs(tmp_path, capsys, options):
+    assert cli.main(['-o', str(tmp_path), *options, 'Karl Fischer=3', 'Karl Fischer=3']) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f'Karl Fischer_3_samples_{copy}_data_template.xlsx'
+                                                                for copy in (1, 2)]
+    assert '2 file(s)' in capsys.readouterr().err
+
+
+def test_directory_output_combined(tmp_path):
+    assert cli.main(['-o', str(tmp_path), '--combined', 'Karl Fischer=2', 'Viscometer=2']) == 0
+    assert [path.name for path in tmp_path.iterdir()] == [COMBINED_FILENAME]
+    assert {'Samples', 'KF Analysis', 'Viscometer Analysis'} <= set(sheet_names(
+        (tmp_path / COMBINED_FILENAME).read_bytes()))
+
+
+#one job is written to stdout as the workbook itself, several as a zip, the report goes to stderr
+def test_stdout_output(capsysbinary):
+    assert cli.main(['-o', '-', 'Karl Fischer=2']) == 0
+    captured = capsysbinary.readouterr()
+    assert 'Analysis' in sheet_names(captured.out)
+    assert b'<stdout>' in captured.err
+
+    assert cli.main(['-o', '-', 'Karl Fischer=2', 'Viscometer=3']) == 0
+    with zipfile.ZipFile(io.BytesIO(capsysbinary.readouterr().out)) as archive:
+        assert sorted(archive.namelist()) == sorted([template_filename('Karl Fischer'),
+                                                     template_filename('Viscometer')])
@@ -0,0 +1,361 @@
+import inspect
+import io
+import re
+import statistics
+import zipfile
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string, coordinate_to_tuple, get_column_letter
+from openpyxl.worksheet.pagebreak import Break
+from xlsxwriter.worksheet import Worksheet
+
+import generator
+from calculations import calculate
+from generator import REGISTER_SHEET, generate_combined_file, generate_excel_file
+from layouts import compile_layout, instrument_columns, sample_labels
+from reader import read_completed_template, read_layout_manifest, read_standard_sheets
+
+INSTRUMENTS = list(instrument_columns)
+
+
+#every sheet is written in one pass and the Analysis sheet has no conditional formats, whatever the size
+@pytest.mark.parametrize('instrument', INSTRUMENTS)
+@pytest.mark.parametrize('num_request', [1, 25])
+@pytest.mark.parametrize('table', [False, True])
+def test_sheets_written_once(instrument, num_request, table):
+    stats = {}
+    generate_excel_file(instrument, num_request, stats, table=table)
+    assert stats['sheet_writes'] and set(stats['sheet_writes'].values()) == {1}
+    assert stats['conditional_formats']['Analysis'] == 0
+
+
+#type values into the input cells of a template the way someone filling it in would, returns the workbook
+#and {(sample, replicate, column): value}
+def fill_template(instrument, num_request):
+    plan = compile_layout(instrument)
+    workbook = load_workbook(io.BytesIO(generate_excel_file(instrument, num_request)))
+    worksheet = workbook['Analysis']
+    entered = {}
+    for sample_index in range(num_request):
+        for replicate_index in range(plan.replicates):
+            row = plan.first_row(sample_index) + replicate_index + 1
+            for col_num, cell in enumerate(plan.replicate_row):
+                if cell != '':
+                    continue
+                value = round(1 + sample_index + col_num / 10 + replicate_index / 100, 4)
+                worksheet.cell(row, col_num + 1, value)
+                entered[(sample_index + 1, replicate_index + 1, plan.columns[col_num])] = value
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output, entered
+
+
+@pytest.mark.parametrize('instrument', INSTRUMENTS)
+def test_fill_read_calculate_round_trip(instrument):
+    plan = compile_layout(instrument)
+    num_request = 4
+    source, entered = fill_template(instrument, num_request)
+    replicates = read_completed_template(source, instrument)
+    assert len(replicates) == num_request * plan.replicates
+    assert replicates[plan.columns[0]].tolist() == [label for label in sample_labels(num_request)
+                                                    for _ in range(plan.replicates)]
+    rows = replicates.set_index(['Sample', 'Replicate'])
+    for (sample, replicate, column), value in entered.items():
+        assert rows.loc[(sample, replicate), column] == pytest.approx(value)
+
+    replicates, samples = calculate(instrument, replicates)
+    assert samples['Sample'].tolist() == list(range(1, num_request + 1))
+    for col_num, cell in enumerate(plan.replicate_row):
+        if isinstance(cell, str) and cell.startswith('='):
+            assert replicates[plan.columns[col_num]].notna().all()
+    if 'O% (diff)' in plan.columns:
+        expected = 100 - replicates[['C%', 'H%', 'N%']].sum(axis=1)
+        assert replicates['O% (diff)'].tolist() == pytest.approx(expected.tolist())
+    if 'PhAN mol/kg' in plan.columns:
+        expected = replicates['TAN mol/kg'] - replicates['CAN mol/kg']
+        assert replicates['PhAN mol/kg'].tolist() == pytest.approx(expected.tolist())
+    for col_num, cell in enumerate(plan.stat_templates.get('average', [])):
+        if isinstance(cell, str) and cell.startswith('=AVERAGE('):
+            column = plan.columns[col_num]
+            expected = replicates.groupby('Sample')[column].mean()
+            assert samples[f'{column} average'].tolist() == pytest.approx(expected.tolist())
+
+
+#the r attributes of rows and cells are optional, a row or cell without one follows the one before it,
+#drop leaves them out with empty rows and cells filling the gaps and move puts them last in the tag
+def rewrite_references(sheet_xml, how):
+    if how == 'move':
+        sheet_xml = re.sub(rb'<row r="(\d+)"([^>]*?)>', rb'<row\2 r="\1">', sheet_xml)
+        return re.sub(rb'<c r="([A-Z]+\d+)"([^>]*?)(/?)>', rb'<c\2 r="\1"\3>', sheet_xml)
+    last = {'row': 0, 'col': 0}
+
+    def fill_gap(match):
+        if match.group(1):
+            row_num = int(match.group(1))
+            gap = row_num - last['row'] - 1
+            last.update(row=row_num, col=0)
+            return b'<row/>' * gap + b'<row'
+        col_num = column_index_from_string(match.group(2).decode())
+        gap = col_num - last['col'] - 1
+        last['col'] = col_num
+        return b'<c/>' * gap + b'<c'
+
+    return re.sub(rb'<row r="(\d+)"|<c r="([A-Z]+)\d+"', fill_gap, sheet_xml)
+
+
+@pytest.mark.parametrize('how', ['drop', 'move'])
+def test_read_without_leading_references(how):
+    instrument = 'LECO CHN (Bio-Oil Method, Triplicate Analysis)'
+    source, _ = fill_template(instrument, 4)
+    output = io.BytesIO()
+    with zipfile.ZipFile(source) as archive, zipfile.ZipFile(output, 'w') as rewritten:
+        for name in archive.namelist():
+            data = archive.read(name)
+            if name.startswith('xl/worksheets/sheet'):
+                data = rewrite_references(data, how)
+                assert how == 'move' or b' r="' not in data
+            rewritten.writestr(name, data)
+
+    source.seek(0)
+    expected = read_completed_template(source, instrument)
+    output.seek(0)
+    pd.testing.assert_frame_equal(read_completed_template(output, instrument), expected)
+    source.seek(0)
+    output.seek(0)
+    assert read_standard_sheets(output, instrument) == read_standard_sheets(source, instrument)
+
+
+#manual page breaks are written after the last row of a sheet as a <rowBreaks> element
+def test_read_with_row_breaks():
+    instrument = 'LECO CHN (Bio-Oil Method, Triplicate Analysis)'
+    source, _ = fill_template(instrument, 4)
+    expected = read_completed_template(source, instrument)
+    source.seek(0)
+    standards = read_standard_sheets(source, instrument)
+    source.seek(0)
+    workbook = load_workbook(source)
+    for worksheet in workbook.worksheets:
+        worksheet.row_breaks.append(Break(id=5))
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    pd.testing.assert_frame_equal(read_completed_template(output, instrument), expected)
+    output.seek(0)
+    assert read_standard_sheets(output, instrument) == standards
+
+
+#the register of a streamed workbook keeps every metadata value, constant memory mode drops cells written to
+#rows it has already flushed
+@pytest.mark.parametrize('streaming', [False, True])
+@pytest.mark.parametrize('combined', [False, True])
+def test_register_metadata(streaming, combined):
+    labels = ['S1', 'S2', 'S3']
+    metadata = {'Lot': ['L1', None, 'L3'], 'Depth (m)': [1.5, 2.5, None]}
+    if combined:
+        data = generate_combined_file(['Karl Fischer', 'Viscometer'], 3, streaming=streaming, labels=labels,
+                                      metadata=metadata)
+    else:
+        data = generate_excel_file('Karl Fischer', 3, streaming=streaming, labels=labels, metadata=metadata)
+    rows = list(load_workbook(io.BytesIO(data))[REGISTER_SHEET].iter_rows(values_only=True))
+    assert rows == [('Sample ID', 'Lot', 'Depth (m)'), ('S1', 'L1', 1.5), ('S2', None, 2.5), ('S3', 'L3', None)]
+
+
+#TemplateWorksheet skips xlsxwriter's formula rewriting, every formula it writes must come out as xlsxwriter
+#would have written it, an xlsxwriter upgrade that changes _prepare_formula shows up here
+def test_formulas_match_xlsxwriter(monkeypatch):
+    prepared = []
+    prepare = generator.TemplateWorksheet._prepare_formula
+
+    def record(self, formula, expand_future_functions=False):
+        result = prepare(self, formula, expand_future_functions)
+        prepared.append((formula, result, Worksheet._prepare_formula(self, formula, expand_future_functions)))
+        return result
+
+    monkeypatch.setattr(generator.TemplateWorksheet, '_prepare_formula', record)
+    for instrument in INSTRUMENTS:
+        generate_excel_file(instrument, 3)
+        generate_excel_file(instrument, 3, table=True)
+    generate_combined_file(INSTRUMENTS, 3)
+    assert prepared
+    for formula, result, expected in prepared:
+        assert result == expected, formula
+
+
+#the override has to keep the signature of the private method it replaces, xlsxwriter is only pinned to a
+#minor release so a patch release that changes it fails here
+def test_prepare_formula_signature():
+    assert inspect.signature(generator.TemplateWorksheet._prepare_formula) == \
+        inspect.signature(Worksheet._prepare_formula)
+
+
+#the dry basis columns of KF & LECO CHN Combined are worked out from the sample averages, in table mode they are
+#calculated columns of the sample table and the analysis table's total row has no blank column to average
+def test_table_mode_dry_basis():
+    instrument = 'KF & LECO CHN Combined'
+    plan = compile_layout(instrument)
+    dry_basis = ['C% Dry Basis', 'H% Dry Basis', 'O% Dry Basis']
+    workbook = load_workbook(io.BytesIO(generate_excel_file(instrument, 2, table=True)))
+    (analysis,) = workbook['Analysis'].tables.values()
+    assert [column.name for column in analysis.tableColumns] == [name for name in plan.columns if name not in dry_basis]
+    (samples,) = workbook['Sample Averages'].tables.values()
+    formulas = {column.name: column.calculatedColumnFormula for column in samples.tableColumns}
+    assert all(formulas[name] is not None for name in dry_basis)
+    assert formulas['C% Dry Basis'].attr_text == ('(SampleAverages[[#This Row],[C%]])/'
+                                                  '(100-SampleAverages[[#This Row],[Water]])*100')
+
+    worksheet = workbook['Analysis']
+    for row in range(2, 2 + 2 * plan.replicates):
+        for col_num, value in enumerate([1.0, 50.0, 6.0, 1.0], 2):
+            worksheet.cell(row, col_num, value)
+        worksheet.cell(row, 7, 10.0)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    replicates = read_completed_template(output, instrument)
+    assert len(replicates) == 2 * plan.replicates
+    assert replicates['Water'].tolist() == [10.0] * len(replicates)
+    assert replicates[dry_basis].isna().all().all()
+
+
+#a replicate table with every replicate of S1 filled in, only the first replicate of S2 and a single replicate of S3
+#with nothing but its first input
+def prefill_replicates(instrument):
+    plan = compile_layout(instrument)
+    inputs = [col_num for col_num, cell in enumerate(plan.replicate_row) if cell == '']
+    rows = []
+    for sample, replicates in ((1, plan.replicates), (2, 1)):
+        for replicate in range(1, replicates + 1):
+            row = {'Sample': sample, 'Replicate': replicate, plan.columns[0]: f'S{sample}'}
+            row.update({plan.columns[col_num]: round(col_num + sample + replicate / 10, 2) for col_num in inputs})
+            rows.append(row)
+    rows.append({'Sample': 3, 'Replicate': 1, plan.columns[0]: 'S3', plan.columns[inputs[0]]: 1.5})
+    return pd.DataFrame(rows, columns=['Sample', 'Replicate'] + plan.columns)
+
+
+class ExcelError(Exception):
+    pass
+
+
+#the sheet's formulas worked out by Python's eval, apart from the calculation engine: blank and text cells count
+#as 0 and are skipped by SUM/AVERAGE/STDEV, an error (raised) makes every formula that uses it an error
+def sheet_evaluator(worksheet):
+    cells = {cell.coordinate: cell.value for row in worksheet.iter_rows() for cell in row}
+    results = {}
+
+    def value(coordinate):
+        if coordinate not in results:
+            cell = cells.get(coordinate)
+            if isinstance(cell, str) and cell.startswith('='):
+                try:
+                    text = reference_pattern.sub(lambda match: f"R{match.groups()}" if match.group(2) else
+                                                 f"V('{match.group(1)}')", cell[1:])
+                    results[coordinate] = eval(text, {'R': cell_range, 'V': reference, **excel_functions})
+                except (ExcelError, ZeroDivisionError, statistics.StatisticsError) as error:
+                    results[coordinate] = error
+            else:
+                results[coordinate] = cell
+        if isinstance(results[coordinate], Exception):
+            raise ExcelError(coordinate)
+        return results[coordinate]
+
+    def reference(coordinate):
+        cell = value(coordinate)
+        return cell if isinstance(cell, (int, float)) else 0
+
+    def cell_range(first, last):
+        (first_row, first_col), (last_row, last_col) = coordinate_to_tuple(first), coordinate_to_tuple(last)
+        return [cell for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)
+                for cell in [value(f'{get_column_letter(col)}{row}')] if isinstance(cell, (int, float))]
+    return value
+
+
+reference_pattern = re.compile(r'\b([A-Z]+\d+)(?::([A-Z]+\d+))?\b')
+excel_functions = {'SUM': sum, 'AVERAGE': statistics.mean, 'STDEV': statistics.stdev, 'ABS': abs}
+
+
+#every cached result of a prefilled template is what its formula text works out to from the cells of the sheet,
+#errors included (the one replicate of S2 has no STDEV, the blanks of S3 no AVERAGE)
+@pytest.mark.parametrize('instrument', INSTRUMENTS)
+def test_prefill_cached_values_match_formulas(instrument):
+    data = generate_excel_file(instrument, 0, replicates=prefill_replicates(instrument))
+    formulas = load_workbook(io.BytesIO(data))['Analysis']
+    cached = load_workbook(io.BytesIO(data), data_only=True)['Analysis']
+    value = sheet_evaluator(formulas)
+    checked = errors = 0
+    for row in formulas.iter_rows():
+        for cell in row:
+            if not (isinstance(cell.value, str) and cell.value.startswith('=')):
+                continue
+            result = cached.cell(cell.row, cell.column).value
+            try:
+                assert result == pytest.approx(value(cell.coordinate)), cell.coordinate
+            except ExcelError:
+                assert result == generator.ERROR_VALUE, cell.coordinate
+                errors += 1
+            checked += 1
+    plan = compile_layout(instrument)
+    assert checked or not plan.stat_names
+    assert errors or 'stdev' not in plan.stat_names
+
+
+#every pair of instruments in both orders makes a combined workbook whose sheet names fit Excel, and the
+#manifest lists the sheet each instrument's standards went on
+@pytest.mark.parametrize('first', INSTRUMENTS)
+def test_combined_pairs(first):
+    for second in INSTRUMENTS:
+        if second == first:
+            continue
+        data = generate_combined_file([first, second], 1)
+        workbook = load_workbook(io.BytesIO(data), read_only=True)
+        assert all(len(name) <= generator.EXCEL_MAX_SHEET_NAME for name in workbook.sheetnames)
+        assert len({name.lower() for name in workbook.sheetnames}) == len(workbook.sheetnames)
+        for instrument, layout in zip([first, second], read_layout_manifest(io.BytesIO(data))['sheets']):
+            specs = compile_layout(instrument).sheets
+            assert set(layout['standards']) == {sheet['name'] for sheet in specs}
+            assert set(layout['standards'].values()) <= set(workbook.sheetnames)
+            assert set(read_standard_sheets(io.BytesIO(data), instrument)) == set(layout['standards'])
+
+
+#values typed into one instrument's sheets of a combined workbook, its renamed standards sheet included,
+#come back out of the workbook for that instrument only
+def test_combined_read_round_trip():
+    instruments = ['KF & LECO CHN Combined', 'LECO CHN (Bio-Oil Method, Triplicate Analysis)']
+    instrument = instruments[1]
+    plan = compile_layout(instrument)
+    num_request = 3
+    data = generate_combined_file(instruments, num_request, labels=['A-1', 'A-2', 'A-3'])
+    layout = read_layout_manifest(io.BytesIO(data))['sheets'][1]
+    assert layout['standards'] == {'Cresol Testing': 'Cresol Testing (2)'}
+
+    workbook = load_workbook(io.BytesIO(data))
+    worksheet = workbook[layout['sheet']]
+    entered = {}
+    for sample_index in range(num_request):
+        for replicate_index in range(plan.replicates):
+            row = plan.first_row(sample_index) + replicate_index + 1
+            for col_num in range(1, 5):
+                value = round(col_num * 10 + sample_index + replicate_index / 10, 2)
+                worksheet.cell(row, col_num + 1, value)
+                entered[(sample_index + 1, replicate_index + 1, plan.columns[col_num])] = value
+    workbook['Cresol Testing (2)'].cell(8, 3, 77.5)
+    workbook['Cresol Testing'].cell(8, 3, 12.0)
+    output = io.BytesIO()
+    workbook.save(output)
+
+    for sheet_name in (None, layout['sheet']):
+        output.seek(0)
+        replicates = read_completed_template(output, instrument, sheet_name=sheet_name)
+        assert replicates[plan.columns[0]].tolist() == [label for label in ['A-1', 'A-2', 'A-3']
+                                                        for _ in range(plan.replicates)]
+        rows = replicates.set_index(['Sample', 'Replicate'])
+        for (sample, replicate, column), value in entered.items():
+            assert rows.loc[(sample, replicate), column] == value
+    output.seek(0)
+    assert read_completed_template(output, instruments[0]).empty
+    output.seek(0)
+    assert read_standard_sheets(output, instrument)['Cresol Testing'][(7, 2)] == 77.5
+    output.seek(0)
+    assert read_standard_sheets(output, instruments[0])['Cresol Testing'][(7, 2)] == 12.0
@@ -0,0 +1,75 @@
+import datetime
+import io
+import re
+import zipfile
+
+import pytest
+
+import incremental
+from generator import build_workbook
+from incremental import CHUNK_SAMPLES, BlockStore
+from layouts import instrument_columns
+
+#counts that grow, shrink and end on both sides of a chunk boundary
+SAMPLE_COUNTS = [3, 1, 2, 7, CHUNK_SAMPLES, CHUNK_SAMPLES + 1, 2 * CHUNK_SAMPLES + 5, CHUNK_SAMPLES - 1, 1]
+
+
+class FixedDateTime(datetime.datetime):
+    #datetime whose now is a fixed time
+
+    @classmethod
+    def at(cls, fixed):
+        return type('FixedDateTime', (cls,), {'fixed': fixed})
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fixed.replace(tzinfo=tz)
+
+
+def full_build(instrument, num_request):
+    output = io.BytesIO()
+    build_workbook(instrument, num_request, output, streaming=True, stable_formats=True)
+    return output.getvalue()
+
+
+#every part of the package with the times of the document properties left out, and the zip entry of each,
+#reading a part checks its crc
+def package_parts(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        parts = {info.filename: (info.date_time, info.compress_type, info.file_size,
+                                 incremental.core_date_pattern.sub(rb'\1', archive.read(info)))
+                 for info in archive.infolist()}
+        return list(parts), parts
+
+
+def core_times(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        core = archive.read(incremental.CORE_PROPERTIES).decode()
+    return [datetime.datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%SZ')
+            for match in re.finditer(r'<dcterms:(?:created|modified)\b[^>]*>([^<]*)', core)]
+
+
+#the store relies on xlsxwriter writing the same bytes for a sample whatever is around it, an upgrade that
+#breaks that shows up here, every part and zip entry has to match a full build, the document properties
+#are stamped with the time the workbook is assembled and not the time the stored one was built
+@pytest.mark.parametrize('instrument', list(instrument_columns))
+def test_block_store_matches_full_build(instrument, monkeypatch):
+    store = BlockStore()
+    for number, num_request in enumerate(SAMPLE_COUNTS):
+        assembled_at = datetime.datetime(2024, 7, 1 + number, 12, 30, 15)
+        monkeypatch.setattr(incremental.datetime, 'datetime', FixedDateTime.at(assembled_at))
+        stats = {}
+        data = store.build(instrument, num_request, stats)
+        monkeypatch.undo()
+        assert package_parts(data) == package_parts(full_build(instrument, num_request)), (num_request, stats)
+        if stats['incremental'] != 'full':
+            assert core_times(data) == [assembled_at, assembled_at]
+
+
+def test_block_store_is_bounded_in_bytes():
+    store = BlockStore(max_bytes=200 * 1024)
+    for instrument in instrument_columns:
+        store.build(instrument, 500)
+        assert store.total_bytes <= store.max_bytes
+    assert 0 < len(store.states) < len(instrument_columns)
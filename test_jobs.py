@@ -0,0 +1,90 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from generator import CHUNK_SAMPLES, generate_excel_file
+from jobs import GenerationCancelled, Job
+
+INSTRUMENT = 'Karl Fischer'
+
+
+def test_fraction():
+    job = Job('empty', 0)
+    assert job.fraction() == 0.0
+    job = Job('ten', 10)
+    assert job.fraction() == 0.0
+    job.report(5, 10)
+    assert job.fraction() == 0.5
+    job.report(12, 10)
+    assert job.fraction() == 1.0
+    job.cancel()
+    with pytest.raises(GenerationCancelled):
+        job.report(6, 10)
+
+
+#queued until a worker picks it up, running while the build reports progress, then done, failed or cancelled
+@pytest.mark.parametrize('outcome', ['done', 'failed', 'cancelled'])
+def test_status_changes(outcome):
+    started = threading.Event()
+    release = threading.Event()
+    statuses = []
+
+    def build(progress):
+        started.set()
+        release.wait(5)
+        progress(1, 2)
+        statuses.append(job.status)
+        if outcome == 'failed':
+            raise ValueError('broken layout')
+        progress(2, 2)
+        return b'workbook'
+
+    job = Job('test', 2)
+    assert job.status == 'queued' and not job.finished()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        job.future = executor.submit(job.run, build)
+        assert started.wait(5)
+        assert job.status == 'running' and not job.finished()
+        if outcome == 'cancelled':
+            job.cancel()
+        release.set()
+    assert job.finished() and job.status == outcome
+    assert statuses == ([] if outcome == 'cancelled' else ['running'])
+    assert job.result == (b'workbook' if outcome == 'done' else None)
+    assert isinstance(job.error, ValueError) == (outcome == 'failed')
+    assert job.seconds is not None
+
+
+def test_cancel_queued_job_never_runs():
+    release = threading.Event()
+    calls = []
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        blocker = executor.submit(release.wait, 5)
+        job = Job('queued', 1)
+        job.future = executor.submit(job.run, lambda progress: calls.append(progress))
+        job.cancel()
+        assert job.status == 'cancelled'
+        release.set()
+        blocker.result()
+    assert calls == [] and job.result is None and job.seconds is None
+
+
+#cancelling while the generator is writing sample blocks stops the build at its next progress report
+def test_cancel_mid_build():
+    reports = []
+
+    def build(progress):
+        def report(done, total):
+            reports.append(done)
+            progress(done, total)
+            #cancelled once the first chunk of blocks is written
+            job.cancel()
+        return generate_excel_file(INSTRUMENT, num_request, progress=report)
+
+    num_request = 2 * CHUNK_SAMPLES + 1
+    job = Job('large', num_request)
+    job.run(build)
+    assert job.status == 'cancelled' and job.result is None and job.error is None
+    assert reports == [CHUNK_SAMPLES, 2 * CHUNK_SAMPLES]
+    assert job.done == CHUNK_SAMPLES and job.fraction() < 1
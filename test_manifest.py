@@ -0,0 +1,54 @@
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from manifest import MAX_REPORTED_DUPLICATES, read_manifest
+
+
+def csv_file(rows):
+    return io.BytesIO('\n'.join(','.join(map(str, row)) for row in rows).encode('utf-8'))
+
+
+def xlsx_file(rows):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+MAKERS = {'manifest.csv': csv_file, 'manifest.xlsx': xlsx_file}
+
+
+@pytest.mark.parametrize('filename', MAKERS)
+def test_read_manifest(filename):
+    rows = [['Sample ID', 'Lot', 'Depth (m)', ''], ['A-1', 'L7', 1.5, None], [None, None, None, None],
+            ['A-2', 'L8', 2, None]]
+    labels, metadata = read_manifest(MAKERS[filename](rows), filename)
+    assert labels == ['A-1', 'A-2']
+    assert list(metadata) == ['Lot', 'Depth (m)'] and metadata['Lot'] == ['L7', 'L8']
+
+
+#duplicates are found across chunks and reported with the rows they are on in the file
+@pytest.mark.parametrize('filename', MAKERS)
+def test_duplicate_ids(filename):
+    rows = [['Sample ID', 'Lot'], ['A-1', 'L1'], ['A-2', 'L2'], ['A-3', 'L3'], ['A-1', 'L4'], ['A-3', 'L5']]
+    with pytest.raises(ValueError, match=r'^Duplicate sample IDs: A-1 \(rows 2 and 5\), A-3 \(rows 4 and 6\)$'):
+        read_manifest(MAKERS[filename](rows), filename, chunk_rows=2)
+
+
+def test_duplicate_ids_cut_short():
+    rows = [['Sample ID']] + [['A-1']] * (MAX_REPORTED_DUPLICATES + 4)
+    with pytest.raises(ValueError, match=r' and 3 more$'):
+        read_manifest(csv_file(rows), 'manifest.csv')
+
+
+@pytest.mark.parametrize('filename', MAKERS)
+def test_duplicate_headers(filename):
+    rows = [['Sample ID', 'Lot', 'Depth', 'Lot ', 'Sample ID', 'lot'], ['A-1', 'L1', 1, 'L2', 'X', 'l']]
+    with pytest.raises(ValueError, match=r'^Duplicate column headers: Sample ID \(columns 1 and 5\), '
+                                         r'Lot \(columns 2 and 4\)$'):
+        read_manifest(MAKERS[filename](rows), filename)
@@ -0,0 +1,142 @@
+import datetime
+import io
+
+import numpy
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from control_charts import BASELINE_POINTS, POINT_COLUMNS, add_point, new_state
+from generator import generate_excel_file
+from layouts import compile_layout
+from results_store import ResultsStore
+
+INSTRUMENT = 'Karl Fischer'
+
+
+#a Karl Fischer template with S1 in triplicate, one replicate of S2 with #N/A typed as its H2O% and the
+#given Water Standard H2O% values
+def kf_workbook(water_standards):
+    plan = compile_layout(INSTRUMENT)
+    workbook = load_workbook(io.BytesIO(generate_excel_file(INSTRUMENT, 2, labels=['S1', 'S2'])))
+    worksheet = workbook['Analysis']
+    for replicate_index in range(plan.replicates):
+        row = plan.first_row(0) + replicate_index + 1
+        for col_num, value in enumerate([1.0, 0.5, 1.2, 4.0 + replicate_index / 10], 1):
+            worksheet.cell(row, col_num + 1, value)
+    row = plan.first_row(1) + 1
+    for col_num, value in enumerate([1.0, 0.5, 1.2, '#N/A'], 1):
+        worksheet.cell(row, col_num + 1, value)
+    for row, value in enumerate(water_standards, 2):
+        workbook['Water Standard'].cell(row, 4, value)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+#errors are kept as NULL, a check that is an error has no passed flag and is no point of its control chart
+def test_ingest_keeps_errors_as_null():
+    store = ResultsStore(':memory:')
+    store.ingest(kf_workbook([1.01]), INSTRUMENT, '2024-07-01', 'single.xlsx')
+    store.ingest(kf_workbook([1.0, 1.01, 1.02]), INSTRUMENT, '2024-07-02', 'triplicate.xlsx')
+
+    replicates = store.sample_results('S2')['kf']
+    assert len(replicates) == 2
+    #columns with nothing but NULL are left out of the lookup
+    assert 'h2o' not in replicates and replicates['titrant_ml'].tolist() == [1.2, 1.2]
+    assert store.sample_results('S1')['kf']['h2o'].notna().all()
+
+    checks = store.standard_checks('Water Standard', 'RSD%')
+    assert checks['run_date'].tolist() == ['2024-07-01', '2024-07-02']
+    error, check = checks.to_dict('records')
+    assert pd.isna(error['value']) and pd.isna(error['passed']) and pd.isna(error['signal'])
+    assert check['value'] > 0 and check['passed'] == 1
+    assert store.query('SELECT COUNT(*) FROM standard_checks WHERE value IS NULL').iloc[0, 0] == 1
+
+    assert store.control_chart('Water Standard', 'RSD%')['run_date'].tolist() == ['2024-07-02']
+    assert store.control_status()['count'].tolist() == [1]
+
+
+#a standards sheet with nothing typed into it gives no checks
+def test_ingest_skips_empty_standards():
+    store = ResultsStore(':memory:')
+    store.ingest(kf_workbook([]), INSTRUMENT, '2024-07-01')
+    assert store.standard_checks().empty
+    assert len(store.sample_results('S1')['kf']) == 3
+
+
+#saving the same workbook again returns the run it was kept as, its results and checks are not kept twice
+def test_ingest_same_workbook_once():
+    store = ResultsStore(':memory:')
+    data = kf_workbook([1.0, 1.01, 1.02]).getvalue()
+    run_id = store.ingest(io.BytesIO(data), INSTRUMENT, '2024-07-01', 'run.xlsx')
+    assert store.ingest(io.BytesIO(data), INSTRUMENT, '2024-07-01', 'run.xlsx') == run_id
+    assert store.ingest_many([(io.BytesIO(data), INSTRUMENT, '2024-07-02')] * 2) == [run_id, run_id]
+    other = store.ingest(kf_workbook([1.0, 1.02]), INSTRUMENT, '2024-07-02')
+    assert other != run_id
+    assert len(store.runs()) == 2
+    assert len(store.sample_results('S1')['kf']) == 6
+    assert store.control_status()['count'].tolist() == [2]
+
+
+#the sample results are kept next to the replicates, the dry basis results of a sample only exist as results
+def test_ingest_keeps_sample_results():
+    store = ResultsStore(':memory:')
+    store.ingest(kf_workbook([1.0]), INSTRUMENT, '2024-07-01')
+    (kf,) = store.sample_statistics('S1')['kf'].to_dict('records')
+    assert kf['instrument'] == INSTRUMENT and kf['sample'] == 1
+    assert kf['h2o_average'] == pytest.approx(4.1) and kf['h2o_stdev'] == pytest.approx(0.1)
+    assert 'h2o_average' not in store.sample_statistics('S2')['kf']
+
+    instrument = 'KF & LECO CHN Combined'
+    plan = compile_layout(instrument)
+    workbook = load_workbook(io.BytesIO(generate_excel_file(instrument, 1, labels=['S1'])))
+    for replicate_index in range(plan.replicates):
+        row = plan.first_row(0) + replicate_index + 1
+        #mass, C%, H%, N% and water
+        for col_num, value in zip([2, 3, 4, 5, 7], [0.01, 50 + replicate_index, 7.0, 0.5, 20.0]):
+            workbook['Analysis'].cell(row, col_num, value)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    store.ingest(output, instrument, '2024-07-01')
+    (chn,) = store.sample_statistics('S1')['chn'].to_dict('records')
+    assert chn['c_average'] == pytest.approx(51)
+    assert chn['c_dry_basis_average'] == pytest.approx(51 / 80 * 100)
+    assert chn['h_dry_basis_average'] == pytest.approx((7 - 20 * 0.111) / 80 * 100)
+
+
+def check_run(run_date, value):
+    return {'instrument': INSTRUMENT, 'run_date': run_date, 'source': None,
+            'replicates': pd.DataFrame(columns=['Sample', 'Replicate'] + compile_layout(INSTRUMENT).columns),
+            'checks': [{'sheet': 'Water Standard', 'name': 'RSD%', 'cell': 'D7', 'value': value, 'low': 0,
+                        'high': 1.5}]}
+
+
+#a run dated before the runs already kept makes the store work the whole series out again, its points and
+#running state end up as if every run had come in date order
+@pytest.mark.parametrize('backdated_at', [0, BASELINE_POINTS - 1, BASELINE_POINTS + 3])
+def test_backdated_run_recomputes_series(backdated_at):
+    values = [0.5 + 0.05 * ((number * 7) % 11) for number in range(BASELINE_POINTS + 10)]
+    dates = [(datetime.date(2024, 1, 1) + datetime.timedelta(days=number)).isoformat() for number in range(len(values))]
+    store = ResultsStore(':memory:')
+    store.add_runs([check_run(date, value) for number, (date, value) in enumerate(zip(dates, values))
+                    if number != backdated_at])
+    store.add_runs([check_run(dates[backdated_at], values[backdated_at])])
+
+    state = new_state()
+    expected = [add_point(state, value, 0, 1.5, date) for date, value in zip(dates, values)]
+    points = store.standard_checks('Water Standard', 'RSD%')
+    assert points['run_date'].tolist() == dates
+    for column in POINT_COLUMNS:
+        stored = points[column].tolist()
+        if column == 'signal':
+            assert stored == [point['signal'] for point in expected]
+        else:
+            assert numpy.allclose(numpy.array(stored, dtype=float),
+                                  numpy.array([point[column] for point in expected], dtype=float), equal_nan=True)
+    (status,) = store.control_status().to_dict('records')
+    assert status['count'] == len(values) and status['last_date'] == dates[-1]
+    for column in ('baseline_mean', 'baseline_m2', 'ewma', 'cusum_high', 'cusum_low'):
+        assert status[column] == pytest.approx(state[column])
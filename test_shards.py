@@ -0,0 +1,78 @@
+import concurrent.futures
+import io
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import batch
+from layouts import compile_layout, max_samples
+from shards import (generate_sharded, index_filename, needs_sharding, shard_filenames, shard_ranges, shard_size,
+                    write_index)
+
+INSTRUMENT = 'LECO CHN (Bio-Oil Method, Triplicate Analysis)'
+
+
+@pytest.mark.parametrize('num_request, size, expected', [
+    (1, 3, [(0, 1)]),
+    (3, 3, [(0, 3)]),
+    (4, 3, [(0, 3), (3, 4)]),
+    (9, 3, [(0, 3), (3, 6), (6, 9)]),
+    (10, 3, [(0, 3), (3, 6), (6, 9), (9, 10)]),
+])
+def test_shard_ranges(num_request, size, expected):
+    assert shard_ranges(num_request, size) == expected
+
+
+@pytest.mark.parametrize('table', [False, True])
+def test_shard_size_and_boundary(table):
+    plan = compile_layout(INSTRUMENT)
+    assert shard_size(INSTRUMENT, 5, table) == 5
+    assert shard_size(INSTRUMENT, 10 ** 9, table) == max_samples(plan, table)
+    assert not needs_sharding(INSTRUMENT, 5, 5, table)
+    assert needs_sharding(INSTRUMENT, 6, 5, table)
+    assert shard_filenames(INSTRUMENT, 10)[0] == f'{INSTRUMENT}_part01_data_template.xlsx'
+
+
+#every sample id of the index points at the file and row its block (or first table row) starts on,
+#shards are streamed unless they are tables
+@pytest.mark.parametrize('table', [False, True])
+def test_sharded_zip_and_index(table, monkeypatch):
+    streamed = []
+    generate = batch.generate_excel_file
+
+    def record(*args, streaming=False, **kwargs):
+        streamed.append(streaming)
+        return generate(*args, streaming=streaming, **kwargs)
+
+    monkeypatch.setattr(batch, 'generate_excel_file', record)
+    labels = [f'R-{number}' for number in range(1, 8)]
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        data, timings, total = generate_sharded(INSTRUMENT, len(labels), 3, pool=pool, table=table, labels=labels)
+    assert streamed == [not table] * 3
+    filenames = shard_filenames(INSTRUMENT, 3)
+    assert [timing['file'] for timing in timings] == [index_filename(INSTRUMENT)] + filenames
+    assert [timing['samples'] for timing in timings] == [7, 3, 3, 1]
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert sorted(archive.namelist()) == sorted(timing['file'] for timing in timings)
+        index = load_workbook(io.BytesIO(archive.read(index_filename(INSTRUMENT))))['Index']
+        rows = list(index.iter_rows(values_only=True))
+        assert rows[0] == ('Sample ID', 'File', 'Sheet', 'Row')
+        assert [row[:3] for row in rows[1:]] == [(label, filenames[number // 3], 'Analysis')
+                                                 for number, label in enumerate(labels)]
+        shards = {filename: load_workbook(io.BytesIO(archive.read(filename)))['Analysis'] for filename in filenames}
+        for label, filename, _, row in rows[1:]:
+            assert shards[filename].cell(row, 1).value == label
+
+
+def test_index_rows():
+    plan = compile_layout(INSTRUMENT)
+    labels = ['a', 'b', 'c', 'd', 'e']
+    ranges = shard_ranges(len(labels), 2)
+    output = io.BytesIO()
+    write_index(output, plan, labels, ranges, ['one', 'two', 'three'])
+    rows = list(load_workbook(output)['Index'].iter_rows(min_row=2, values_only=True))
+    assert rows == [('a', 'one', 'Analysis', plan.first_row(0) + 1), ('b', 'one', 'Analysis', plan.first_row(1) + 1),
+                    ('c', 'two', 'Analysis', plan.first_row(0) + 1), ('d', 'two', 'Analysis', plan.first_row(1) + 1),
+                    ('e', 'three', 'Analysis', plan.first_row(0) + 1)]
@@ -0,0 +1,61 @@
+import pytest
+
+from template_cache import TemplateCache, cache_key
+
+INSTRUMENT = 'Karl Fischer'
+
+
+def test_miss_then_hit():
+    cache = TemplateCache(cache_dir=None)
+    stats = {}
+    data = cache.get(INSTRUMENT, 2, stats)
+    assert stats['cache'] == 'miss'
+    stats = {}
+    assert cache.get(INSTRUMENT, 2, stats) is data
+    assert stats == {'cache': 'memory'}
+    cache.get(INSTRUMENT, 2, table=True)
+    assert cache.stats() == {'hits': 1, 'disk_hits': 0, 'misses': 2, 'evictions': 0, 'entries': 2,
+                             'bytes': len(data) + len(cache.get(INSTRUMENT, 2, table=True)),
+                             'max_bytes': cache.max_bytes}
+
+
+#the least recently used entries go first once the bytes held pass max_bytes, an entry larger than the
+#whole cache is never held
+def test_lru_eviction_by_bytes():
+    cache = TemplateCache(max_bytes=100, cache_dir=None)
+    cache.put('a', b'a' * 40)
+    cache.put('b', b'b' * 40)
+    cache.put('a', b'a' * 40)
+    cache.put('c', b'c' * 40)
+    assert list(cache.entries) == ['a', 'c']
+    cache.put('d', b'd' * 90)
+    assert list(cache.entries) == ['d']
+    cache.put('e', b'e' * 101)
+    stats = cache.stats()
+    assert list(cache.entries) == ['d'] and stats['bytes'] == 90 and stats['evictions'] == 3
+
+
+def test_get_evicts_least_recently_used():
+    sizes = {num_request: len(TemplateCache(cache_dir=None).get(INSTRUMENT, num_request)) for num_request in (1, 2, 3)}
+    cache = TemplateCache(max_bytes=sizes[1] + sizes[2] + sizes[3] - 1, cache_dir=None)
+    cache.get(INSTRUMENT, 1)
+    cache.get(INSTRUMENT, 2)
+    cache.get(INSTRUMENT, 1)
+    cache.get(INSTRUMENT, 3)
+    assert list(cache.entries) == [cache_key(INSTRUMENT, 1), cache_key(INSTRUMENT, 3)]
+    assert cache.stats()['evictions'] == 1
+
+
+#a workbook no longer held in memory is read back from the directory, by this process or another one
+@pytest.mark.parametrize('max_bytes', [0, 64 * 1024 * 1024])
+def test_disk_tier_reload(tmp_path, max_bytes):
+    data = TemplateCache(max_bytes, cache_dir=str(tmp_path)).get(INSTRUMENT, 2)
+    cache = TemplateCache(max_bytes, cache_dir=str(tmp_path))
+    stats = {}
+    assert cache.get(INSTRUMENT, 2, stats) == data
+    assert stats == {'cache': 'disk'}
+    stats = {}
+    cache.get(INSTRUMENT, 2, stats)
+    assert stats == {'cache': 'disk' if max_bytes == 0 else 'memory'}
+    assert cache.stats()['misses'] == 0
+    assert cache.stats()['disk_hits'] == (2 if max_bytes == 0 else 1)
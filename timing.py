@@ -0,0 +1,54 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger('templates')
+
+#events are written as json lines to stderr, or appended to TEMPLATE_LOG_FILE when it is set,
+#TEMPLATE_LOG_LEVEL=WARNING turns them off
+LOG_LEVEL = os.environ.get('TEMPLATE_LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('TEMPLATE_LOG_FILE')
+
+
+class PhaseTimer:
+    #accumulates wall time per named phase, cheap enough to leave on for every request
+    #phases are kept in the order they were first entered
+
+    def __init__(self, phases=None, start=None):
+        self.phases = {} if phases is None else phases
+        self.start = time.perf_counter() if start is None else start
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def rounded(self):
+        return {name: round(seconds, 4) for name, seconds in self.phases.items()}
+
+
+#called once at the start of every process that logs events (the app, the cli and the batch workers),
+#the root logger is left alone so streamlit's own logging is unchanged
+def configure_logging():
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(LOG_FILE, encoding='utf-8') if LOG_FILE else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+#one json object per line so the logs can be filtered and aggregated without parsing free text
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(event=event, **fields), default=str))